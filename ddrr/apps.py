@@ -2,11 +2,34 @@ import logging
 
 from django.apps import AppConfig
 from django.conf import settings
+from django.core.signals import setting_changed
 
+from ddrr import stats
+from ddrr.cache import render_cache
+from ddrr.capture import SEGMENT_SIZE
+from ddrr.capture import CaptureHandler
+from ddrr.capture import CaptureStore
+from ddrr.collector import forward_to_collector
+from ddrr.exchange import REQUEST_ID_HEADERS
+from ddrr.exchange import request_id_keys
+from ddrr.filters import FilterSet
+from ddrr.formatters import CombinedFormatter
 from ddrr.formatters import DjangoTemplateRequestFormatter
 from ddrr.formatters import DjangoTemplateResponseFormatter
+from ddrr.formatters import JsonLinesCombinedFormatter
+from ddrr.formatters import JsonLinesRequestFormatter
+from ddrr.formatters import JsonLinesResponseFormatter
 from ddrr.loggers import request_logger
 from ddrr.loggers import response_logger
+from ddrr.middleware import options
+from ddrr.pipeline import pipeline
+from ddrr.printers import printers
+from ddrr.redaction import DEFAULT_HEADERS
+from ddrr.redaction import REPLACEMENT
+from ddrr.redaction import redactor
+from ddrr.sampling import Triggers
+from ddrr.sampling import sampler
+from ddrr.utils import PRETTY_PRINT_MAX_SIZE
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +53,17 @@ class DDRRConfig(AppConfig):
         enable_responses = s("ENABLE_RESPONSES", True)
         level = s("LEVEL", "DEBUG")
         pretty = s("PRETTY_PRINT", False)
+        pretty_max_size = s("PRETTY_PRINT_MAX_SIZE", PRETTY_PRINT_MAX_SIZE)
+        pretty_printers = s("PRETTY_PRINTERS", None)
+        render_cache_size = s("RENDER_CACHE_SIZE", 0)
+        redact_headers = s("REDACT_HEADERS", DEFAULT_HEADERS)
+        redact_json_keys = s("REDACT_JSON_KEYS", ())
+        redact_form_fields = s("REDACT_FORM_FIELDS", ())
+        redact_patterns = s("REDACT_PATTERNS", ())
+        redact_replacement = s("REDACT_REPLACEMENT", REPLACEMENT)
+        output_format = s("FORMAT", "template")
+        request_fields = s("REQUEST_FIELDS", None)
+        response_fields = s("RESPONSE_FIELDS", None)
         request_template_name = s(
             "REQUEST_TEMPLATE_NAME", "ddrr/default-request.html"
         )
@@ -43,51 +77,212 @@ class DDRRConfig(AppConfig):
         colors = s("ENABLE_COLORS", True)
         limit_body = s("LIMIT_BODY", None)
         disable_django_server_log = s("DISABLE_DJANGO_SERVER_LOG", False)
+        template_autoreload = s("TEMPLATE_AUTORELOAD", False)
+        async_pipeline = s("ASYNC_PIPELINE", False)
+        async_pipeline_queue_size = s("ASYNC_PIPELINE_QUEUE_SIZE", 1000)
+        async_pipeline_overflow = s("ASYNC_PIPELINE_OVERFLOW", "drop-new")
+        capture_body_bytes = s("CAPTURE_BODY_BYTES", 65536)
+        capture_streaming = s("CAPTURE_STREAMING", False)
+        capture_request_stream = s("CAPTURE_REQUEST_STREAM", False)
+        combined = s("COMBINED", False)
+        capture_dir = s("CAPTURE_DIR", None)
+        capture_segment_size = s("CAPTURE_SEGMENT_SIZE", SEGMENT_SIZE)
+        collector_address = s("COLLECTOR_ADDRESS", None)
+        request_id_headers = s("REQUEST_ID_HEADERS", REQUEST_ID_HEADERS)
+        instrument = s("INSTRUMENT", False)
+        include_paths = s("INCLUDE_PATHS", ())
+        exclude_paths = s("EXCLUDE_PATHS", ())
+        include_methods = s("INCLUDE_METHODS", ())
+        exclude_methods = s("EXCLUDE_METHODS", ())
+        include_status_codes = s("INCLUDE_STATUS_CODES", ())
+        exclude_status_codes = s("EXCLUDE_STATUS_CODES", ())
+        trigger_duration_ms = s("TRIGGER_DURATION_MS", None)
+        trigger_status_codes = s("TRIGGER_STATUS_CODES", ())
+        trigger_on_exception = s("TRIGGER_ON_EXCEPTION", False)
+        exception_locals_size = s("EXCEPTION_LOCALS_SIZE", None)
+        sample_rate = s("SAMPLE_RATE", 1.0)
+        sample_by_request_id = s("SAMPLE_BY_REQUEST_ID", False)
+        path_rate_limits = s("PATH_RATE_LIMITS", None)
+        status_rate_limits = s("STATUS_RATE_LIMITS", None)
 
         # set up request logger and handler
         request_handler.setLevel(level)
         request_logger.setLevel(level)
         request_logger.addHandler(request_handler)
         if not enable_requests:
-            request_logger.disabled = False
+            request_logger.disabled = True
 
         # set up response logger and handler
         response_handler.setLevel(level)
         response_logger.setLevel(level)
         response_logger.addHandler(response_handler)
         if not enable_responses:
-            response_logger.disabled = False
+            response_logger.disabled = True
 
-        # set up request formatter
-        request_formatter_kwargs = {
-            "pretty": pretty,
-            "colors": colors,
-            "limit_body": limit_body,
-        }
-        if request_template:
-            request_formatter_kwargs["template"] = request_template
-        else:
-            request_formatter_kwargs["template_name"] = request_template_name
-        request_formatter = DjangoTemplateRequestFormatter(
-            **request_formatter_kwargs
+        # set up redaction, pretty-printers and the cache of their output
+        redactor.configure(
+            headers=redact_headers,
+            json_keys=redact_json_keys,
+            form_fields=redact_form_fields,
+            patterns=redact_patterns,
+            replacement=redact_replacement,
         )
-        request_handler.setFormatter(request_formatter)
+        printers.configure(pretty_printers)
+        render_cache.configure(render_cache_size)
 
-        # set up response formatter
-        response_formatter_kwargs = {
+        # set up request and response formatters
+        formatter_kwargs = {
+            "output_format": output_format,
             "pretty": pretty,
+            "pretty_max_size": pretty_max_size,
             "colors": colors,
             "limit_body": limit_body,
+            "autoreload": template_autoreload,
         }
-        if response_template:
-            response_formatter_kwargs["template"] = response_template
-        else:
-            response_formatter_kwargs["template_name"] = response_template_name
-        response_formatter = DjangoTemplateResponseFormatter(
-            **response_formatter_kwargs
+        request_formatter = make_formatter(
+            DjangoTemplateRequestFormatter,
+            JsonLinesRequestFormatter,
+            template=request_template,
+            template_name=request_template_name,
+            fields=request_fields,
+            **formatter_kwargs,
+        )
+        request_handler.setFormatter(request_formatter)
+        response_formatter = make_formatter(
+            DjangoTemplateResponseFormatter,
+            JsonLinesResponseFormatter,
+            template=response_template,
+            template_name=response_template_name,
+            fields=response_fields,
+            **formatter_kwargs,
         )
+        if combined:
+            combined_formatter_class = (
+                JsonLinesCombinedFormatter
+                if output_format == "jsonl"
+                else CombinedFormatter
+            )
+            response_formatter = combined_formatter_class(
+                request_formatter, response_formatter
+            )
         response_handler.setFormatter(response_formatter)
 
+        # set up the capture store and the collector
+        set_up_capture_and_collector(
+            capture_dir=capture_dir,
+            capture_segment_size=capture_segment_size,
+            capture_body_bytes=capture_body_bytes,
+            collector_address=collector_address,
+            level=level,
+        )
+
+        # set up the middleware
+        options.capture_streaming = capture_streaming
+        options.capture_request_stream = capture_request_stream
+        options.capture_body_bytes = capture_body_bytes
+        options.combined = combined
+        options.capture_exchanges = bool(capture_dir)
+        options.request_id_keys = request_id_keys(request_id_headers)
+        options.filters = FilterSet(
+            include_paths=include_paths,
+            exclude_paths=exclude_paths,
+            include_methods=include_methods,
+            exclude_methods=exclude_methods,
+            include_status_codes=include_status_codes,
+            exclude_status_codes=exclude_status_codes,
+        )
+        options.exception_locals_size = exception_locals_size
+        options.triggers = Triggers(
+            duration_ms=trigger_duration_ms,
+            status_codes=trigger_status_codes,
+            exceptions=trigger_on_exception,
+        )
+        options.refresh()
+        setting_changed.connect(refresh_options)
+
+        # set up instrumentation
+        stats.enable(instrument)
+
+        # set up sampling and rate limiting
+        sampler.configure(
+            rate=sample_rate,
+            by_request_id=sample_by_request_id,
+            request_id_headers=request_id_headers,
+            path_rate_limits=path_rate_limits,
+            status_rate_limits=status_rate_limits,
+        )
+
+        # set up the background logging pipeline
+        if async_pipeline:
+            pipeline.configure(
+                maxsize=async_pipeline_queue_size,
+                overflow=async_pipeline_overflow,
+                max_body=capture_body_bytes,
+            )
+            pipeline.start()
+
         # disable django server log
         if disable_django_server_log:
             logging.getLogger("django.server").disabled = True
+
+
+def set_up_capture_and_collector(
+    *,
+    capture_dir,
+    capture_segment_size,
+    capture_body_bytes,
+    collector_address,
+    level,
+):
+    if capture_dir:
+        store = CaptureStore(capture_dir, segment_size=capture_segment_size)
+        response_logger.addHandler(
+            CaptureHandler(store, max_body=capture_body_bytes)
+        )
+    # forward records to a collector process, which puts back the handlers
+    # set up so far to write them
+    if collector_address:
+        forward_to_collector(
+            collector_address, max_body=capture_body_bytes, level=level
+        )
+
+
+def refresh_options(setting, **kwargs):
+    if setting in ("DDRR", "LOGGING"):
+        options.refresh()
+
+
+def make_formatter(
+    template_formatter_class,
+    jsonl_formatter_class,
+    *,
+    output_format,
+    template,
+    template_name,
+    fields,
+    pretty,
+    pretty_max_size,
+    colors,
+    limit_body,
+    autoreload,
+):
+    if output_format == "jsonl":
+        return jsonl_formatter_class(
+            fields=fields,
+            pretty=pretty,
+            pretty_max_size=pretty_max_size,
+            limit_body=limit_body,
+        )
+    template_kwargs = (
+        {"template": template}
+        if template
+        else {"template_name": template_name}
+    )
+    return template_formatter_class(
+        pretty=pretty,
+        pretty_max_size=pretty_max_size,
+        colors=colors,
+        limit_body=limit_body,
+        autoreload=autoreload,
+        **template_kwargs,
+    )
@@ -0,0 +1,108 @@
+"""
+Cache of rendered bodies, so that bodies which are logged again and again,
+like those of health checks or cached API responses, are only decoded and
+pretty-printed once.
+"""
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+# bodies larger than this are not cached, as hashing them could cost more
+# than rendering them shortened
+MAX_BODY_SIZE = 65536
+
+
+class RenderCache:
+    def __init__(self, max_size=0):
+        """
+        Least recently used cache of rendered bodies, bounded by the total
+        size in bytes of the rendered bodies.
+
+        Rendered bodies are keyed by a hash of the raw body and the options
+        it was rendered with.  The cache is disabled when `max_size` is 0.
+
+        >>> cache = RenderCache(max_size=1024)
+        >>> cache.get_or_render(b"foo", ("text/plain",), lambda: "foo")
+        'foo'
+        >>> cache.get_or_render(b"foo", ("text/plain",), lambda: "bar")
+        'foo'
+        >>> cache.info()["hits"], cache.info()["misses"]
+        (1, 1)
+
+        :param max_size: Maximum total size of the rendered bodies in bytes
+        """
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.configure(max_size)
+
+    def configure(self, max_size=0):
+        """
+        Resize the cache, forgetting every rendered body and the statistics.
+
+        :param max_size: Maximum total size of the rendered bodies in bytes
+        """
+        with self._lock:
+            self.max_size = max_size
+            self._entries.clear()
+            self._size = 0
+            self._hits = 0
+            self._misses = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def get_or_render(self, raw, options, render):
+        """
+        Return the cached rendering of a body, or render and cache it.
+
+        :param raw: Body as bytes
+        :param options: Hashable options the body is rendered with
+        :param render: Callable taking no arguments which renders the body
+        :return: Rendered body
+        """
+        if not self.enabled or len(raw) > MAX_BODY_SIZE:
+            return render()
+        key = (hashlib.blake2b(raw, digest_size=16).digest(), options)
+        with self._lock:
+            content = self._entries.get(key)
+            if content is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return content
+            self._misses += 1
+        content = render()
+        self._put(key, content)
+        return content
+
+    def _put(self, key, content):
+        size = sys.getsizeof(content)
+        if size > self.max_size:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = content
+            self._size += size
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= sys.getsizeof(evicted)
+
+    def info(self):
+        """
+        Return the hits, misses, number of entries and size of the cache.
+
+        :return: Dictionary
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "entries": len(self._entries),
+                "size": self._size,
+                "max_size": self.max_size,
+            }
+
+
+render_cache = RenderCache()
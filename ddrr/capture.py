@@ -0,0 +1,383 @@
+"""
+Local store of captured request/response exchanges, for querying and
+replaying them later.
+
+Exchanges are appended as JSON lines to segment files, with their bodies
+compressed and stored once per distinct content.  A SQLite index of the
+timestamp, method, path, status code and duration of each exchange, along
+with where to find it, answers queries without reading the segments.
+
+Several processes, like the workers of a pre-fork server, can append to the
+same store: they take turns writing to the segments with a lock file, on
+platforms which have `fcntl`, and SQLite handles concurrent writes to the
+index.  When `ddrr.pipeline.pipeline` is running, the response logger's
+handlers, and so `CaptureHandler`, run on its background thread rather
+than on request threads.
+"""
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+
+from ddrr.redaction import redactor
+from ddrr.snapshots import RequestSnapshot
+from ddrr.snapshots import ResponseSnapshot
+from ddrr.utils import status_range
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# size in bytes at which a new segment file is started
+SEGMENT_SIZE = 64 * 1024 * 1024
+
+INDEX_FILENAME = "index.sqlite3"
+
+LOCK_FILENAME = "segments.lock"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exchanges (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    request_id TEXT,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    status_code INTEGER NOT NULL,
+    duration_ms REAL,
+    segment TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS exchanges_timestamp ON exchanges (timestamp);
+CREATE INDEX IF NOT EXISTS exchanges_path ON exchanges (path);
+CREATE INDEX IF NOT EXISTS exchanges_method ON exchanges (method);
+CREATE INDEX IF NOT EXISTS exchanges_status_code ON exchanges (status_code);
+CREATE INDEX IF NOT EXISTS exchanges_duration_ms ON exchanges (duration_ms);
+CREATE TABLE IF NOT EXISTS bodies (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+"""
+
+
+def body_hash(body):
+    """
+    Return the hash which identifies a body in a capture store.
+
+    >>> body_hash(b"foo")
+    '04136e24f85d470465c3db66e58ed56c'
+
+    :param body: Body as bytes
+    :return: Hexadecimal digest
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class CaptureStore:
+    def __init__(self, directory, *, segment_size=SEGMENT_SIZE):
+        """
+        Capture store in a directory, which is created if needed.
+
+        :param directory: Path of the directory
+        :param segment_size: Size in bytes at which a new segment is started
+        """
+        self.directory = os.path.abspath(directory)
+        self.segment_size = segment_size
+        self._lock = threading.Lock()
+        self._db = None
+        self._segment = None
+        self._lock_file = None
+        # process which opened the index and the lock file
+        self._pid = None
+
+    def append(self, request, response):
+        """
+        Append an exchange to the store, with secrets redacted by
+        `ddrr.redaction.redactor`.
+
+        :param request: Request snapshot
+        :param response: Response snapshot
+        :return: ID of the exchange
+        """
+        exchange = response.ddrr_exchange or request.ddrr_exchange
+        request_body = redactor.redact_bytes(request.body)
+        response_body = response.content
+        if response_body is None and response.ddrr_stream is not None:
+            response_body = response.ddrr_stream.content
+        response_body = redactor.redact_bytes(response_body)
+        data = {
+            "timestamp": exchange.started if exchange else request.timestamp,
+            "request_id": exchange and exchange.request_id,
+            "duration_ms": exchange and exchange.duration_ms,
+            "request": {
+                "method": request.method,
+                "path": request.path,
+                "query_string": redactor.redact(request.GET.urlencode()),
+                "headers": list(
+                    redactor.redact_headers(request.headers).items()
+                ),
+                "body": body_hash(request_body) if request_body else None,
+                "body_size": request.body_size,
+            },
+            "response": {
+                "status_code": response.status_code,
+                "reason_phrase": response.reason_phrase,
+                "headers": [
+                    (name, redactor.redact_header(name, value))
+                    for name, value in response.headers
+                ],
+                "body": body_hash(response_body) if response_body else None,
+                "body_size": response.content_size,
+            },
+        }
+        line = (json.dumps(data, separators=(",", ":")) + "\n").encode()
+        with self._lock:
+            db = self._connect()
+            segment, offset = self._write_segment(line)
+            for body in (request_body, response_body):
+                if body:
+                    db.execute(
+                        "INSERT OR IGNORE INTO bodies (hash, data) "
+                        "VALUES (?, ?)",
+                        (body_hash(body), zlib.compress(body)),
+                    )
+            cursor = db.execute(
+                "INSERT INTO exchanges (timestamp, request_id, method, path, "
+                "status_code, duration_ms, segment, offset, length) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    data["timestamp"],
+                    data["request_id"],
+                    request.method,
+                    request.path,
+                    response.status_code,
+                    data["duration_ms"],
+                    segment,
+                    offset,
+                    len(line),
+                ),
+            )
+            db.commit()
+            return cursor.lastrowid
+
+    def query(
+        self,
+        *,
+        path=None,
+        method=None,
+        status=None,
+        since=None,
+        until=None,
+        min_duration=None,
+        slowest=None,
+        limit=None,
+    ):
+        """
+        Return the index entries of the exchanges matching all of the given
+        criteria, the most recent first, or the slowest first with
+        `slowest`.
+
+        :param path: Path prefix
+        :param method: Request method
+        :param status: Status code, or status class like "5xx"
+        :param since: Earliest timestamp
+        :param until: Latest timestamp
+        :param min_duration: Minimum duration in milliseconds
+        :param slowest: Return the given number of slowest exchanges
+        :param limit: Maximum number of exchanges to return
+        :return: List of dictionaries
+        """
+        where = []
+        params = []
+        if path:
+            # a range rather than LIKE, so that the index is used
+            where.append("path >= ? AND path < ?")
+            params += [path, path[:-1] + chr(ord(path[-1]) + 1)]
+        if method:
+            where.append("method = ?")
+            params.append(method.upper())
+        if status is not None:
+            where.append("status_code BETWEEN ? AND ?")
+            params += status_range(status)
+        if since is not None:
+            where.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("timestamp <= ?")
+            params.append(until)
+        if min_duration is not None:
+            where.append("duration_ms >= ?")
+            params.append(min_duration)
+        sql = "SELECT * FROM exchanges"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if slowest:
+            sql += " ORDER BY duration_ms DESC"
+            limit = min(limit or slowest, slowest)
+        else:
+            sql += " ORDER BY timestamp DESC, id DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def load(self, entry):
+        """
+        Return an exchange as it was appended, given its index entry.
+
+        The "body" of the request and the response are replaced with the
+        bodies themselves, as bytes, or None if they were empty.
+
+        :param entry: Index entry, as returned by `query`
+        :return: Dictionary
+        """
+        path = os.path.join(self.directory, entry["segment"])
+        with open(path, "rb") as f:
+            f.seek(entry["offset"])
+            data = json.loads(f.read(entry["length"]))
+        data["id"] = entry["id"]
+        for message in (data["request"], data["response"]):
+            message["body"] = self.read_body(message["body"])
+        return data
+
+    def read_body(self, digest):
+        """
+        Return the body with a hash, or None.
+
+        :param digest: Body hash, or None
+        :return: Body as bytes, or None
+        """
+        if digest is None:
+            return None
+        with self._lock:
+            row = (
+                self._connect()
+                .execute("SELECT data FROM bodies WHERE hash = ?", (digest,))
+                .fetchone()
+            )
+        return zlib.decompress(row["data"]) if row else None
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    def _connect(self):
+        if self._pid != os.getpid():
+            # SQLite connections and flock() locks of open files are shared
+            # with forked processes, which open their own
+            self._pid = os.getpid()
+            self._db = None
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+        if self._db is None:
+            os.makedirs(self.directory, exist_ok=True)
+            db = sqlite3.connect(
+                os.path.join(self.directory, INDEX_FILENAME),
+                check_same_thread=False,
+            )
+            db.row_factory = sqlite3.Row
+            # cheap commits, as every exchange is committed on its own
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    def _write_segment(self, line):
+        # return the segment name and offset at which the line was written.
+        # the offset is taken from the file while holding the lock, as
+        # other processes may have appended to it or started newer segments
+        with self._segments_locked():
+            if self._segment is None:
+                self._segment = self._last_segment()
+            while True:
+                path = os.path.join(self.directory, self._segment)
+                with open(path, "ab") as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    if not offset or offset + len(line) <= self.segment_size:
+                        f.write(line)
+                        return self._segment, offset
+                self._segment = _segment_name(
+                    _segment_number(self._segment) + 1
+                )
+
+    @contextlib.contextmanager
+    def _segments_locked(self):
+        if fcntl is None:
+            yield
+            return
+        if self._lock_file is None:
+            self._lock_file = open(
+                os.path.join(self.directory, LOCK_FILENAME), "ab"
+            )
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _last_segment(self):
+        numbers = [
+            _segment_number(name)
+            for name in os.listdir(self.directory)
+            if name.startswith("segment-") and name.endswith(".jsonl")
+        ]
+        return _segment_name(max(numbers, default=1))
+
+
+def _segment_name(number):
+    return f"segment-{number:06d}.jsonl"
+
+
+def _segment_number(name):
+    return int(name.partition("-")[2].partition(".")[0])
+
+
+class CaptureHandler(logging.Handler):
+    def __init__(self, store, *, max_body=None, level=logging.DEBUG):
+        """
+        Log handler which appends each exchange to a capture store.
+
+        It handles the records of the response logger, whose `ddrr_request`
+        attribute holds the request when
+        `ddrr.middleware.options.capture_exchanges` is set.  Records without
+        a request are ignored.
+
+        :param store: Capture store
+        :param max_body: Maximum number of body bytes to keep
+        :param level: Log level
+        """
+        super().__init__(level)
+        self.store = store
+        self.max_body = max_body
+
+    def emit(self, record):
+        request = getattr(record, "ddrr_request", None)
+        if request is None:
+            return
+        try:
+            if not isinstance(request, RequestSnapshot):
+                request = RequestSnapshot.capture(request, self.max_body)
+            response = record.msg
+            if not isinstance(response, ResponseSnapshot):
+                response = ResponseSnapshot.capture(response, self.max_body)
+            self.store.append(request, response)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.store.close()
+        super().close()
@@ -0,0 +1,197 @@
+"""
+Collection of the records of the worker processes of pre-fork servers, like
+gunicorn and uWSGI, in a single process.
+
+Workers forward snapshots of their records over a Unix socket to a collector
+process, which formats and writes them with the handlers configured in the
+DDRR settings.  Records of different workers are written one at a time, so
+they are never interleaved, and formatting them no longer costs the workers
+anything.
+"""
+import logging
+import logging.handlers
+import os
+import pickle
+import socketserver
+import struct
+import threading
+
+from django.http import HttpRequest
+from django.http.response import HttpResponseBase
+
+from ddrr.loggers import request_logger
+from ddrr.loggers import response_logger
+from ddrr.snapshots import RequestSnapshot
+from ddrr.snapshots import ResponseSnapshot
+
+# each record is sent as a pickled dictionary of its attributes, prefixed
+# with its length, like `logging.handlers.SocketHandler` does
+HEADER = struct.Struct(">L")
+
+LOGGERS = (request_logger, response_logger)
+
+# handlers of the DDRR loggers while their records are forwarded
+_local_handlers = {}
+
+_exception_formatter = logging.Formatter()
+
+
+def snapshot(msg, max_body=None):
+    """
+    Return a snapshot of a request or response, which can be pickled.
+
+    :param msg: Request or response object, or a snapshot of one
+    :param max_body: Maximum number of body bytes to keep
+    :return: Snapshot, or `msg` itself if it is neither
+    """
+    if isinstance(msg, HttpRequest):
+        return RequestSnapshot.capture(msg, max_body)
+    if isinstance(msg, HttpResponseBase):
+        return ResponseSnapshot.capture(msg, max_body)
+    return msg
+
+
+class CollectorHandler(logging.handlers.SocketHandler):
+    def __init__(self, address, *, max_body=None, level=logging.DEBUG):
+        """
+        Log handler which forwards records to a collector over a Unix socket.
+
+        Requests and responses are replaced with snapshots, which are
+        pickled along with the other attributes of the record.  Like with
+        `logging.handlers.SocketHandler`, records are dropped while the
+        collector can't be reached, and reconnecting is retried with an
+        exponential backoff.  Each process connects on its own, so the
+        handler can be created before workers are forked.
+
+        :param address: Path of the collector's socket
+        :param max_body: Maximum number of body bytes to forward
+        :param level: Log level
+        """
+        super().__init__(address, None)
+        self.setLevel(level)
+        self.max_body = max_body
+        self._pid = os.getpid()
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            # the connection of the parent process isn't shared with it
+            self._pid = os.getpid()
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
+            self.retryTime = None
+        super().emit(record)
+
+    def makePickle(self, record):
+        data = dict(record.__dict__)
+        data["msg"] = snapshot(record.msg, self.max_body)
+        if data.get("ddrr_request") is not None:
+            data["ddrr_request"] = snapshot(
+                data["ddrr_request"], self.max_body
+            )
+        if record.exc_info and not record.exc_text:
+            data["exc_text"] = _exception_formatter.formatException(
+                record.exc_info
+            )
+        data["args"] = None
+        data["exc_info"] = None
+        data.pop("message", None)
+        payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+        return HEADER.pack(len(payload)) + payload
+
+
+class _RecordStreamHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            header = self.rfile.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            (length,) = HEADER.unpack(header)
+            payload = self.rfile.read(length)
+            if len(payload) < length:
+                return
+            record = logging.makeLogRecord(pickle.loads(payload))
+            self.server.handle_record(record)
+
+
+class Collector(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, address):
+        """
+        Server which receives records from `CollectorHandler` and handles
+        them with the loggers they were logged with in the workers.
+
+        Handlers are locked while they emit a record, so each record is
+        written whole, whichever worker it came from.  The socket is only
+        accessible to the user running the collector, as records are
+        unpickled, and a stale socket left by a previous collector is
+        replaced.
+
+        :param address: Path of the socket
+        """
+        self.address = address
+        if os.path.exists(address):
+            os.unlink(address)
+        super().__init__(address, _RecordStreamHandler)
+        self._thread = None
+
+    def server_bind(self):
+        super().server_bind()
+        os.chmod(self.address, 0o600)
+
+    def handle_record(self, record):
+        logging.getLogger(record.name).handle(record)
+
+    def start(self):
+        """
+        Serve on a background thread.
+        """
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="ddrr-collector", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop serving, and remove the socket.
+        """
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+
+
+def forward_to_collector(address, *, max_body=None, level=logging.DEBUG):
+    """
+    Replace the handlers of the DDRR loggers with a `CollectorHandler`,
+    keeping them for `restore_local_handlers`.
+
+    :param address: Path of the collector's socket
+    :param max_body: Maximum number of body bytes to forward
+    :param level: Log level
+    :return: The handler
+    """
+    handler = CollectorHandler(address, max_body=max_body, level=level)
+    for logger in LOGGERS:
+        _local_handlers.setdefault(logger, logger.handlers[:])
+        logger.handlers = [handler]
+    return handler
+
+
+def restore_local_handlers():
+    """
+    Put back the handlers replaced by `forward_to_collector`, as the
+    collector process does.
+    """
+    for logger, handlers in _local_handlers.items():
+        for handler in logger.handlers:
+            handler.close()
+        logger.handlers = handlers
+    _local_handlers.clear()
@@ -0,0 +1,120 @@
+"""
+Capture of exceptions raised by views, for logging with their response.
+
+Capturing an exception only keeps a reference to it.  Its traceback is
+formatted when a record is formatted, so exceptions whose records are
+dropped cost nothing more.  The local variables of the innermost frames can
+be captured too, as their size-limited representations, which must be taken
+right away, as the variables may change afterwards.
+"""
+import reprlib
+import traceback
+
+from django.utils.functional import cached_property
+
+from ddrr.redaction import redactor
+
+# number of innermost frames whose local variables are captured
+LOCALS_FRAMES = 10
+
+
+class ExceptionCapture:
+    def __init__(self, exception, *, locals_size=None):
+        """
+        Exception raised by a view.
+
+        >>> try:
+        ...     foo = "bar"
+        ...     raise ValueError("baz")
+        ... except ValueError as e:
+        ...     capture = ExceptionCapture(e, locals_size=10)
+        >>> capture.type, capture.message
+        ('ValueError', 'baz')
+        >>> capture.traceback.splitlines()[-1]
+        'ValueError: baz'
+        >>> capture.locals[-1]["locals"]["foo"]
+        "'bar'"
+
+        :param exception: Exception object
+        :param locals_size: Maximum length of the representation of each
+            local variable, or None not to capture them
+        """
+        self.exception = exception
+        self.type = type(exception).__qualname__
+        self.locals = (
+            capture_locals(exception.__traceback__, locals_size)
+            if locals_size
+            else None
+        )
+
+    @cached_property
+    def message(self):
+        return str(self.exception)
+
+    @cached_property
+    def traceback(self):
+        exception = self.exception
+        return "".join(
+            traceback.format_exception(
+                type(exception), exception, exception.__traceback__
+            )
+        ).rstrip("\n")
+
+    def as_dict(self):
+        return {
+            "type": self.type,
+            "message": self.message,
+            "traceback": self.traceback,
+            "locals": self.locals,
+        }
+
+    def __getstate__(self):
+        # the traceback is formatted when the capture is pickled, e.g. to
+        # send it to `ddrr.collector`, as its frames can't be pickled
+        state = self.__dict__.copy()
+        state.update(message=self.message, traceback=self.traceback)
+        state["exception"] = None
+        return state
+
+
+def capture_locals(tb, size):
+    """
+    Return the size-limited representations of the local variables of the
+    innermost frames of a traceback.
+
+    :param tb: Traceback object
+    :param size: Maximum length of each representation
+    :return: List of dictionaries of the "file", "line", "function" and
+        "locals" of each frame, the innermost last
+    """
+    frames = []
+    while tb is not None:
+        frames.append(tb)
+        tb = tb.tb_next
+    limited = reprlib.Repr()
+    limited.maxstring = limited.maxother = limited.maxlong = size
+    captured = []
+    for tb in frames[-LOCALS_FRAMES:]:
+        code = tb.tb_frame.f_code
+        captured.append(
+            {
+                "file": code.co_filename,
+                "line": tb.tb_lineno,
+                "function": code.co_name,
+                "locals": {
+                    name: _limited_repr(limited, value, size)
+                    for name, value in tb.tb_frame.f_locals.items()
+                },
+            }
+        )
+    return captured
+
+
+def _limited_repr(limited, value, size):
+    try:
+        text = limited.repr(value)
+    except Exception:
+        text = f"<{type(value).__qualname__} object>"
+    if len(text) > size:
+        text = text[: size - 3] + "..."
+    return redactor.redact(text)
@@ -0,0 +1,105 @@
+import time
+import uuid
+
+import attr
+
+from ddrr.headers import header_to_meta
+
+REQUEST_ID_HEADERS = ("X-Request-ID", "X-Correlation-ID")
+
+
+@attr.s(slots=True)
+class Exchange:
+    """
+    A request/response exchange as seen by the middleware.
+
+    The exchange is stored as `ddrr_exchange` on both the request and the
+    response, and is used to correlate their log records.
+    """
+
+    request_id = attr.ib()
+    started = attr.ib(factory=time.time)
+    duration = attr.ib(default=None)
+    cpu_time = attr.ib(default=None)
+    # message to log for the request in combined mode
+    request_msg = attr.ib(default=None, repr=False)
+    # with triggers, the snapshot of the request held until the response
+    # shows whether the exchange is logged, and whether it is
+    held_request_msg = attr.ib(default=None, repr=False)
+    triggered = attr.ib(default=None)
+    # exception raised by the view, if any, see ddrr.exceptions
+    exception = attr.ib(default=None, repr=False)
+    _start = attr.ib(factory=time.perf_counter, repr=False)
+    _cpu_start = attr.ib(default=None, repr=False)
+
+    @classmethod
+    def begin(cls, request, request_id_keys, measure_cpu=True):
+        """
+        Start timing an exchange and attach it to the request.
+
+        The request ID is taken from the first of the `request_id_keys` META
+        keys present in the request, or generated.
+
+        :param request: Request object
+        :param request_id_keys: META keys which may hold a request ID
+        :param measure_cpu: Whether to measure CPU time of the current thread
+        :return: Exchange
+        """
+        request_id = None
+        for key in request_id_keys:
+            request_id = request.META.get(key)
+            if request_id:
+                break
+        exchange = cls(
+            request_id=request_id or uuid.uuid4().hex,
+            cpu_start=time.thread_time() if measure_cpu else None,
+        )
+        request.ddrr_exchange = exchange
+        return exchange
+
+    def start(self):
+        """
+        Restart timing the exchange, right before the response is produced,
+        so that logging the request isn't timed with it.
+        """
+        self._start = time.perf_counter()
+        if self._cpu_start is not None:
+            self._cpu_start = time.thread_time()
+
+    def finish(self, response):
+        """
+        Stop timing the exchange and attach it to the response.
+
+        :param response: Response object
+        """
+        self.duration = time.perf_counter() - self._start
+        if self._cpu_start is not None:
+            self.cpu_time = time.thread_time() - self._cpu_start
+        response.ddrr_exchange = self
+
+    def copy(self):
+        """
+        Return a copy of the exchange as it is now, for snapshots.
+        """
+        return attr.evolve(self, request_msg=None, held_request_msg=None)
+
+    @property
+    def duration_ms(self):
+        return None if self.duration is None else self.duration * 1000
+
+    @property
+    def cpu_time_ms(self):
+        return None if self.cpu_time is None else self.cpu_time * 1000
+
+
+def request_id_keys(headers=REQUEST_ID_HEADERS):
+    """
+    Return the META keys of request ID headers.
+
+    >>> request_id_keys()
+    ('HTTP_X_REQUEST_ID', 'HTTP_X_CORRELATION_ID')
+
+    :param headers: Header names
+    :return: Tuple of META keys
+    """
+    return tuple(header_to_meta(header) for header in headers)
@@ -1,6 +1,13 @@
 import logging
 import re
 
+from ddrr.redaction import mergeable
+from ddrr.utils import status_range
+
+# characters which make a path pattern a regular expression rather than a
+# literal prefix
+REGEX_METACHARACTERS = frozenset(".^$*+?{}[]|()\\")
+
 
 class GenericAttributeFilter(logging.Filter):
     def __init__(self, name="", field="", regex=""):
@@ -52,12 +59,12 @@ class StatusCodeFilter(GenericAttributeFilter):
         self.status_codes = (
             len(status_codes) and list(map(int, status_codes.split(","))) or []
         )
+        self._status_codes = frozenset(self.status_codes)
         super().__init__(name)
 
     def filter(self, record):
-        return not (
-            hasattr(record.msg, "status_code")
-            and record.msg.status_code in self.status_codes
+        return (
+            getattr(record.msg, "status_code", None) not in self._status_codes
         )
 
 
@@ -72,3 +79,206 @@ class PathFilter(GenericAttributeFilter):
 
     def __init__(self, **kwargs):
         super().__init__(field="path", **kwargs)
+
+
+class _Probe:
+    __slots__ = ("msg",)
+
+    def __init__(self, msg):
+        self.msg = msg
+
+
+def attribute_filters(filterer):
+    """
+    Return the filters of a logger or handler which only look at attributes
+    of the log message, and so can be applied before any record exists.
+
+    :param filterer: Logger or handler
+    :return: Tuple of filters
+    """
+    return tuple(
+        f for f in filterer.filters if isinstance(f, GenericAttributeFilter)
+    )
+
+
+def passes(filters, msg):
+    """
+    Return whether a record of `msg` would pass all of `filters`.
+
+    >>> passes((StatusCodeFilter(status_codes="404"),), object())
+    True
+
+    :param filters: Attribute filters, see `attribute_filters`
+    :param msg: Log message, i.e. a request or response
+    :return: True if none of the filters reject the message
+    """
+    probe = _Probe(msg)
+    return all(f.filter(probe) for f in filters)
+
+
+class PathMatcher:
+    def __init__(self, patterns):
+        """
+        Match paths against many patterns at once.
+
+        Patterns are regular expressions matched at the start of the path,
+        like `PathFilter` does.  Those without special characters are
+        compared as plain prefixes, and the others are merged into a single
+        regular expression, except those with inline global flags, named
+        groups or backreferences, whose meaning depends on the whole
+        expression, which are matched separately.
+
+        >>> matcher = PathMatcher(["/static/", "/media/", r"/api/v\\d+/health"])
+        >>> matcher.prefixes, matcher.regex
+        (('/static/', '/media/'), re.compile('(?:/api/v\\\\d+/health)'))
+        >>> matcher.match("/media/foo.png"), matcher.match("/api/v2/health")
+        (True, True)
+        >>> matcher.match("/api/v2/users")
+        False
+        >>> PathMatcher(["/api/", "(?i)/admin/"]).match("/ADMIN/")
+        True
+
+        :param patterns: Regular expressions
+        """
+        prefixes = []
+        merged = []
+        separate = []
+        for pattern in patterns:
+            if REGEX_METACHARACTERS.isdisjoint(pattern):
+                prefixes.append(pattern)
+                continue
+            regex = re.compile(pattern)
+            if mergeable(regex):
+                merged.append(f"(?:{pattern})")
+            else:
+                separate.append(regex)
+        self.prefixes = tuple(prefixes)
+        self.regex = re.compile("|".join(merged)) if merged else None
+        self.regexes = tuple(separate)
+
+    def __bool__(self):
+        return (
+            bool(self.prefixes) or self.regex is not None or bool(self.regexes)
+        )
+
+    def match(self, path):
+        if path.startswith(self.prefixes):
+            return True
+        if self.regex is not None and self.regex.match(path) is not None:
+            return True
+        return any(regex.match(path) is not None for regex in self.regexes)
+
+
+def status_codes(statuses):
+    """
+    Return the set of status codes matching status codes or classes.
+
+    >>> sorted(status_codes([404, "401"])), len(status_codes(["5xx"]))
+    ([401, 404], 100)
+
+    :param statuses: Status codes, or status classes like "5xx"
+    :return: Frozen set of status codes
+    """
+    codes = set()
+    for status in statuses:
+        low, high = status_range(status)
+        codes.update(range(low, high + 1))
+    return frozenset(codes)
+
+
+class FilterSet:
+    def __init__(
+        self,
+        *,
+        include_paths=(),
+        exclude_paths=(),
+        include_methods=(),
+        exclude_methods=(),
+        include_status_codes=(),
+        exclude_status_codes=(),
+    ):
+        """
+        Compiled include and exclude rules, which decide which requests and
+        responses to log with a few lookups, however many rules there are.
+
+        A request is kept if its path and method match the include rules,
+        when there are any, and none of the exclude rules; otherwise neither
+        it nor its response are logged.  A response is kept likewise by its
+        status code.  Paths are matched like by `PathMatcher`, methods
+        case-insensitively, and status codes can be classes like "5xx".
+
+        >>> filters = FilterSet(
+        ...     exclude_paths=["/static/", "/favicon"],
+        ...     exclude_methods=["options"],
+        ...     include_status_codes=["4xx", "5xx"],
+        ... )
+        >>> filters.passes_request("/favicon.ico", "GET")
+        False
+        >>> filters.passes_request("/api/", "OPTIONS")
+        False
+        >>> filters.passes_request("/api/", "GET")
+        True
+        >>> filters.passes_response(200), filters.passes_response(404)
+        (False, True)
+
+        :param include_paths: Regular expressions of paths to log
+        :param exclude_paths: Regular expressions of paths not to log
+        :param include_methods: Methods to log
+        :param exclude_methods: Methods not to log
+        :param include_status_codes: Status codes or classes to log
+        :param exclude_status_codes: Status codes or classes not to log
+        """
+        self.include_paths = PathMatcher(include_paths)
+        self.exclude_paths = PathMatcher(exclude_paths)
+        self.include_methods = frozenset(m.upper() for m in include_methods)
+        self.exclude_methods = frozenset(m.upper() for m in exclude_methods)
+        self.include_status_codes = status_codes(include_status_codes)
+        self.exclude_status_codes = status_codes(exclude_status_codes)
+        self.filters_requests = bool(
+            self.include_paths
+            or self.exclude_paths
+            or self.include_methods
+            or self.exclude_methods
+        )
+        self.filters_responses = bool(
+            self.include_status_codes or self.exclude_status_codes
+        )
+
+    def keep_request(self, request):
+        """
+        Return whether to log a request and its response.
+
+        :param request: Request object
+        :return: True to log it
+        """
+        if not self.filters_requests:
+            return True
+        return self.passes_request(request.path, request.method)
+
+    def keep_response(self, response):
+        """
+        Return whether to log a response.
+
+        :param response: Response object
+        :return: True to log it
+        """
+        if not self.filters_responses:
+            return True
+        return self.passes_response(response.status_code)
+
+    def passes_request(self, path, method):
+        if self.include_methods and method not in self.include_methods:
+            return False
+        if method in self.exclude_methods:
+            return False
+        if self.include_paths and not self.include_paths.match(path):
+            return False
+        return not (self.exclude_paths and self.exclude_paths.match(path))
+
+    def passes_response(self, status_code):
+        if (
+            self.include_status_codes
+            and status_code not in self.include_status_codes
+        ):
+            return False
+        return status_code not in self.exclude_status_codes
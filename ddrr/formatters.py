@@ -1,16 +1,21 @@
 import logging
+import threading
 
 from django.core.management.color import supports_color
+from django.http import HttpRequest
 from django.template import Context
 from django.template import RequestContext
 from django.template import Template
 from django.template.loader import get_template
 
+from ddrr import stats
 from ddrr.records import RequestLogRecord
 from ddrr.records import ResponseLogRecord
+from ddrr.utils import PRETTY_PRINT_MAX_SIZE
+from ddrr.utils import dump_json
 
 
-class DjangoTemplateRequestFormatter(logging.Formatter):
+class DjangoTemplateFormatter(logging.Formatter):
     # noinspection PyMissingConstructor
     def __init__(
         self,
@@ -18,86 +23,199 @@ class DjangoTemplateRequestFormatter(logging.Formatter):
         template_name=None,
         template=None,
         pretty=False,
+        pretty_max_size=PRETTY_PRINT_MAX_SIZE,
         limit_body=None,
         colors=True,
+        autoreload=False,
     ):
         if not template_name and not template:
             raise RuntimeError(
-                "DjangoTemplateRequestFormatter requires a template_name or "
-                "template setting"
+                f"{type(self).__name__} requires a template_name or "
+                f"template setting"
             )
         self._template_name = template_name
         self._template = template
+        self._compiled = None
+        self._compiled_source = None
+        self._lock = threading.Lock()
         self.pretty = pretty
+        self.pretty_max_size = pretty_max_size
         self.limit_body = limit_body
         self.colors = colors and supports_color()
+        self.autoreload = autoreload
 
     @property
     def template(self):
-        # lazy loading of template to avoid AppRegistryNotReady
-        return (
-            # circumvent autoescape being forced onto the template context by
-            # extracting the source and creating a separate Template object
-            Template(get_template(self._template_name).template.source)
-            if self._template_name
-            else Template(self._template)
-        )
+        # lazy loading of template to avoid AppRegistryNotReady; once
+        # compiled, the template is only looked up again when autoreload is
+        # enabled, and only recompiled if its source has actually changed.
+        compiled = self._compiled
+        if compiled is not None and not self.autoreload:
+            return compiled
+        source = self.template_source
+        if compiled is not None and source == self._compiled_source:
+            return compiled
+        with self._lock:
+            if self._compiled is None or source != self._compiled_source:
+                # circumvent autoescape being forced onto the template
+                # context by extracting the source and creating a separate
+                # Template object
+                self._compiled = Template(source)
+                self._compiled_source = source
+            return self._compiled
 
-    def format(self, record):
-        ddrr = RequestLogRecord.make(record, self)
-        ctx = RequestContext(
-            request=record.msg,
+    @property
+    def template_source(self):
+        if self._template_name:
+            return get_template(self._template_name).template.source
+        return self._template
+
+    def get_context(self, record, ddrr):
+        return Context(
             dict_={"ddrr": ddrr, "record": record, "formatter": self},
             autoescape=False,
         )
+
+    def make_record(self, record):
+        raise NotImplementedError
+
+    def format(self, record):
+        with stats.timed("record"):
+            ddrr = self.make_record(record)
+        ctx = self.get_context(record, ddrr)
         # noinspection PyBroadException
         try:
-            return self.template.render(ctx)
+            with stats.timed("render"):
+                return self.template.render(ctx)
         except:  # noqa: E722
             return "<template failed to render>"
 
 
-class DjangoTemplateResponseFormatter(logging.Formatter):
+class DjangoTemplateRequestFormatter(DjangoTemplateFormatter):
+    def get_context(self, record, ddrr):
+        if not isinstance(record.msg, HttpRequest):
+            # snapshots can't be passed on to context processors
+            return super().get_context(record, ddrr)
+        return RequestContext(
+            request=record.msg,
+            dict_={"ddrr": ddrr, "record": record, "formatter": self},
+            autoescape=False,
+        )
+
+    def make_record(self, record):
+        return RequestLogRecord.make(record, self)
+
+
+class DjangoTemplateResponseFormatter(DjangoTemplateFormatter):
+    def make_record(self, record):
+        return ResponseLogRecord.make(record, self)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    default_fields = ()
+
     # noinspection PyMissingConstructor
     def __init__(
         self,
         *,
-        template_name=None,
-        template=None,
+        fields=None,
         pretty=False,
+        pretty_max_size=PRETTY_PRINT_MAX_SIZE,
         limit_body=None,
-        colors=True,
     ):
-        if not template_name and not template:
-            raise RuntimeError(
-                "DjangoTemplateResponseFormatter requires a template_name or "
-                "template setting"
-            )
-        self._template_name = template_name
-        self._template = template
+        """
+        Format records as single-line JSON objects.
+
+        :param fields: Names of the log record fields to include, defaults
+            to `default_fields`
+        :param pretty: Whether to pretty-print bodies
+        :param pretty_max_size: Maximum size of bodies to pretty-print
+        :param limit_body: Maximum width of bodies
+        """
+        self.fields = tuple(fields or self.default_fields)
         self.pretty = pretty
+        self.pretty_max_size = pretty_max_size
         self.limit_body = limit_body
-        self.colors = colors and supports_color()
 
-    @property
-    def template(self):
-        # lazy loading of template to avoid AppRegistryNotReady
-        return (
-            # circumvent autoescape being forced onto the template context by
-            # extracting the source and creating a separate Template object
-            Template(get_template(self._template_name).template.source)
-            if self._template_name
-            else Template(self._template)
+    def make_record(self, record):
+        raise NotImplementedError
+
+    def serialize(self, record):
+        with stats.timed("record"):
+            ddrr = self.make_record(record)
+        with stats.timed("render"):
+            return {field: getattr(ddrr, field) for field in self.fields}
+
+    def format(self, record):
+        return dump_json(self.serialize(record))
+
+
+class JsonLinesRequestFormatter(JsonLinesFormatter):
+    default_fields = (
+        "timestamp",
+        "request_id",
+        "method",
+        "path",
+        "query_string",
+        "headers",
+        "body",
+    )
+
+    def make_record(self, record):
+        return RequestLogRecord.make(record, self)
+
+
+class JsonLinesResponseFormatter(JsonLinesFormatter):
+    default_fields = (
+        "timestamp",
+        "request_id",
+        "duration_ms",
+        "status_code",
+        "reason_phrase",
+        "headers",
+        "content",
+        "exception",
+    )
+
+    def make_record(self, record):
+        return ResponseLogRecord.make(record, self)
+
+
+class CombinedFormatter(logging.Formatter):
+    # noinspection PyMissingConstructor
+    def __init__(self, request_formatter, response_formatter):
+        """
+        Format a response record together with the request stored in its
+        `ddrr_request` attribute, so that each exchange is one log record.
+
+        :param request_formatter: Formatter for the request
+        :param response_formatter: Formatter for the response
+        """
+        self.request_formatter = request_formatter
+        self.response_formatter = response_formatter
+
+    @staticmethod
+    def make_request_record(record):
+        return logging.makeLogRecord(
+            {**record.__dict__, "msg": record.ddrr_request}
         )
 
     def format(self, record):
-        ddrr = ResponseLogRecord.make(record, self)
-        ctx = Context(
-            dict_={"ddrr": ddrr, "record": record, "formatter": self},
-            autoescape=False,
+        if getattr(record, "ddrr_request", None) is None:
+            return self.response_formatter.format(record)
+        request_record = self.make_request_record(record)
+        return "\n".join(
+            (
+                self.request_formatter.format(request_record),
+                self.response_formatter.format(record),
+            )
         )
-        # noinspection PyBroadException
-        try:
-            return self.template.render(ctx)
-        except:  # noqa: E722
-            return "<template failed to render>"
+
+
+class JsonLinesCombinedFormatter(CombinedFormatter):
+    def format(self, record):
+        data = {"response": self.response_formatter.serialize(record)}
+        if getattr(record, "ddrr_request", None) is not None:
+            request_record = self.make_request_record(record)
+            data["request"] = self.request_formatter.serialize(request_record)
+        return dump_json(data)
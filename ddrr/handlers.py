@@ -0,0 +1,319 @@
+"""
+Log handlers for high volumes of DDRR output.
+"""
+import gzip
+import logging
+import os
+import shutil
+import threading
+import time
+import traceback
+
+try:
+    # maximum number of buffers passed to a single os.writev call
+    IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+
+class BufferedFileHandler(logging.Handler):
+    terminator = "\n"
+
+    def __init__(
+        self,
+        filename,
+        *,
+        buffer_size=65536,
+        flush_interval=1.0,
+        max_bytes=0,
+        rotate_interval=0,
+        backup_count=5,
+        compress=False,
+        encoding="utf-8",
+        clock=time.time,
+    ):
+        """
+        Write formatted records to a file in batches.
+
+        Records are buffered in memory and written with a single `writev`
+        call once `buffer_size` bytes are buffered, every `flush_interval`
+        seconds, and when the handler is flushed or closed, which happens at
+        interpreter exit.
+
+        Before a write would make the file larger than `max_bytes`, or once
+        it has been open for `rotate_interval` seconds, it is rotated: it's
+        renamed to `filename.1`, `filename.1` to `filename.2` and so on up to
+        `backup_count`.  With `compress`, rotated files are gzipped, as
+        `filename.1.gz` and so on, on a background thread.
+
+        Handlers of the same process writing to the same file, like the
+        request and response handlers, share its buffer, so they must be
+        created with the same options.  Only one process may write to a
+        file: the worker processes of a pre-fork server would rotate it
+        independently, so they need files of their own, or a collector (see
+        `ddrr.collector`) which writes for all of them.
+
+        :param filename: Path of the file
+        :param buffer_size: Bytes to buffer before writing
+        :param flush_interval: Maximum seconds to buffer records, or None
+        :param max_bytes: Size at which to rotate the file, or 0
+        :param rotate_interval: Seconds after which to rotate the file, or 0
+        :param backup_count: Number of rotated files to keep
+        :param compress: Whether to gzip rotated files
+        :param encoding: Encoding of the file
+        :param clock: Function returning the current time in seconds
+        :raises ValueError: When another handler writes to the file with
+            other options
+        """
+        super().__init__()
+        self.baseFilename = os.path.abspath(filename)
+        self.encoding = encoding
+        self._file = _BufferedFile.acquire(
+            self.baseFilename,
+            buffer_size=buffer_size,
+            flush_interval=flush_interval,
+            max_bytes=max_bytes,
+            rotate_interval=rotate_interval,
+            backup_count=backup_count,
+            compress=compress,
+            clock=clock,
+        )
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            self._file.write(msg.encode(self.encoding))
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        self.acquire()
+        try:
+            if self._file is not None:
+                self._file.release()
+                self._file = None
+        finally:
+            self.release()
+        super().close()
+
+    def rotate(self):
+        """
+        Rotate the file now, writing the buffered records to it first.
+        """
+        self._file.rotate()
+
+
+# files written by the handlers of this process, by path
+_files = {}
+_files_lock = threading.Lock()
+
+
+class _BufferedFile:
+    # buffer, descriptor and rotation of a file, shared by the handlers
+    # writing to it
+
+    def __init__(self, path, options):
+        self.path = path
+        self.options = options
+        self.buffer_size = options["buffer_size"]
+        self.flush_interval = options["flush_interval"]
+        self.max_bytes = options["max_bytes"]
+        self.rotate_interval = options["rotate_interval"]
+        self.backup_count = options["backup_count"]
+        self.compress = options["compress"]
+        self._clock = options["clock"]
+        self._lock = threading.RLock()
+        self._users = 0
+        self._buffers = []
+        self._buffered = 0
+        self._fd = None
+        self._size = 0
+        self._opened_at = None
+        self._compressor = None
+        self._stopped = threading.Event()
+        # the flusher thread is started on the first record, and again in
+        # processes forked after that
+        self._flusher_pid = None
+
+    @classmethod
+    def acquire(cls, path, **options):
+        with _files_lock:
+            file = _files.get(path)
+            if file is None:
+                file = _files[path] = cls(path, options)
+            elif file.options != options:
+                raise ValueError(
+                    f"{path} is already written to with other options"
+                )
+            file._users += 1
+            return file
+
+    def release(self):
+        with _files_lock:
+            self._users -= 1
+            if not self._users:
+                del _files[self.path]
+        if self._users:
+            self.flush()
+        else:
+            self.close()
+
+    def write(self, data):
+        with self._lock:
+            self._buffers.append(data)
+            self._buffered += len(data)
+            self._start_flusher()
+            if self._buffered >= self.buffer_size:
+                self._write()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+    def close(self):
+        with self._lock:
+            self._stopped.set()
+            self._write()
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self._wait_for_compression()
+
+    def rotate(self):
+        with self._lock:
+            self._write()
+            self._rotate()
+
+    def _start_flusher(self):
+        if not self.flush_interval or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(
+            target=self._run_flusher, name="ddrr-flusher", daemon=True
+        ).start()
+
+    def _run_flusher(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc()
+
+    def _write(self):
+        if not self._buffers:
+            return
+        buffers, size = self._buffers, self._buffered
+        self._buffers, self._buffered = [], 0
+        if self._should_rotate(size):
+            self._rotate()
+        write_buffers(self._open(), buffers)
+        self._size += size
+
+    def _should_rotate(self, size):
+        self._open()
+        if not self._size:
+            # empty files are never rotated
+            return False
+        if self.max_bytes and self._size + size > self.max_bytes:
+            return True
+        return bool(
+            self.rotate_interval
+            and self._clock() >= self._opened_at + self.rotate_interval
+        )
+
+    def _open(self):
+        if self._fd is None:
+            self._fd = os.open(
+                self.path,
+                os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                0o644,
+            )
+            self._size = os.fstat(self._fd).st_size
+            self._opened_at = self._clock()
+        return self._fd
+
+    def _rotate(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if not os.path.exists(self.path):
+            return
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        # the previous rotated file is compressed before it's renamed, which
+        # only waits if rotating takes less time than compressing
+        self._wait_for_compression()
+        suffix = ".gz" if self.compress else ""
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}{suffix}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}{suffix}")
+        target = f"{self.path}.1"
+        os.replace(self.path, target)
+        if self.compress:
+            # compressing a whole file takes a while, so it's done on a
+            # background thread rather than by the thread which logged
+            self._compressor = threading.Thread(
+                target=_compress_rotated,
+                args=(target,),
+                name="ddrr-compressor",
+                daemon=True,
+            )
+            self._compressor.start()
+
+    def _wait_for_compression(self):
+        if self._compressor is not None:
+            self._compressor.join()
+            self._compressor = None
+
+
+def _compress_rotated(path):
+    try:
+        compress_file(path, path + ".gz")
+        os.remove(path)
+    except Exception:
+        if logging.raiseExceptions:
+            traceback.print_exc()
+
+
+def write_buffers(fd, buffers):
+    """
+    Write buffers to a file descriptor, with as few system calls as possible.
+
+    :param fd: File descriptor
+    :param buffers: List of bytes
+    """
+    if not hasattr(os, "writev"):
+        _write_all(fd, b"".join(buffers))
+        return
+    for start in range(0, len(buffers), IOV_MAX):
+        end = start + IOV_MAX
+        batch = buffers[start:end]
+        written = os.writev(fd, batch)
+        if written < sum(map(len, batch)):
+            _write_all(fd, b"".join(batch)[written:])
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def compress_file(source, target):
+    """
+    Gzip a file.
+
+    :param source: Path of the file to compress
+    :param target: Path of the compressed file
+    """
+    with open(source, "rb") as src, gzip.open(target + ".tmp", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(target + ".tmp", target)
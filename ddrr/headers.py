@@ -0,0 +1,212 @@
+"""
+Normalisation of HTTP header names for display.
+
+Request headers only exist as META keys like `HTTP_X_REQUEST_ID`, so their
+names are reconstructed, using the canonical spelling of well-known headers
+where it isn't simply capitalised.  Conversions are cached.
+"""
+from functools import lru_cache
+
+# maximum number of distinct META keys whose header names are cached
+HEADER_CACHE_SIZE = 1024
+
+# headers which Content-Type and Content-Length appear as in META, unprefixed
+UNPREFIXED_HEADERS = {
+    "CONTENT_TYPE": "Content-Type",
+    "CONTENT_LENGTH": "Content-Length",
+}
+
+SPECIAL_HEADERS = {
+    header.lower(): header
+    for header in [
+        "A-IM",
+        "ALPN",
+        "AMP-Cache-Transform",
+        "ARC-Authentication-Results",
+        "ARC-Message-Signature",
+        "ARC-Seal",
+        "C-PEP-Info",
+        "C-PEP",
+        "Cal-Managed-ID",
+        "CalDAV-Timezones",
+        "CDN-Loop",
+        "Content-ID",
+        "Content-MD5",
+        "DASL",
+        "DAV",
+        "Differential-ID",
+        "Discarded-X400-IPMS-Extensions",
+        "Discarded-X400-MTS-Extensions",
+        "DKIM-Signature",
+        "DL-Expansion-History",
+        "DNT",
+        "EDIINT-Features",
+        "ETag",
+        "Expect-CT",
+        "HTTP2-Settings",
+        "IM",
+        "Include-Referred-Token-Binding-ID",
+        "Jabber-ID",
+        "List-ID",
+        "Message-ID",
+        "MIME-Version",
+        "MMHS-Acp127-Message-Identifier",
+        "MMHS-Authorizing-Users",
+        "MMHS-Codress-Message-Indicator",
+        "MMHS-Copy-Precedence",
+        "MMHS-Exempted-Address",
+        "MMHS-Extended-Authorisation-Info",
+        "MMHS-Handling-Instructions",
+        "MMHS-Message-Instructions",
+        "MMHS-Message-Type",
+        "MMHS-Originator-PLAD",
+        "MMHS-Originator-Reference",
+        "MMHS-Other-Recipients-Indicator-CC",
+        "MMHS-Other-Recipients-Indicator-To",
+        "MMHS-Primary-Precedence",
+        "MMHS-Subject-Indicator-Codes",
+        "MT-Priority",
+        "NNTP-Posting-Date",
+        "NNTP-Posting-Host",
+        "Optional-WWW-Authenticate",
+        "Original-Message-ID",
+        "OSCORE",
+        "P3P",
+        "PEP",
+        "PICS-Label",
+        "Received-SPF",
+        "Resent-Message-ID",
+        "SIO-Label-History",
+        "SIO-Label",
+        "SLUG",
+        "Status-URI",
+        "SubOK",
+        "TCN",
+        "TE",
+        "TLS-Report-Domain",
+        "TLS-Report-Submitter",
+        "TLS-Required",
+        "TTL",
+        "UA-Color",
+        "UA-Media",
+        "UA-Pixels",
+        "UA-Resolution",
+        "UA-Windowpixels",
+        "URI",
+        "VBR-Info",
+        "WWW-Authenticate",
+        "X-ATT-DeviceId",
+        "X-Correlation-ID",
+        "X-PGP-Sig",
+        "X-Request-ID",
+        "X-Riferimento-Message-ID",
+        "X-UA-Compatible",
+        "X-UIDH",
+        "X-WebKit-CSP",
+        "X-XSS-Protection",
+        "X400-MTS-Identifier",
+    ]
+}
+
+
+def meta_to_header(header):
+    """
+    Normalize an HTTP header as it appears in META.
+
+    >>> meta_to_header("FOO_BAR")
+    'Foo-Bar'
+    >>> meta_to_header("_")
+    '-'
+
+    :param header: Header name
+    :return: Normalized header name
+    """
+    return "-".join(part.capitalize() for part in header.split("_"))
+
+
+def header_to_meta(header):
+    """
+    Convert an HTTP header name to its key in request.META.
+
+    >>> header_to_meta("X-Request-ID")
+    'HTTP_X_REQUEST_ID'
+
+    :param header: Header name
+    :return: META key
+    """
+    return "HTTP_" + header.upper().replace("-", "_")
+
+
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def canonical_header(header):
+    """
+    Return the display name of a header, e.g. WWW-Authenticate rather than
+    Www-Authenticate.
+
+    >>> canonical_header("www-authenticate")
+    'WWW-Authenticate'
+    >>> canonical_header("x-custom-header")
+    'X-Custom-Header'
+
+    :param header: Header name in any case
+    :return: Header name
+    """
+    special = SPECIAL_HEADERS.get(header.lower())
+    if special is not None:
+        return special
+    return header.title()
+
+
+@lru_cache(maxsize=HEADER_CACHE_SIZE)
+def meta_key_to_header(key):
+    """
+    Return the display name of the header stored in request.META as `key`.
+
+    >>> meta_key_to_header("HTTP_X_REQUEST_ID")
+    'X-Request-ID'
+    >>> meta_key_to_header("CONTENT_TYPE")
+    'Content-Type'
+
+    :param key: META key of a header
+    :return: Header name
+    """
+    if key in UNPREFIXED_HEADERS:
+        return UNPREFIXED_HEADERS[key]
+    return canonical_header(key[5:].replace("_", "-"))
+
+
+def collect_request_headers(request):
+    """
+    Given an HTTP request, return its headers as a dictionary, in a single
+    pass over request.META.
+
+    :param request: Request object, or a snapshot of one
+    :return: Dictionary of headers
+    """
+    meta = getattr(request, "META", None)
+    if meta is None:
+        # snapshots hold headers which are collected already
+        return dict(request.headers)
+    headers = {}
+    for key, value in meta.items():
+        if key.startswith("HTTP_") or key in UNPREFIXED_HEADERS:
+            headers[meta_key_to_header(key)] = value
+
+    # sometimes Content-Length will be the empty string even though it was
+    # not sent by the client, so remove it.
+    if headers.get("Content-Length") == "":
+        del headers["Content-Length"]
+
+    return headers
+
+
+def collect_response_headers(response):
+    """
+    Given an HTTP response, return its headers as a dictionary.
+
+    Unlike request headers, response header names are shown as they were set.
+
+    :param response: Response object, or a snapshot of one
+    :return: Dictionary of headers
+    """
+    return dict(response.items())
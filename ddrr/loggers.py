@@ -2,3 +2,30 @@ import logging
 
 request_logger = logging.getLogger("ddrr-request-logger")
 response_logger = logging.getLogger("ddrr-response-logger")
+
+
+def emitting_handlers(logger, level=logging.DEBUG):
+    """
+    Return the handlers which would handle a record of `level` logged with
+    `logger`, following the same rules as `logging.Logger`.
+
+    >>> emitting_handlers(logging.getLogger("ddrr-doctest"))
+    []
+
+    :param logger: Logger object
+    :param level: Log level
+    :return: List of handlers, empty if the record would be dropped
+    """
+    if logger.disabled or not logger.isEnabledFor(level):
+        return []
+    handlers = []
+    current = logger
+    while current:
+        handlers.extend(h for h in current.handlers if level >= h.level)
+        if not current.propagate:
+            break
+        current = current.parent
+    if not handlers and logging.lastResort:
+        if level >= logging.lastResort.level:
+            handlers.append(logging.lastResort)
+    return handlers
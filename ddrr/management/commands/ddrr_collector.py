@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from ddrr.collector import Collector
+from ddrr.collector import restore_local_handlers
+
+
+class Command(BaseCommand):
+    help = (
+        "Collect the records which the worker processes of a pre-fork server "
+        "forward to COLLECTOR_ADDRESS, and format and write them with the "
+        "handlers configured in the DDRR settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--address",
+            help="Path of the socket (default: DDRR['COLLECTOR_ADDRESS'])",
+        )
+
+    def handle(self, *args, **options):
+        address = options["address"] or getattr(settings, "DDRR", {}).get(
+            "COLLECTOR_ADDRESS"
+        )
+        if not address:
+            raise CommandError(
+                "Set DDRR['COLLECTOR_ADDRESS'] or pass --address"
+            )
+        # this process writes the records instead of forwarding them
+        restore_local_handlers()
+        collector = Collector(address)
+        self.stdout.write(f"Collecting DDRR records on {address}")
+        try:
+            collector.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            collector.server_close()
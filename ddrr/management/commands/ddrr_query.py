@@ -0,0 +1,98 @@
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from ddrr.capture import CaptureStore
+
+
+class Command(BaseCommand):
+    help = (
+        "Query the exchanges captured in the CAPTURE_DIR capture store, the "
+        "most recent first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dir",
+            help="Capture store directory (default: DDRR['CAPTURE_DIR'])",
+        )
+        parser.add_argument("--path", help="Path prefix")
+        parser.add_argument("--method", help="Request method")
+        parser.add_argument(
+            "--status", help="Status code or class, e.g. 404 or 5xx"
+        )
+        parser.add_argument(
+            "--since", type=float, help="Earliest Unix timestamp"
+        )
+        parser.add_argument(
+            "--until", type=float, help="Latest Unix timestamp"
+        )
+        parser.add_argument(
+            "--min-duration", type=float, help="Minimum duration (ms)"
+        )
+        parser.add_argument(
+            "--slowest", type=int, help="Show the N slowest exchanges"
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=20,
+            help="Maximum number of exchanges (default: 20)",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Include headers and bodies (implies --json)",
+        )
+        parser.add_argument("--json", action="store_true", help="Output JSON")
+
+    def handle(self, *args, **options):
+        directory = options["dir"] or getattr(settings, "DDRR", {}).get(
+            "CAPTURE_DIR"
+        )
+        if not directory:
+            raise CommandError("Set DDRR['CAPTURE_DIR'] or pass --dir")
+        store = CaptureStore(directory)
+        try:
+            entries = store.query(
+                path=options["path"],
+                method=options["method"],
+                status=options["status"],
+                since=options["since"],
+                until=options["until"],
+                min_duration=options["min_duration"],
+                slowest=options["slowest"],
+                limit=options["limit"],
+            )
+            if options["full"]:
+                for entry in entries:
+                    self.stdout.write(
+                        json.dumps(store.load(entry), default=_decode)
+                    )
+                return
+        finally:
+            store.close()
+        if options["json"]:
+            for entry in entries:
+                self.stdout.write(json.dumps(entry))
+            return
+        self.stdout.write(
+            f"{'id':>8}  {'time':<19}  {'method':<7}{'status':>6}"
+            f"{'ms':>10}  path"
+        )
+        for entry in entries:
+            time = datetime.fromtimestamp(entry["timestamp"])
+            duration = entry["duration_ms"]
+            self.stdout.write(
+                f"{entry['id']:>8}  {time:%Y-%m-%d %H:%M:%S}  "
+                f"{entry['method']:<7}{entry['status_code']:>6}"
+                f"{duration if duration is not None else 0:>10.1f}  "
+                f"{entry['path']}"
+            )
+
+
+def _decode(body):
+    return body.decode("utf-8", errors="replace")
@@ -0,0 +1,184 @@
+import difflib
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from ddrr.replay import PROCESS
+from ddrr.replay import THREAD
+from ddrr.replay import HttpClient
+from ddrr.replay import InProcessClient
+from ddrr.replay import load_capture
+from ddrr.replay import load_jsonl
+from ddrr.replay import replay
+from ddrr.replay import summarize
+from ddrr.utils import status_range
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay captured requests against this project, in-process or over "
+        "HTTP, and report latency and throughput per path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "source",
+            nargs="?",
+            help=(
+                "Capture store directory or JSON lines file "
+                "(default: DDRR['CAPTURE_DIR'])"
+            ),
+        )
+        parser.add_argument(
+            "--url",
+            help="Send requests over HTTP to this server instead of in-process",
+        )
+        parser.add_argument(
+            "--host",
+            help=(
+                "Host header to send instead of the captured one, or of the "
+                "one of --url"
+            ),
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of concurrent workers (default: 1)",
+        )
+        parser.add_argument(
+            "--pool",
+            choices=(THREAD, PROCESS),
+            default=THREAD,
+            help="Kind of worker pool (default: thread)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=1,
+            help="Number of times to replay the requests (default: 1)",
+        )
+        parser.add_argument("--path", help="Path prefix to replay")
+        parser.add_argument("--method", help="Request method to replay")
+        parser.add_argument(
+            "--status", help="Captured status code or class to replay"
+        )
+        parser.add_argument(
+            "--limit", type=int, help="Replay the N most recent exchanges"
+        )
+        parser.add_argument(
+            "--diff",
+            action="store_true",
+            help="Show how responses differ from the captured ones",
+        )
+        parser.add_argument("--json", action="store_true", help="Output JSON")
+
+    def handle(self, *args, **options):
+        requests = self.load(options)
+        if not requests:
+            raise CommandError("No requests to replay")
+        if options["url"]:
+            client = HttpClient(options["url"], host=options["host"])
+        else:
+            client = InProcessClient(host=options["host"])
+        results, elapsed = replay(
+            requests * options["repeat"],
+            client,
+            concurrency=options["concurrency"],
+            pool=options["pool"],
+        )
+        summary = summarize(results, elapsed)
+        if options["json"]:
+            self.stdout.write(json.dumps(summary, indent=2))
+        else:
+            self.write_summary(summary)
+        if options["diff"]:
+            self.write_diffs(results)
+
+    def load(self, options):
+        source = options["source"] or getattr(settings, "DDRR", {}).get(
+            "CAPTURE_DIR"
+        )
+        if not source:
+            raise CommandError("Pass a source or set DDRR['CAPTURE_DIR']")
+        if not os.path.isdir(source):
+            requests = [
+                request
+                for request in load_jsonl(source)
+                if _matches(request, options)
+            ]
+            # lines are logged oldest first
+            if options["limit"] is not None:
+                start = max(len(requests) - options["limit"], 0)
+                requests = requests[start:]
+            return requests
+        return load_capture(
+            source,
+            path=options["path"],
+            method=options["method"],
+            status=options["status"],
+            limit=options["limit"],
+        )
+
+    def write_summary(self, summary):
+        self.stdout.write(
+            f"{'path':<32}{'requests':>9}{'errors':>8}{'4xx':>6}{'5xx':>6}"
+            f"{'diffs':>7}{'req/s':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}  (ms)"
+        )
+        for path, row in sorted(summary.items()):
+            self.stdout.write(
+                f"{path[:31]:<32}{row['requests']:>9}{row['errors']:>8}"
+                f"{row['client_errors']:>6}{row['server_errors']:>6}"
+                f"{row['mismatches']:>7}{row['rps']:>9.1f}"
+                f"{row['p50_ms']:>9.2f}{row['p90_ms']:>9.2f}"
+                f"{row['p99_ms']:>9.2f}{row['max_ms']:>9.2f}"
+            )
+
+    def write_diffs(self, results):
+        for result in results:
+            if result.error is not None:
+                self.stdout.write(
+                    f"{result.request.method} {result.request.url_path}: "
+                    f"{result.error}"
+                )
+            elif result.mismatch:
+                self.write_diff(result)
+
+    def write_diff(self, result):
+        request = result.request
+        self.stdout.write(
+            f"{request.method} {request.url_path}: "
+            f"{request.expected_status} -> {result.status_code}"
+        )
+        expected = request.expected_body
+        if expected is None or expected == result.body:
+            return
+        diff = difflib.unified_diff(
+            _lines(expected),
+            _lines(result.body),
+            "captured",
+            "replayed",
+            lineterm="",
+        )
+        for line in diff:
+            self.stdout.write(line)
+
+
+def _matches(request, options):
+    if options["path"] and not request.path.startswith(options["path"]):
+        return False
+    if options["method"] and request.method != options["method"].upper():
+        return False
+    if options["status"]:
+        if request.expected_status is None:
+            return False
+        low, high = status_range(options["status"])
+        return low <= request.expected_status <= high
+    return True
+
+
+def _lines(body):
+    return body.decode("utf-8", errors="replace").splitlines()
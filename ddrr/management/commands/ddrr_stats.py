@@ -0,0 +1,110 @@
+import json
+import urllib.request
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.test import Client
+
+from ddrr import stats
+from ddrr.views import stats_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the time DDRR itself spends on each stage of logging, as "
+        "recorded by a running server, or by requests sent in-process with "
+        "--benchmark."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            help=(
+                "URL of the ddrr.urls stats view of a running server, like "
+                "http://localhost:8000/ddrr/stats"
+            ),
+        )
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="Send requests to this project in-process and report those",
+        )
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            default=["/"],
+            help="Paths to request with --benchmark (default: /)",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=100,
+            help="Number of requests per path (default: 100)",
+        )
+        parser.add_argument(
+            "--host",
+            default="localhost",
+            help="Host header to send (default: localhost)",
+        )
+        parser.add_argument("--json", action="store_true", help="Output JSON")
+
+    def handle(self, *args, **options):
+        if options["benchmark"]:
+            snapshot = self.benchmark(options)
+        elif options["url"]:
+            snapshot = self.fetch(options["url"])
+        else:
+            raise CommandError("Pass the --url of a stats view or --benchmark")
+        if options["json"]:
+            self.stdout.write(json.dumps(snapshot, indent=2))
+            return
+        self.write_summary(snapshot)
+
+    def benchmark(self, options):
+        client = Client(HTTP_HOST=options["host"])
+        was_enabled = stats.is_enabled()
+        stats.reset()
+        stats.enable()
+        try:
+            for path in options["paths"]:
+                for _ in range(options["requests"]):
+                    client.get(path)
+        finally:
+            stats.enable(was_enabled)
+        return stats_snapshot()
+
+    def fetch(self, url):
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                return json.load(response)
+        except OSError as e:
+            raise CommandError(f"Can't fetch {url}: {e}")
+
+    def write_summary(self, snapshot):
+        if not any(stage in snapshot for stage in stats.STAGES):
+            self.stdout.write(
+                f"Nothing recorded by process {snapshot.get('pid')}, is "
+                f"DDRR['INSTRUMENT'] set?"
+            )
+            return
+        self.stdout.write(
+            f"{'stage':<14}{'count':>8}{'mean':>10}{'p50':>10}"
+            f"{'p90':>10}{'p99':>10}{'max':>10}  (us)"
+        )
+        for stage in stats.STAGES:
+            if stage not in snapshot:
+                continue
+            summary = snapshot[stage]
+            self.stdout.write(
+                f"{stage:<14}{summary['count']:>8}"
+                f"{summary['mean_us']:>10.1f}{summary['p50_us']:>10.1f}"
+                f"{summary['p90_us']:>10.1f}{summary['p99_us']:>10.1f}"
+                f"{summary['max_us']:>10.1f}"
+            )
+        if "render_cache" in snapshot:
+            info = snapshot["render_cache"]
+            self.stdout.write(
+                f"render cache: {info['hits']} hits, {info['misses']} "
+                f"misses, {info['entries']} entries, {info['size']} of "
+                f"{info['max_size']} bytes"
+            )
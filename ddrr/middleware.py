@@ -1,13 +1,367 @@
+import asyncio
+import logging
+
+import attr
+from asgiref.sync import sync_to_async
+
+from ddrr import stats
+from ddrr.exceptions import ExceptionCapture
+from ddrr.exchange import Exchange
+from ddrr.exchange import request_id_keys
+from ddrr.filters import FilterSet
+from ddrr.filters import attribute_filters
+from ddrr.filters import passes
+from ddrr.loggers import emitting_handlers
 from ddrr.loggers import request_logger
 from ddrr.loggers import response_logger
+from ddrr.pipeline import BLOCK
+from ddrr.pipeline import pipeline
+from ddrr.sampling import Triggers
+from ddrr.sampling import sampler
+from ddrr.snapshots import RequestSnapshot
+from ddrr.snapshots import ResponseSnapshot
+from ddrr.streaming import capture_streaming_content
+from ddrr.uploads import capture_request_body
+
+try:
+    from asgiref.sync import markcoroutinefunction
+except ImportError:  # asgiref < 3.6
+
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
+
+
+logger = logging.getLogger(__name__)
+
+# tasks logging streamed responses, which the event loop only keeps weak
+# references to
+_deferred_emits = set()
+
+
+@attr.s
+class MiddlewareOptions:
+    capture_streaming = attr.ib(default=False)
+    capture_request_stream = attr.ib(default=False)
+    capture_body_bytes = attr.ib(default=65536)
+    combined = attr.ib(default=False)
+    # whether the request is attached to the response record, for the
+    # capture store, see ddrr.capture.CaptureHandler
+    capture_exchanges = attr.ib(default=False)
+    request_id_keys = attr.ib(factory=request_id_keys)
+    # include and exclude rules from the DDRR settings
+    filters = attr.ib(factory=FilterSet)
+    # conditions for tail-based logging, see ddrr.sampling.Triggers
+    triggers = attr.ib(factory=Triggers)
+    # maximum length of the local variables captured with exceptions
+    exception_locals_size = attr.ib(default=None)
+    # whether requests and responses can be logged at all, and the filters
+    # which decide it per request or response, see refresh()
+    log_requests = attr.ib(default=True)
+    log_responses = attr.ib(default=True)
+    request_filters = attr.ib(default=None)
+    response_filters = attr.ib(default=None)
+
+    def refresh(self):
+        """
+        Recompute whether requests and responses can be logged, from the
+        current configuration of the DDRR loggers and their handlers.
+
+        Call this after reconfiguring the loggers at runtime.
+        """
+        self.log_responses, self.response_filters = _emit_plan(response_logger)
+        if self.combined:
+            # requests are logged along with their response
+            self.log_requests = self.log_responses
+            self.request_filters = None
+        else:
+            self.log_requests, self.request_filters = _emit_plan(
+                request_logger
+            )
+
+    @property
+    def passthrough(self):
+        return not (self.log_requests or self.log_responses)
+
+    def log_request(self, request):
+        return self.log_requests and _passes(self.request_filters, request)
+
+    def log_response(self, response):
+        return self.log_responses and _passes(self.response_filters, response)
+
+
+def _emit_plan(logger):
+    # a logger can emit if it has handlers for DEBUG records; whether it
+    # emits a given message also depends on the filters which only look at
+    # the message, i.e. those of the logger and, unless one of them has none,
+    # those of each handler
+    handlers = emitting_handlers(logger)
+    if not handlers:
+        return False, None
+    logger_filters = attribute_filters(logger)
+    handler_filters = [attribute_filters(handler) for handler in handlers]
+    if not all(handler_filters):
+        handler_filters = None
+    if not logger_filters and handler_filters is None:
+        return True, None
+    return True, (logger_filters, handler_filters)
+
+
+def _passes(filters, msg):
+    if filters is None:
+        return True
+    logger_filters, handler_filters = filters
+    return passes(logger_filters, msg) and (
+        handler_filters is None
+        or any(passes(hf, msg) for hf in handler_filters)
+    )
+
+
+options = MiddlewareOptions()
 
 
 class DebugRequestsResponses:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self._async_mode = asyncio.iscoroutinefunction(get_response)
+        if self._async_mode:
+            # mark the instance as a coroutine function, so that Django calls
+            # it from the event loop without adapting it (see MiddlewareMixin)
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        request_logger.debug(request)
+        if self._async_mode:
+            return self.__acall__(request)
+        if not _keep_request(request):
+            return self.get_response(request)
+        exchange = Exchange.begin(request, options.request_id_keys)
+        msg = _pending_request_msg(request, exchange)
+        if msg is not None:
+            _emit(request_logger, msg)
+        exchange.start()
         response = self.get_response(request)
-        response_logger.debug(response)
+        _finish(exchange, response)
+        msg = _captured_request_msg(request, exchange)
+        if msg is not None:
+            _emit(request_logger, msg)
+        if _keep_response(response):
+            _log_response(
+                response,
+                lambda r: _emit(response_logger, _response_msg(r), _extra(r)),
+            )
         return response
+
+    async def __acall__(self, request):
+        if not _keep_request(request):
+            return await self.get_response(request)
+        # CPU time can't be attributed to a request on the event loop
+        exchange = Exchange.begin(
+            request, options.request_id_keys, measure_cpu=False
+        )
+        msg = _pending_request_msg(request, exchange)
+        if msg is not None:
+            await _aemit(request_logger, msg)
+        exchange.start()
+        response = await self.get_response(request)
+        _finish(exchange, response)
+        msg = _captured_request_msg(request, exchange)
+        if msg is not None:
+            await _aemit(request_logger, msg)
+        if not _keep_response(response):
+            return response
+        if _defer_response(response):
+            loop = asyncio.get_running_loop()
+            _log_response(
+                response,
+                lambda r: _emit_soon(
+                    loop, response_logger, _response_msg(r), _extra(r)
+                ),
+            )
+        else:
+            await _aemit(
+                response_logger, _response_msg(response), _extra(response)
+            )
+        return response
+
+    def process_exception(self, request, exception):
+        # called by Django when the view raises, before the exception is
+        # turned into an error response, which it is then logged with
+        exchange = getattr(request, "ddrr_exchange", None)
+        if exchange is None:
+            return
+        # local variables can only be captured now, so only if the response
+        # can be logged at all
+        exchange.exception = ExceptionCapture(
+            exception,
+            locals_size=options.log_responses
+            and options.exception_locals_size,
+        )
+
+
+def _keep_request(request):
+    # when nothing can be logged, the middleware is a bare pass-through
+    if options.passthrough or not options.filters.keep_request(request):
+        return False
+    return not sampler.active or sampler.sample_request(request)
+
+
+def _keep_response(response):
+    exchange = getattr(response, "ddrr_exchange", None)
+    if exchange is not None and exchange.triggered is False:
+        return False
+    if not (
+        options.filters.keep_response(response)
+        and options.log_response(response)
+    ):
+        return False
+    return not sampler.active or sampler.sample_response(response)
+
+
+def _pending_request_msg(request, exchange):
+    # return the message to log for the request before the view, if any
+    if not (options.capture_exchanges or options.log_request(request)):
+        return None
+    if options.capture_request_stream and capture_request_body(
+        request, options.capture_body_bytes
+    ):
+        # logged after the view, once it has read the body
+        return None
+    if options.triggers.active:
+        # held until the response shows whether the exchange is logged, the
+        # body being captured as the view reads it rather than read up front
+        if not capture_request_body(request, options.capture_body_bytes):
+            exchange.held_request_msg = RequestSnapshot.capture(
+                request, options.capture_body_bytes
+            )
+        return None
+    return _request_msg_to_emit(request, exchange, _request_msg(request))
+
+
+def _captured_request_msg(request, exchange):
+    # return the message to log for the request after the view, if any
+    if exchange.triggered is False:
+        return None
+    capture = getattr(request, "ddrr_body", None)
+    if capture is not None and not options.capture_request_stream:
+        # captured for the triggers, and logged with the body the view
+        # didn't read too, like it would have been had it been read up front
+        try:
+            capture.read_rest()
+        except Exception:
+            # e.g. the client went away, which must not break the request
+            pass
+        msg = RequestSnapshot.capture(request, options.capture_body_bytes)
+        return _request_msg_to_emit(request, exchange, msg)
+    if capture is not None:
+        return _request_msg_to_emit(request, exchange, _request_msg(request))
+    if exchange.held_request_msg is not None:
+        return _request_msg_to_emit(
+            request, exchange, exchange.held_request_msg
+        )
+    return None
+
+
+def _finish(exchange, response):
+    exchange.finish(response)
+    if options.triggers.active:
+        exchange.triggered = options.triggers.fire(exchange, response)
+
+
+def _request_msg_to_emit(request, exchange, msg):
+    if options.combined or options.capture_exchanges:
+        # logged or captured along with the response, by which time the
+        # view may have consumed the body, e.g. by reading request.POST
+        if not isinstance(msg, RequestSnapshot):
+            msg = RequestSnapshot.capture(request, options.capture_body_bytes)
+        exchange.request_msg = msg
+    if options.combined:
+        return None
+    if options.capture_exchanges and not options.log_request(request):
+        # only kept for the capture store
+        return None
+    return msg
+
+
+def _defer_response(response):
+    return response.streaming and options.capture_streaming
+
+
+def _request_msg(request):
+    # with the pipeline, only snapshots are taken on the request thread and
+    # everything else happens on the pipeline's background thread
+    if pipeline.running:
+        return RequestSnapshot.capture(request, options.capture_body_bytes)
+    return request
+
+
+def _response_msg(response):
+    if pipeline.running:
+        return ResponseSnapshot.capture(response, options.capture_body_bytes)
+    return response
+
+
+def _extra(response):
+    # in combined mode, the request is logged along with its response, and
+    # when capturing, it is captured along with it
+    if options.combined or options.capture_exchanges:
+        return {"ddrr_request": response.ddrr_exchange.request_msg}
+    return None
+
+
+def _emit(logger, msg, extra=None):
+    with stats.timed("emit"):
+        if pipeline.running:
+            pipeline.put(logger, msg, extra)
+        else:
+            logger.debug(msg, extra=extra)
+
+
+async def _aemit(logger, msg, extra=None):
+    # formatting and handler I/O are blocking, and so is putting a message
+    # in the pipeline with the "block" overflow policy, so those are done in
+    # a worker thread instead of on the event loop
+    if pipeline.running and pipeline.overflow != BLOCK:
+        pipeline.put(logger, msg, extra)
+    else:
+        await sync_to_async(_emit, thread_sensitive=False)(logger, msg, extra)
+
+
+def _emit_soon(loop, logger, msg, extra=None):
+    # called once a streaming response has been streamed, which may be on
+    # another thread than the event loop's
+    try:
+        loop.call_soon_threadsafe(_start_deferred_emit, logger, msg, extra)
+    except RuntimeError:
+        # the event loop was closed in the meantime
+        _emit(logger, msg, extra)
+
+
+def _start_deferred_emit(logger, msg, extra):
+    task = asyncio.ensure_future(_aemit(logger, msg, extra))
+    _deferred_emits.add(task)
+    task.add_done_callback(_deferred_emit_done)
+
+
+def _deferred_emit_done(task):
+    _deferred_emits.discard(task)
+    if task.cancelled():
+        logger.warning("Streamed response not logged: event loop stopped")
+    elif task.exception() is not None:
+        logger.error(
+            "Failed to log streamed response", exc_info=task.exception()
+        )
+
+
+def _log_response(response, emit):
+    # streaming responses are logged once their content has been streamed
+    if _defer_response(response):
+        capture_streaming_content(
+            response,
+            options.capture_body_bytes,
+            lambda stream: emit(response),
+        )
+    else:
+        emit(response)
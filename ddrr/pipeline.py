@@ -0,0 +1,265 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import weakref
+
+DROP_OLDEST = "drop-oldest"
+DROP_NEW = "drop-new"
+BLOCK = "block"
+
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEW, BLOCK)
+
+_STOP = object()
+
+COUNTERS = (
+    "enqueued",
+    "emitted",
+    "errors",
+    "dropped_oldest",
+    "dropped_new",
+    "dropped_at_stop",
+    "blocked",
+)
+
+
+class LoggingPipeline:
+    def __init__(self, *, maxsize=1000, overflow=DROP_NEW, max_body=65536):
+        """
+        Bounded queue of messages which are logged by a background thread.
+
+        >>> LoggingPipeline(overflow="drop-everything")
+        Traceback (most recent call last):
+          ...
+        ValueError: Unknown overflow policy: 'drop-everything'
+
+        :param maxsize: Maximum number of queued messages
+        :param overflow: What to do when the queue is full, one of
+            "drop-oldest", "drop-new" or "block"
+        :param max_body: Maximum number of body bytes to snapshot
+        """
+        self._lock = threading.Lock()
+        self._thread = None
+        # process which started the thread, see _restart_after_fork()
+        self._pid = None
+        self._registered = False
+        self._counters = dict.fromkeys(COUNTERS, 0)
+        self.configure(maxsize=maxsize, overflow=overflow, max_body=max_body)
+        if hasattr(os, "register_at_fork"):
+            ref = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: _reset_in_child(ref))
+
+    def configure(self, *, maxsize, overflow, max_body):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow!r}")
+        if self.running:
+            raise RuntimeError("Cannot configure a running pipeline")
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.max_body = max_body
+        self._queue = queue.Queue(maxsize)
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """
+        Start the background thread, and stop it again at interpreter exit.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._start_thread()
+            if not self._registered:
+                atexit.register(self.stop)
+                self._registered = True
+
+    def stop(self, timeout=5):
+        """
+        Log everything still in the queue, then stop the background thread.
+
+        If the queue is still full after `timeout` seconds, what's left in it
+        is logged by the calling thread instead.  Messages which are still
+        queued when the background thread doesn't stop within `timeout`
+        seconds, as it's stuck in a handler, are counted as
+        "dropped_at_stop".
+
+        :param timeout: Seconds to wait for the queue to be drained
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        q = self._queue
+        try:
+            q.put(_STOP, timeout=timeout)
+        except queue.Full:
+            while True:
+                self._drain(q)
+                try:
+                    q.put_nowait(_STOP)
+                    break
+                except queue.Full:
+                    continue
+        thread.join(timeout)
+        if thread.is_alive():
+            with self._lock:
+                # not counting the stop sentinel
+                self._counters["dropped_at_stop"] += max(q.qsize() - 1, 0)
+
+    def flush(self, timeout=None):
+        """
+        Wait until every queued message has been logged.
+
+        :param timeout: Seconds to wait, or None to wait indefinitely
+        :return: True if the queue was drained, False on timeout
+        """
+        q = self._queue
+        with q.all_tasks_done:
+            return q.all_tasks_done.wait_for(
+                lambda: not q.unfinished_tasks, timeout
+            )
+
+    def put(self, logger, msg, extra=None):
+        """
+        Queue `msg` to be logged by `logger` on the background thread.
+
+        :param logger: Logger object
+        :param msg: Log message, typically a snapshot
+        :param extra: Extra log record attributes
+        :return: True if the message was queued, False if it was dropped
+        """
+        if self._pid != os.getpid() and self._thread is not None:
+            self._restart_after_fork()
+        q = self._queue
+        item = (logger, msg, extra)
+        try:
+            q.put_nowait(item)
+        except queue.Full:
+            if self.overflow == DROP_NEW:
+                self._count("dropped_new")
+                return False
+            if self.overflow == BLOCK:
+                self._count("blocked")
+                q.put(item)
+            else:
+                self._put_dropping_oldest(q, item)
+        self._count("enqueued")
+        return True
+
+    def stats(self):
+        """
+        Return the pipeline counters and the current queue size.
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        stats["queued"] = self._queue.qsize()
+        return stats
+
+    def _start_thread(self):
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(self._queue,),
+            name="ddrr-pipeline",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def _restart_after_fork(self):
+        # threads don't survive a fork, like that of the workers of a
+        # pre-fork server which imported the project before forking, so a
+        # forked process starts its own thread the first time it logs
+        with self._lock:
+            if self._pid != os.getpid() and self._thread is not None:
+                self._start_thread()
+
+    def _reset_in_child(self):
+        # the queue and the locks may have been in use by other threads at
+        # the time of the fork, and what's queued is logged by the parent
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(self.maxsize)
+        self._counters = dict.fromkeys(COUNTERS, 0)
+
+    def _put_dropping_oldest(self, q, item):
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+            else:
+                q.task_done()
+                self._count("dropped_oldest")
+            try:
+                q.put_nowait(item)
+                return
+            except queue.Full:
+                continue
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _run(self, q):
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    return
+                self._log(item)
+            finally:
+                q.task_done()
+
+    def _drain(self, q):
+        while True:
+            try:
+                item = q.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self._log(item)
+            finally:
+                q.task_done()
+
+    def _log(self, item):
+        try:
+            logger, msg, extra = item
+            timestamp = getattr(msg, "timestamp", None)
+            if timestamp is None:
+                logger.debug(msg, extra=extra)
+            elif logger.isEnabledFor(logging.DEBUG):
+                logger.handle(_make_record(logger, msg, extra, timestamp))
+            self._count("emitted")
+        except Exception:
+            self._count("errors")
+
+
+def _make_record(logger, msg, extra, timestamp):
+    # the record is made when the queue gets to it, but the time it's logged
+    # at is when the snapshot was taken, not that plus the queue latency
+    record = logger.makeRecord(
+        logger.name,
+        logging.DEBUG,
+        "(unknown file)",
+        0,
+        msg,
+        (),
+        None,
+        extra=extra,
+    )
+    delay = record.created - timestamp
+    record.created = timestamp
+    record.msecs = (timestamp - int(timestamp)) * 1000
+    record.relativeCreated -= delay * 1000
+    return record
+
+
+def _reset_in_child(ref):
+    pipeline = ref()
+    if pipeline is not None:
+        pipeline._reset_in_child()
+
+
+pipeline = LoggingPipeline()
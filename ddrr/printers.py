@@ -0,0 +1,511 @@
+"""
+Pretty-printers for request and response bodies, and the registry which picks
+one by content type.
+"""
+import json
+import re
+from urllib.parse import parse_qsl
+from xml.parsers import expat
+from xml.sax.saxutils import escape
+
+from django.utils.module_loading import import_string
+
+from ddrr import stats
+
+try:
+    from lxml import etree
+    from lxml.etree import XMLSyntaxError
+except ImportError:
+    etree = None
+    XMLSyntaxError = None
+
+# maximum number of distinct Content-Type strings whose printer is memoised
+RESOLVE_CACHE_SIZE = 1024
+
+# number of characters fed to the XML parser at a time by iter_pretty_xml
+XML_FEED_SIZE = 16384
+
+# entities escaped in attribute values, besides "&", "<" and ">"
+XML_ATTRIBUTE_ENTITIES = {
+    '"': "&quot;",
+    "\n": "&#10;",
+    "\r": "&#13;",
+    "\t": "&#9;",
+}
+
+
+def pretty_print_xml(content):
+    """
+    Pretty-print an XML string and return it.
+
+    >>> pretty_print_xml('')
+    ''
+    >>> pretty_print_xml('<p></u>')
+    '<p></u>'
+    >>> pretty_print_xml('<p><div><b>hel</b>lo!</div></p>')
+    '<p>\\n  <div><b>hel</b>lo!</div>\\n</p>\\n'
+
+    :param content: XML string
+    :return: Pretty-printed XML string
+    """
+    if etree:
+        try:
+            parser = etree.XMLParser(remove_blank_text=True)
+            tree = etree.fromstring(content, parser)
+            return etree.tostring(tree, encoding=str, pretty_print=True)
+        except XMLSyntaxError:
+            return content
+    try:
+        return "".join(iter_pretty_xml(content))
+    except ValueError:
+        return content
+
+
+def iter_pretty_xml(content, indent="  "):
+    """
+    Re-indent an XML string as it is parsed, yielding the output in chunks.
+
+    The children of an element are indented unless it has text before its
+    first child, in which case its content is copied as it is.  The input is
+    only parsed as far as the output is consumed, so a consumer which stops
+    early doesn't pay for the rest of the document.
+
+    >>> print("".join(iter_pretty_xml(
+    ...     '<a x="1"><b>foo <i>bar</i></b> <c/><!-- baz --></a>'
+    ... )), end="")
+    <a x="1">
+      <b>foo <i>bar</i></b>
+      <c/>
+      <!-- baz -->
+    </a>
+    >>> "".join(iter_pretty_xml('<p></u>'))
+    Traceback (most recent call last):
+      ...
+    ValueError: mismatched tag: line 1, column 5
+
+    :param content: XML string
+    :param indent: Indentation of each level
+    :return: Iterator of strings
+    :raises ValueError: When reaching invalid XML
+    """
+    reindenter = _XmlReindenter(indent)
+    parser = reindenter.make_parser()
+    try:
+        for start in range(0, len(content), XML_FEED_SIZE):
+            end = start + XML_FEED_SIZE
+            parser.Parse(content[start:end], False)
+            yield reindenter.flush()
+        parser.Parse("", True)
+    except expat.ExpatError as e:
+        raise ValueError(str(e)) from e
+    yield reindenter.flush() + "\n"
+
+
+# the XML of the whole document is re-indented by lxml when it is installed,
+# but only as much of it as the output needs when the output is shortened
+pretty_print_xml.iter_chunks = iter_pretty_xml
+
+
+class _XmlReindenter:
+    # expat handlers which write the re-indented document to a buffer
+
+    def __init__(self, indent):
+        self.indent = indent
+        self.buffer = []
+        # for each open element, None until it has content, then whether
+        # its content is copied as it is rather than indented
+        self.inline = []
+        # whether the last start tag is still waiting for ">" or "/>"
+        self.pending = False
+        # whether a top-level node, like the root element, was written
+        self.started = False
+
+    def make_parser(self):
+        parser = expat.ParserCreate()
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+        parser.StartElementHandler = self.start
+        parser.EndElementHandler = self.end
+        parser.CharacterDataHandler = self.data
+        parser.CommentHandler = self.comment
+        parser.ProcessingInstructionHandler = self.processing_instruction
+        return parser
+
+    def flush(self):
+        output = "".join(self.buffer)
+        self.buffer.clear()
+        return output
+
+    def start(self, name, attributes):
+        self.node()
+        self.buffer.append("<" + name)
+        for i in range(0, len(attributes), 2):
+            value = escape(attributes[i + 1], XML_ATTRIBUTE_ENTITIES)
+            self.buffer.append(f' {attributes[i]}="{value}"')
+        self.inline.append(None)
+        self.pending = True
+
+    def end(self, name):
+        inline = self.inline.pop()
+        if self.pending:
+            self.buffer.append("/>")
+            self.pending = False
+            return
+        if inline is False:
+            self.buffer.append("\n" + self.indent * len(self.inline))
+        self.buffer.append(f"</{name}>")
+
+    def data(self, text):
+        if not self.inline or (text.isspace() and not self.inline[-1]):
+            return
+        # text after a child is copied as it is, like the rest of the content
+        self.inline[-1] = True
+        self.close_start_tag()
+        self.buffer.append(escape(text))
+
+    def comment(self, text):
+        self.node()
+        self.buffer.append(f"<!--{text}-->")
+
+    def processing_instruction(self, target, data):
+        self.node()
+        self.buffer.append(f"<?{target} {data}?>" if data else f"<?{target}?>")
+
+    def node(self):
+        # start a child node of the current element, on a new line unless
+        # the content of the element is copied as it is
+        self.close_start_tag()
+        if not self.inline:
+            if self.started:
+                self.buffer.append("\n")
+            self.started = True
+            return
+        if self.inline[-1] is None:
+            self.inline[-1] = False
+        if self.inline[-1] is False:
+            self.buffer.append("\n" + self.indent * len(self.inline))
+
+    def close_start_tag(self):
+        if self.pending:
+            self.buffer.append(">")
+            self.pending = False
+
+
+JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+JSON_TOKEN = re.compile(
+    r"""
+    (?P<open>[{[])
+    | (?P<close>[}\]])
+    | (?P<colon>:)
+    | (?P<comma>,)
+    | (?P<string>"(?:[^"\\\x00-\x1f]|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))*")
+    | (?P<literal>
+        -?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?
+        | true | false | null | NaN | -?Infinity
+    )
+    """,
+    re.VERBOSE,
+)
+JSON_CLOSERS = {"{": "}", "[": "]"}
+
+# what the JSON re-indenter expects next
+_VALUE = 0
+_VALUE_OR_CLOSE = 1
+_KEY = 2
+_KEY_OR_CLOSE = 3
+_COLON = 4
+_AFTER_VALUE = 5
+
+
+def iter_pretty_json(content, indent="  "):
+    """
+    Re-indent a JSON string token by token, yielding the output in chunks.
+
+    Unlike `pretty_print_json`, strings and numbers are copied from the input
+    as they are, and the input is only read as far as the output is consumed,
+    so a consumer which stops early doesn't pay for the rest of the document.
+
+    >>> chunks = iter_pretty_json('{"foo": [1, 2.5e3, "bar"], "baz": {}}')
+    >>> print("".join(chunks))
+    {
+      "foo": [
+        1,
+        2.5e3,
+        "bar"
+      ],
+      "baz": {}
+    }
+    >>> chunks = iter_pretty_json('[1, 2 3]')
+    >>> next(chunks), next(chunks), next(chunks), next(chunks)
+    ('[', '\\n  1', ',\\n  ', '2')
+    >>> next(chunks)
+    Traceback (most recent call last):
+      ...
+    ValueError: Invalid JSON at position 6
+
+    :param content: JSON string
+    :param indent: Indentation of each level
+    :return: Iterator of strings
+    :raises ValueError: When reaching invalid JSON
+    """
+    stack = []
+    expect = _VALUE
+    pos = JSON_WHITESPACE.match(content).end()
+    while pos < len(content):
+        match = JSON_TOKEN.match(content, pos)
+        step = match and _json_step(match, expect, stack, indent)
+        if not step:
+            break
+        chunk, expect = step
+        yield chunk
+        pos = JSON_WHITESPACE.match(content, match.end()).end()
+    else:
+        if expect == _AFTER_VALUE and not stack:
+            return
+    raise ValueError(f"Invalid JSON at position {pos}")
+
+
+def _json_step(match, expect, stack, indent):
+    # return the output for a token and what to expect after it, or None if
+    # the token isn't valid here
+    kind = match.lastgroup
+    token = match.group()
+    if kind == "comma":
+        if expect != _AFTER_VALUE or not stack:
+            return None
+        expect = _KEY if stack[-1] == "{" else _VALUE
+        return ",\n" + indent * len(stack), expect
+    if kind == "colon":
+        return (": ", _VALUE) if expect == _COLON else None
+    if kind == "close":
+        if not stack or JSON_CLOSERS[stack[-1]] != token:
+            return None
+        stack.pop()
+        if expect == _AFTER_VALUE:
+            return "\n" + indent * len(stack) + token, _AFTER_VALUE
+        if expect in (_VALUE_OR_CLOSE, _KEY_OR_CLOSE):
+            # empty container
+            return token, _AFTER_VALUE
+        return None
+    return _json_item(kind, token, expect, stack, indent)
+
+
+def _json_item(kind, token, expect, stack, indent):
+    # a key, or a value which may open a container
+    if expect in (_VALUE_OR_CLOSE, _KEY_OR_CLOSE):
+        # first item of a container
+        chunk = "\n" + indent * len(stack) + token
+    else:
+        chunk = token
+    if expect in (_KEY, _KEY_OR_CLOSE):
+        return (chunk, _COLON) if kind == "string" else None
+    if expect not in (_VALUE, _VALUE_OR_CLOSE):
+        return None
+    if kind == "open":
+        stack.append(token)
+        return chunk, _KEY_OR_CLOSE if token == "{" else _VALUE_OR_CLOSE
+    return chunk, _AFTER_VALUE
+
+
+def pretty_print_json(content):
+    """
+    Pretty-print a JSON string and return it.
+
+    >>> pretty_print_json('')
+    ''
+    >>> pretty_print_json('foobar')
+    'foobar'
+    >>> pretty_print_json('{"foo":"bar"}')
+    '{\\n  "foo": "bar"\\n}'
+    >>> pretty_print_json('   {"foo"  : "bar"  }')
+    '{\\n  "foo": "bar"\\n}'
+
+    :param content: JSON string
+    :return: Pretty-printed JSON string
+    """
+    try:
+        data = json.loads(content)
+        return json.dumps(data, indent=2)
+    except json.decoder.JSONDecodeError:
+        return content
+
+
+# parsing and dumping the whole document is faster when all of the output is
+# used, re-indenting it incrementally is cheaper when the output is shortened
+pretty_print_json.iter_chunks = iter_pretty_json
+
+
+def pretty_print_form(content):
+    """
+    Pretty-print a form-encoded string as one field per line.
+
+    >>> print(pretty_print_form("foo=bar&baz=a+b"))
+    foo: bar
+    baz: a b
+
+    :param content: Form-encoded string
+    :return: Pretty-printed string
+    """
+    fields = parse_qsl(content, keep_blank_values=True)
+    if not fields:
+        return content
+    return "\n".join(f"{name}: {value}" for name, value in fields)
+
+
+DEFAULT_PRINTERS = {
+    "application/json": pretty_print_json,
+    "text/json": pretty_print_json,
+    "+json": pretty_print_json,
+    "application/xml": pretty_print_xml,
+    "text/xml": pretty_print_xml,
+    "+xml": pretty_print_xml,
+}
+
+
+def parse_media_type(content_type):
+    """
+    Return the media type of a Content-Type, without parameters.
+
+    >>> parse_media_type("Application/JSON; charset=utf-8")
+    'application/json'
+
+    :param content_type: Content-Type header value
+    :return: Lowercase media type
+    """
+    return content_type.partition(";")[0].strip().lower()
+
+
+class PrettyPrinterRegistry:
+    def __init__(self, printers=None):
+        """
+        Pretty-printers keyed on media type.
+
+        A Content-Type is resolved to the printer registered for its exact
+        media type, then for its structured syntax suffix (e.g. "+json"),
+        then for its wildcard type (e.g. "text/*") and finally for "*/*".
+        Resolutions are memoised per Content-Type string.
+
+        >>> registry = PrettyPrinterRegistry(DEFAULT_PRINTERS)
+        >>> registry.resolve("application/vnd.api+json").__name__
+        'pretty_print_json'
+        >>> registry.resolve("image/png") is None
+        True
+
+        :param printers: Dictionary of media type to printer
+        """
+        self._printers = {}
+        self._cache = {}
+        self.update(printers or {})
+
+    def register(self, media_type, printer):
+        """
+        Register a printer for a media type.
+
+        :param media_type: Media type like "application/json", structured
+            syntax suffix like "+json", or wildcard like "text/*" or "*/*"
+        :param printer: Callable taking and returning a string, or a dotted
+            path to one
+        """
+        if isinstance(printer, str):
+            printer = import_string(printer)
+        self._printers[media_type.lower()] = printer
+        self._cache.clear()
+
+    def unregister(self, media_type):
+        self._printers.pop(media_type.lower(), None)
+        self._cache.clear()
+
+    def update(self, printers):
+        """
+        Register several printers, unregistering media types set to None.
+
+        :param printers: Dictionary of media type to printer or None
+        """
+        for media_type, printer in printers.items():
+            if printer is None:
+                self.unregister(media_type)
+            else:
+                self.register(media_type, printer)
+
+    def configure(self, printers=None):
+        """
+        Reset the registry to the default printers, updated with `printers`.
+
+        :param printers: Dictionary of media type to printer or None
+        """
+        self._printers.clear()
+        self.update(DEFAULT_PRINTERS)
+        self.update(printers or {})
+
+    def resolve(self, content_type):
+        """
+        Return the printer for a Content-Type, or None.
+
+        :param content_type: Content-Type header value
+        :return: Printer or None
+        """
+        try:
+            return self._cache[content_type]
+        except KeyError:
+            pass
+        printer = self._resolve(parse_media_type(content_type))
+        if len(self._cache) >= RESOLVE_CACHE_SIZE:
+            # e.g. multipart boundaries make every Content-Type distinct
+            self._cache.clear()
+        self._cache[content_type] = printer
+        return printer
+
+    def _resolve(self, media_type):
+        printers = self._printers
+        printer = printers.get(media_type)
+        if printer is None:
+            _, plus, suffix = media_type.rpartition("+")
+            if plus:
+                printer = printers.get("+" + suffix)
+        if printer is None:
+            main_type = media_type.partition("/")[0]
+            printer = printers.get(main_type + "/*") or printers.get("*/*")
+        return printer
+
+
+printers = PrettyPrinterRegistry(DEFAULT_PRINTERS)
+
+
+def pretty_print(content, content_type):
+    """
+    Pretty-print a body with the printer registered for its content type.
+
+    >>> pretty_print('{"foo":"bar"}', "application/problem+json")
+    '{\\n  "foo": "bar"\\n}'
+    >>> pretty_print("foo", "text/plain")
+    'foo'
+
+    :param content: Body as string
+    :param content_type: Content-Type header value
+    :return: Pretty-printed body, or the body itself
+    """
+    printer = printers.resolve(content_type)
+    if printer is None:
+        return content
+    with stats.timed("pretty_print"):
+        return printer(content)
+
+
+def incremental_printer(content_type):
+    """
+    Return the incremental variant of the printer for a content type, or None.
+
+    Printers with an `iter_chunks` attribute, like `pretty_print_json`, can
+    also pretty-print incrementally: `iter_chunks` takes the same string and
+    returns an iterator of output chunks, raising ValueError when it reaches
+    invalid input.
+
+    >>> incremental_printer("application/json").__name__
+    'iter_pretty_json'
+    >>> incremental_printer("text/plain") is None
+    True
+
+    :param content_type: Content-Type header value
+    :return: Function returning an iterator of strings, or None
+    """
+    return getattr(printers.resolve(content_type), "iter_chunks", None)
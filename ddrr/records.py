@@ -1,37 +1,81 @@
-import textwrap
-
 import attr
 from django.utils.functional import cached_property
 
-from ddrr.utils import collect_request_headers
-from ddrr.utils import pretty_print
+from ddrr import stats
+from ddrr.headers import collect_request_headers
+from ddrr.headers import collect_response_headers
+from ddrr.redaction import redactor
+from ddrr.utils import render_body
+
+
+class ExchangeFieldsMixin:
+    @cached_property
+    def exchange(self):
+        return getattr(self.record.msg, "ddrr_exchange", None)
+
+    @cached_property
+    def request_id(self):
+        return self.exchange and self.exchange.request_id
+
+    @cached_property
+    def duration_ms(self):
+        return self.exchange and self.exchange.duration_ms
+
+    @cached_property
+    def cpu_time_ms(self):
+        return self.exchange and self.exchange.cpu_time_ms
+
+    @cached_property
+    def exception(self):
+        # the traceback is only formatted here, when a record is formatted
+        capture = self.exchange and self.exchange.exception
+        return capture.as_dict() if capture is not None else None
 
 
 @attr.s
-class RequestLogRecord:
+class RequestLogRecord(ExchangeFieldsMixin):
     record = attr.ib()
     request = attr.ib()
     _formatter = attr.ib()
 
     @cached_property
     def headers(self):
-        return collect_request_headers(self.request)
+        with stats.timed("headers"):
+            return redactor.redact_headers(
+                collect_request_headers(self.request)
+            )
+
+    @cached_property
+    def body_capture(self):
+        return getattr(self.request, "ddrr_body", None)
 
     @cached_property
     def body(self):
-        try:
-            content = self.request.body.decode("utf-8")
-        except UnicodeDecodeError:
-            content = str(self.request.body)
-        # optionally pretty print
-        if self._formatter.pretty:
-            content = pretty_print(content, self.content_type)
-        # optionally limit output
-        if self._formatter.limit_body:
-            content = textwrap.shorten(
-                content, self._formatter.limit_body, placeholder="..."
-            )
-        return content
+        capture = self.body_capture
+        if capture is None:
+            raw = self.request.body
+        elif capture.parts is not None:
+            return str(capture.parts)
+        else:
+            raw = capture.content
+        return render_body(
+            raw,
+            self.content_type,
+            pretty=self._formatter.pretty,
+            limit=self._formatter.limit_body,
+            pretty_max_size=self._formatter.pretty_max_size,
+        )
+
+    @cached_property
+    def body_parts(self):
+        capture = self.body_capture
+        if capture is None or capture.parts is None:
+            return None
+        return [attr.asdict(part) for part in capture.parts.parts]
+
+    @cached_property
+    def timestamp(self):
+        return self.record.created
 
     @cached_property
     def method(self):
@@ -46,7 +90,7 @@ class RequestLogRecord:
         query_params = self.query_params
         if not len(query_params):
             return ""
-        return "?" + query_params.urlencode()
+        return "?" + redactor.redact(query_params.urlencode())
 
     @cached_property
     def query_params(self):
@@ -62,14 +106,21 @@ class RequestLogRecord:
 
 
 @attr.s
-class ResponseLogRecord:
+class ResponseLogRecord(ExchangeFieldsMixin):
     record = attr.ib()
     response = attr.ib()
     _formatter = attr.ib()
 
     @cached_property
     def headers(self):
-        return dict(self.response.items())
+        with stats.timed("headers"):
+            return redactor.redact_headers(
+                collect_response_headers(self.response)
+            )
+
+    @cached_property
+    def timestamp(self):
+        return self.record.created
 
     @cached_property
     def reason_phrase(self):
@@ -79,24 +130,25 @@ class ResponseLogRecord:
     def status_code(self):
         return self.response.status_code
 
+    @cached_property
+    def stream(self):
+        return getattr(self.response, "ddrr_stream", None)
+
     @cached_property
     def content(self):
-        try:
-            if self.response.streaming:
-                content = "<streaming>"
-            else:
-                content = self.response.content.decode("utf-8")
-        except UnicodeDecodeError:
-            content = str(self.response.content)
-        # optionally pretty print
-        if self.content_type and self._formatter.pretty:
-            content = pretty_print(content, self.content_type)
-        # optionally limit output
-        if self._formatter.limit_body:
-            content = textwrap.shorten(
-                content, self._formatter.limit_body, placeholder="..."
-            )
-        return content
+        if not self.response.streaming:
+            raw = self.response.content
+        elif self.stream is not None:
+            raw = self.stream.content
+        else:
+            return "<streaming>"
+        return render_body(
+            raw,
+            self.content_type,
+            pretty=self._formatter.pretty,
+            limit=self._formatter.limit_body,
+            pretty_max_size=self._formatter.pretty_max_size,
+        )
 
     @cached_property
     def content_type(self):
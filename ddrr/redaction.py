@@ -0,0 +1,240 @@
+"""
+Redaction of secrets from logged headers and bodies.
+
+Header values are redacted by header name.  In bodies, the values of JSON
+keys and form fields with given names, and text matching given regular
+expressions, are redacted by a single regular expression which combines all
+of them, compiled once, and applied as bodies are decoded.  Patterns which
+would mean something else within it are applied on their own.
+"""
+import json
+import re
+
+DEFAULT_HEADERS = (
+    "Authorization",
+    "Proxy-Authorization",
+    "Cookie",
+    "Set-Cookie",
+)
+
+REPLACEMENT = "[REDACTED]"
+
+# a JSON scalar, or the start of a string cut at the end of a shortened body
+JSON_VALUE = r'"(?:[^"\\]|\\.)*(?:"|\\?$)|[-+.\w]+'
+
+# the boundary line and headers of a part of a multipart body, up to the
+# field name, and the rest of the headers, the value being everything up to
+# the next boundary, or the end of a shortened body
+MULTIPART_HEAD = (
+    r"(?m:^)(?P<boundary>--[^\r\n]+)\r?\n(?:[^\r\n]+\r?\n)*?"
+    r'(?i:content-disposition):[^\r\n]*?;\s*name="(?i:{names})"'
+    r"[^\r\n]*\r?\n(?:[^\r\n]+\r?\n)*?\r?\n"
+)
+MULTIPART_VALUE = r"(?s:.*?)(?=\r?\n(?P=boundary)|\Z)"
+
+# backreferences, which refer to other groups once patterns are merged
+BACKREFERENCE = re.compile(r"\\[1-9]|\(\?P=|\(\?\(")
+
+
+def mergeable(regex):
+    """
+    Whether a compiled pattern means the same within an alternation.
+
+    Inline global flags apply to the whole expression, and named groups and
+    backreferences may clash with or refer to groups of other patterns.
+
+    >>> mergeable(re.compile(r"/api/(v1|v2)/")), mergeable(re.compile("(?i)a"))
+    (True, False)
+
+    :param regex: Compiled regular expression
+    :return: True if it can be merged with other patterns
+    """
+    return not (
+        regex.flags & ~re.UNICODE
+        or regex.groupindex
+        or BACKREFERENCE.search(regex.pattern)
+    )
+
+
+def _name_pattern(name, wildcard):
+    # "*" matches any characters which can't end the name
+    return re.escape(name).replace(r"\*", wildcard)
+
+
+class Redactor:
+    def __init__(
+        self,
+        *,
+        headers=DEFAULT_HEADERS,
+        json_keys=(),
+        form_fields=(),
+        patterns=(),
+        replacement=REPLACEMENT,
+    ):
+        """
+        Redact secrets from headers and bodies.
+
+        JSON keys and form fields are names, matched case-insensitively at
+        any depth, where "*" matches any characters.  Only scalar JSON
+        values are redacted.  Form fields are redacted in urlencoded and
+        multipart bodies, and in query strings.
+        Patterns are regular expressions, whose matches are redacted
+        entirely, after the rest.
+
+        >>> redactor = Redactor(
+        ...     json_keys=["password", "*_token"],
+        ...     form_fields=["secret"],
+        ...     patterns=[r"\\d{4}-\\d{4}-\\d{4}-\\d{4}"],
+        ... )
+        >>> redactor.redact('{"user": "foo", "Password": "bar", "api_token": 1}')
+        '{"user": "foo", "Password": "[REDACTED]", "api_token": "[REDACTED]"}'
+        >>> redactor.redact("user=foo&secret=bar")
+        'user=foo&secret=[REDACTED]'
+        >>> redactor.redact(
+        ...     '--b\\r\\nContent-Disposition: form-data; name="secret"\\r\\n'
+        ...     '\\r\\nfoo\\r\\n--b--\\r\\n'
+        ... ).splitlines()[3]
+        '[REDACTED]'
+        >>> redactor.redact("card 1234-5678-1234-5678")
+        'card [REDACTED]'
+        >>> Redactor(patterns=[r"(?i)bearer \\S+"]).redact("BEARER foo bar")
+        '[REDACTED] bar'
+        >>> redactor.redact_headers({"Cookie": "foo", "Accept": "*/*"})
+        {'Cookie': '[REDACTED]', 'Accept': '*/*'}
+
+        :param headers: Names of headers to redact
+        :param json_keys: Names of JSON keys whose values to redact
+        :param form_fields: Names of form fields whose values to redact
+        :param patterns: Regular expressions to redact
+        :param replacement: Replacement of redacted values
+        """
+        self.configure(
+            headers=headers,
+            json_keys=json_keys,
+            form_fields=form_fields,
+            patterns=patterns,
+            replacement=replacement,
+        )
+
+    def configure(
+        self, *, headers, json_keys, form_fields, patterns, replacement
+    ):
+        self.headers = frozenset(header.lower() for header in headers)
+        self.replacement = replacement
+        self._json_replacement = json.dumps(replacement)
+        alternatives = []
+        if json_keys:
+            names = "|".join(
+                _name_pattern(key, r'[^"\\]*?') for key in json_keys
+            )
+            alternatives.append(
+                rf'(?P<json>"(?i:{names})"\s*:\s*)(?P<json_value>{JSON_VALUE})'
+            )
+        if form_fields:
+            names = "|".join(
+                _name_pattern(field, r"[^&=\s]*?") for field in form_fields
+            )
+            alternatives.append(
+                rf"(?P<form>(?<![^?&])(?i:{names})=)(?P<form_value>[^&\s]*)"
+            )
+            names = "|".join(
+                _name_pattern(field, r'[^"\\]*?') for field in form_fields
+            )
+            alternatives.append(
+                rf"(?P<multipart>{MULTIPART_HEAD.format(names=names)})"
+                rf"(?P<multipart_value>{MULTIPART_VALUE})"
+            )
+        separate = []
+        for pattern in patterns:
+            regex = re.compile(pattern)
+            if mergeable(regex):
+                alternatives.append(f"(?:{pattern})")
+            else:
+                separate.append(regex)
+        self._regex = (
+            re.compile("|".join(alternatives)) if alternatives else None
+        )
+        # applied after the others, one at a time
+        self._regexes = tuple(separate)
+
+    @property
+    def active(self):
+        """
+        Whether bodies are redacted at all.
+        """
+        return self._regex is not None or bool(self._regexes)
+
+    def redact(self, text):
+        """
+        Redact a decoded body or query string.
+
+        :param text: String
+        :return: Redacted string
+        """
+        if self._regex is not None:
+            text = self._regex.sub(self._replace, text)
+        for regex in self._regexes:
+            text = regex.sub(self._replace_all, text)
+        return text
+
+    def redact_bytes(self, raw):
+        """
+        Redact a raw body, keeping bytes which aren't valid UTF-8 as they are.
+
+        :param raw: Body as bytes
+        :return: Redacted body as bytes
+        """
+        if not self.active or not raw:
+            return raw
+        text = raw.decode("utf-8", errors="surrogateescape")
+        return self.redact(text).encode("utf-8", errors="surrogateescape")
+
+    def redact_headers(self, headers):
+        """
+        Redact the values of headers.
+
+        :param headers: Dictionary of headers
+        :return: Dictionary of headers, the same one if nothing was redacted
+        """
+        if not self.headers or not any(
+            self._redacts_header(name, value)
+            for name, value in headers.items()
+        ):
+            return headers
+        return {
+            name: self.redact_header(name, value)
+            for name, value in headers.items()
+        }
+
+    def redact_header(self, name, value):
+        """
+        Redact the value of a header.
+
+        :param name: Header name
+        :param value: Header value
+        :return: Redacted header value
+        """
+        if self._redacts_header(name, value):
+            return self.replacement
+        return value
+
+    def _redacts_header(self, name, value):
+        # empty values are kept, as they aren't secret
+        return bool(value) and name.lower() in self.headers
+
+    def _replace(self, match):
+        group = match.lastgroup
+        if group == "json_value":
+            return match.group("json") + self._json_replacement
+        if group == "form_value":
+            return match.group("form") + self.replacement
+        if group == "multipart_value":
+            return match.group("multipart") + self.replacement
+        return self.replacement
+
+    def _replace_all(self, match):
+        # a function, so that backslashes in the replacement aren't escapes
+        return self.replacement
+
+
+redactor = Redactor()
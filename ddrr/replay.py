@@ -0,0 +1,329 @@
+"""
+Replay of captured exchanges against the local Django project, to load-test
+it and to compare its responses with the captured ones.
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+
+import attr
+
+from ddrr.capture import CaptureStore
+from ddrr.headers import header_to_meta
+from ddrr.stats import Histogram
+
+# request headers which are not replayed as they are, as the client sets them
+# itself (the Host header is replayed by `InProcessClient`, see there)
+SKIPPED_HEADERS = frozenset(
+    ("host", "content-length", "content-type", "connection")
+)
+
+THREAD = "thread"
+PROCESS = "process"
+
+EXECUTORS = {THREAD: ThreadPoolExecutor, PROCESS: ProcessPoolExecutor}
+
+
+@attr.s(frozen=True, slots=True)
+class ReplayRequest:
+    method = attr.ib()
+    path = attr.ib()
+    query_string = attr.ib(default="")
+    headers = attr.ib(factory=tuple)
+    body = attr.ib(default=b"")
+    expected_status = attr.ib(default=None)
+    expected_body = attr.ib(default=None)
+
+    @property
+    def url_path(self):
+        if not self.query_string:
+            return self.path
+        return self.path + "?" + self.query_string.lstrip("?")
+
+    @property
+    def content_type(self):
+        for name, value in self.headers:
+            if name.lower() == "content-type":
+                return value
+        return None
+
+    @property
+    def host(self):
+        for name, value in self.headers:
+            if name.lower() == "host":
+                return value
+        return None
+
+    @property
+    def replayed_headers(self):
+        return [
+            (name, value)
+            for name, value in self.headers
+            if name.lower() not in SKIPPED_HEADERS
+        ]
+
+
+@attr.s(frozen=True, slots=True)
+class ReplayResult:
+    request = attr.ib()
+    status_code = attr.ib()
+    body = attr.ib()
+    duration = attr.ib()
+    error = attr.ib(default=None)
+
+    @property
+    def mismatch(self):
+        """
+        Whether the response differs from the captured one, where known.
+        """
+        request = self.request
+        if self.error is not None:
+            return False
+        if (
+            request.expected_status is not None
+            and request.expected_status != self.status_code
+        ):
+            return True
+        return (
+            request.expected_body is not None
+            and request.expected_body != self.body
+        )
+
+
+def load_capture(directory, **query):
+    """
+    Return the exchanges in a capture store as requests to replay, oldest
+    first.
+
+    :param directory: Capture store directory
+    :param query: Criteria, see `ddrr.capture.CaptureStore.query`
+    :return: List of `ReplayRequest`
+    """
+    store = CaptureStore(directory)
+    try:
+        entries = store.query(**query)
+        return [
+            _from_capture(store.load(entry)) for entry in reversed(entries)
+        ]
+    finally:
+        store.close()
+
+
+def _from_capture(exchange):
+    request = exchange["request"]
+    response = exchange["response"]
+    body = response["body"] or b""
+    # bodies are only compared when they were captured in full
+    complete = response["body_size"] == len(body)
+    return ReplayRequest(
+        method=request["method"],
+        path=request["path"],
+        query_string=request["query_string"],
+        headers=tuple(tuple(header) for header in request["headers"]),
+        body=request["body"] or b"",
+        expected_status=response["status_code"],
+        expected_body=body if complete else None,
+    )
+
+
+def load_jsonl(path):
+    """
+    Return the exchanges in a JSON lines file as requests to replay.
+
+    Each line is either an exchange as logged with `FORMAT` "jsonl" and
+    `COMBINED`, with "request" and "response" objects, or a request object
+    on its own.  Requests have a "method", "path" and optionally
+    "query_string", "headers" and "body"; responses a "status_code" and a
+    "content".  Bodies are strings.
+
+    :param path: Path of the file
+    :return: List of `ReplayRequest`
+    """
+    requests = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                requests.append(_from_json(json.loads(line)))
+    return requests
+
+
+def _from_json(data):
+    request = data.get("request", data)
+    response = data.get("response") or {}
+    headers = request.get("headers") or ()
+    if isinstance(headers, dict):
+        headers = headers.items()
+    body = request.get("body")
+    content = response.get("content")
+    return ReplayRequest(
+        method=request.get("method", "GET"),
+        path=request["path"],
+        query_string=request.get("query_string") or "",
+        headers=tuple((str(k), str(v)) for k, v in headers),
+        body=body.encode() if body else b"",
+        expected_status=response.get("status_code"),
+        expected_body=content.encode() if content is not None else None,
+    )
+
+
+class InProcessClient:
+    def __init__(self, host=None):
+        """
+        Send requests to this Django project in-process, with a test client
+        per thread.
+
+        Requests are sent with their captured Host header, so that they pass
+        the `ALLOWED_HOSTS` check, unless `host` is given.
+
+        :param host: Host header to send instead of the captured one
+        """
+        self.host = host
+
+    def send(self, request):
+        client = getattr(_clients, "client", None)
+        if client is None:
+            from django.test import Client
+
+            client = _clients.client = Client()
+        extra = {
+            header_to_meta(name): value
+            for name, value in request.replayed_headers
+        }
+        host = self.host or request.host
+        if host is not None:
+            extra["HTTP_HOST"] = host
+        content_type = request.content_type
+        if content_type is not None:
+            extra["content_type"] = content_type
+        response = client.generic(
+            request.method, request.url_path, request.body, **extra
+        )
+        if response.streaming:
+            body = b"".join(response.streaming_content)
+        else:
+            body = response.content
+        return response.status_code, body
+
+
+_clients = threading.local()
+
+
+class HttpClient:
+    def __init__(self, base_url, timeout=30, host=None):
+        """
+        Send requests to a server over HTTP.
+
+        Requests are sent with the Host header of `base_url`, unless `host`
+        is given.
+
+        :param base_url: URL of the server, like "http://localhost:8000"
+        :param timeout: Timeout of each request in seconds
+        :param host: Host header to send instead
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.host = host
+
+    def send(self, request):
+        headers = dict(request.replayed_headers)
+        if self.host is not None:
+            headers["Host"] = self.host
+        if request.content_type is not None:
+            headers["Content-Type"] = request.content_type
+        http_request = urllib.request.Request(
+            self.base_url + request.url_path,
+            data=request.body or None,
+            headers=headers,
+            method=request.method,
+        )
+        try:
+            with urllib.request.urlopen(
+                http_request, timeout=self.timeout
+            ) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def replay(requests, client, *, concurrency=1, pool=THREAD):
+    """
+    Send requests with a pool of workers and time each of them.
+
+    :param requests: List of `ReplayRequest`
+    :param client: `InProcessClient` or `HttpClient`
+    :param concurrency: Number of workers
+    :param pool: "thread" or "process"
+    :return: Tuple of the list of `ReplayResult`, in the order of the
+        requests, and the elapsed time in seconds
+    """
+    if pool not in EXECUTORS:
+        raise ValueError(f"Unknown pool: {pool!r}")
+    executor_class = EXECUTORS[pool]
+    start = time.perf_counter()
+    with executor_class(max_workers=concurrency) as executor:
+        results = list(executor.map(_send, [client] * len(requests), requests))
+    return results, time.perf_counter() - start
+
+
+def _send(client, request):
+    start = time.perf_counter_ns()
+    try:
+        status_code, body = client.send(request)
+    except Exception as e:
+        return ReplayResult(
+            request=request,
+            status_code=None,
+            body=None,
+            duration=time.perf_counter_ns() - start,
+            error=repr(e),
+        )
+    return ReplayResult(
+        request=request,
+        status_code=status_code,
+        body=body,
+        duration=time.perf_counter_ns() - start,
+    )
+
+
+def summarize(results, elapsed):
+    """
+    Summarize replay results per path and overall.
+
+    :param results: List of `ReplayResult`
+    :param elapsed: Elapsed time in seconds
+    :return: Dictionary of path, or "*" for all paths, to a dictionary of
+        request count, errors (requests which failed without a response),
+        client and server error responses, mismatches, throughput and
+        latency percentiles in milliseconds
+    """
+    groups = {"*": []}
+    for result in results:
+        groups["*"].append(result)
+        groups.setdefault(result.request.path, []).append(result)
+    summary = {}
+    for path, group in groups.items():
+        histogram = Histogram()
+        for result in group:
+            histogram.add(result.duration)
+        latency = histogram.summary()
+        summary[path] = {
+            "requests": len(group),
+            "errors": sum(result.error is not None for result in group),
+            "client_errors": sum(
+                400 <= (result.status_code or 0) < 500 for result in group
+            ),
+            "server_errors": sum(
+                (result.status_code or 0) >= 500 for result in group
+            ),
+            "mismatches": sum(result.mismatch for result in group),
+            "rps": len(group) / elapsed if elapsed else 0,
+            **{
+                name.replace("_us", "_ms"): latency[name] / 1000
+                for name in ("mean_us", "p50_us", "p90_us", "p99_us", "max_us")
+            },
+        }
+    return summary
@@ -0,0 +1,238 @@
+import random
+import threading
+import time
+import zlib
+
+from ddrr.filters import status_codes as expand_status_codes
+from ddrr.headers import header_to_meta
+from ddrr.utils import status_class
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        """
+        Allow on average `rate` events per second, in bursts of at most
+        `capacity` events.
+
+        :param rate: Events per second
+        :param capacity: Maximum burst size, defaults to one second's worth
+        :param clock: Monotonic clock returning seconds
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def consume(self):
+        """
+        Take a token from the bucket.
+
+        :return: True if a token was available, False otherwise
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated) * self.rate,
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class Sampler:
+    def __init__(
+        self,
+        *,
+        rate=1.0,
+        by_request_id=False,
+        request_id_headers=("X-Request-ID", "X-Correlation-ID"),
+        path_rate_limits=None,
+        status_rate_limits=None,
+    ):
+        """
+        Decide which requests and responses to log.
+
+        A request is kept with probability `rate`.  If `by_request_id` is
+        set, the decision is derived from a hash of the request ID in one of
+        `request_id_headers`, so that every service seeing that ID makes the
+        same decision.  Kept requests are then subject to the rate limit of
+        the longest matching prefix in `path_rate_limits`, and their
+        responses to the rate limit of their status class (e.g. "5xx") or
+        status code in `status_rate_limits`.  Limits are in records per
+        second.
+
+        >>> Sampler().active
+        False
+        >>> Sampler(rate=0.5).active
+        True
+
+        :param rate: Probability of keeping a request, between 0 and 1
+        :param by_request_id: Sample on a hash of the request ID
+        :param request_id_headers: Headers which may hold the request ID
+        :param path_rate_limits: Mapping of path prefix to rate limit
+        :param status_rate_limits: Mapping of status class or code to rate
+            limit
+        """
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            (
+                "sampled",
+                "dropped_rate",
+                "dropped_path_limit",
+                "dropped_status_limit",
+            ),
+            0,
+        )
+        self.configure(
+            rate=rate,
+            by_request_id=by_request_id,
+            request_id_headers=request_id_headers,
+            path_rate_limits=path_rate_limits,
+            status_rate_limits=status_rate_limits,
+        )
+
+    def configure(
+        self,
+        *,
+        rate,
+        by_request_id,
+        request_id_headers,
+        path_rate_limits,
+        status_rate_limits,
+    ):
+        self.rate = rate
+        self.by_request_id = by_request_id
+        self._request_id_keys = [
+            header_to_meta(header) for header in request_id_headers
+        ]
+        # longest prefixes first, so that the most specific one matches
+        self._path_buckets = [
+            (prefix, TokenBucket(limit))
+            for prefix, limit in sorted(
+                (path_rate_limits or {}).items(),
+                key=lambda item: len(item[0]),
+                reverse=True,
+            )
+            if limit is not None
+        ]
+        # status classes are matched like status_range() does, e.g. "5XX"
+        self._status_buckets = {
+            str(status).lower(): TokenBucket(limit)
+            for status, limit in (status_rate_limits or {}).items()
+            if limit is not None
+        }
+        self.active = bool(
+            rate < 1 or self._path_buckets or self._status_buckets
+        )
+
+    def sample_request(self, request):
+        """
+        Decide whether to log a request and, unless its status code is rate
+        limited, its response.
+
+        :param request: Request object
+        :return: True if the request should be logged
+        """
+        if self.rate < 1 and not self._sample_rate(request):
+            self._count("dropped_rate")
+            return False
+        for prefix, bucket in self._path_buckets:
+            if request.path.startswith(prefix):
+                if not bucket.consume():
+                    self._count("dropped_path_limit")
+                    return False
+                break
+        self._count("sampled")
+        return True
+
+    def sample_response(self, response):
+        """
+        Decide whether to log the response of a sampled request.
+
+        :param response: Response object
+        :return: True if the response should be logged
+        """
+        if not self._status_buckets:
+            return True
+        status_code = response.status_code
+        bucket = self._status_buckets.get(
+            str(status_code)
+        ) or self._status_buckets.get(status_class(status_code))
+        if bucket is not None and not bucket.consume():
+            self._count("dropped_status_limit")
+            return False
+        return True
+
+    def stats(self):
+        """
+        Return the sampling counters.
+        """
+        with self._lock:
+            return dict(self._counters)
+
+    def _sample_rate(self, request):
+        if self.by_request_id:
+            for key in self._request_id_keys:
+                request_id = request.META.get(key)
+                if request_id:
+                    digest = zlib.crc32(request_id.encode())
+                    return digest / 0x100000000 < self.rate
+        return random.random() < self.rate
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+
+sampler = Sampler()
+
+
+class Triggers:
+    def __init__(self, *, duration_ms=None, status_codes=(), exceptions=False):
+        """
+        Decide whether to log an exchange once its response is ready, for
+        tail-based logging.
+
+        While any trigger is set, the middleware holds a snapshot of each
+        request instead of logging it, and only logs it, along with its
+        response, if the exchange took at least `duration_ms`, its status
+        code is one of `status_codes` or, with `exceptions`, the view raised
+        an exception.
+
+        >>> Triggers().active
+        False
+        >>> Triggers(status_codes=["5xx"]).active
+        True
+
+        :param duration_ms: Minimum duration in milliseconds, or None
+        :param status_codes: Status codes, or status classes like "5xx"
+        :param exceptions: Whether exceptions raised by the view trigger
+        """
+        self.duration_ms = duration_ms
+        self.status_codes = expand_status_codes(status_codes)
+        self.exceptions = exceptions
+        self.active = bool(
+            duration_ms is not None or self.status_codes or exceptions
+        )
+
+    def fire(self, exchange, response):
+        """
+        Decide whether to log a finished exchange.
+
+        :param exchange: Exchange
+        :param response: Response object
+        :return: True if the exchange should be logged
+        """
+        if self.exceptions and exchange.exception is not None:
+            return True
+        if response.status_code in self.status_codes:
+            return True
+        return (
+            self.duration_ms is not None
+            and exchange.duration_ms >= self.duration_ms
+        )
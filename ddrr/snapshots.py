@@ -0,0 +1,114 @@
+import time
+
+import attr
+
+from ddrr.headers import collect_request_headers
+
+
+@attr.s(frozen=True, slots=True)
+class RequestSnapshot:
+    """
+    Immutable copy of the parts of a request which DDRR logs.
+
+    A snapshot provides the same attributes as the request it was taken from
+    as far as `ddrr.records.RequestLogRecord` is concerned, so it can be
+    formatted later, on another thread, after the request is gone.
+    """
+
+    method = attr.ib()
+    path = attr.ib()
+    GET = attr.ib()
+    headers = attr.ib()
+    body = attr.ib()
+    body_size = attr.ib()
+    timestamp = attr.ib()
+    ddrr_exchange = attr.ib(default=None)
+    ddrr_body = attr.ib(default=None)
+
+    @classmethod
+    def capture(cls, request, max_body=None):
+        """
+        Take a snapshot of a request.
+
+        :param request: Request object
+        :param max_body: Maximum number of body bytes to keep
+        :return: Request snapshot
+        """
+        capture = getattr(request, "ddrr_body", None)
+        if capture is not None:
+            # the body was captured as the view read it
+            body = capture.content
+        else:
+            try:
+                body = request.body
+            except Exception:
+                # e.g. RequestDataTooBig, which must not break the request
+                body = b""
+        exchange = getattr(request, "ddrr_exchange", None)
+        return cls(
+            method=request.method,
+            path=request.path,
+            GET=request.GET,
+            headers=collect_request_headers(request),
+            body=body[:max_body] if max_body is not None else body,
+            body_size=capture.size if capture is not None else len(body),
+            timestamp=time.time(),
+            ddrr_exchange=exchange and exchange.copy(),
+            ddrr_body=capture,
+        )
+
+
+@attr.s(frozen=True, slots=True)
+class ResponseSnapshot:
+    """
+    Immutable copy of the parts of a response which DDRR logs.
+
+    Like `RequestSnapshot`, but for `ddrr.records.ResponseLogRecord`.
+    """
+
+    status_code = attr.ib()
+    reason_phrase = attr.ib()
+    headers = attr.ib()
+    content = attr.ib()
+    content_size = attr.ib()
+    streaming = attr.ib()
+    timestamp = attr.ib()
+    ddrr_stream = attr.ib(default=None)
+    ddrr_exchange = attr.ib(default=None)
+
+    def items(self):
+        return self.headers
+
+    @classmethod
+    def capture(cls, response, max_body=None):
+        """
+        Take a snapshot of a response.
+
+        :param response: Response object
+        :param max_body: Maximum number of content bytes to keep
+        :return: Response snapshot
+        """
+        stream = getattr(response, "ddrr_stream", None)
+        exchange = getattr(response, "ddrr_exchange", None)
+        if stream is not None:
+            content = None
+            content_size = stream.size
+        elif response.streaming:
+            content = None
+            content_size = None
+        else:
+            content = response.content
+            content_size = len(content)
+            if max_body is not None:
+                content = content[:max_body]
+        return cls(
+            status_code=response.status_code,
+            reason_phrase=response.reason_phrase,
+            headers=tuple(response.items()),
+            content=content,
+            content_size=content_size,
+            streaming=response.streaming,
+            timestamp=time.time(),
+            ddrr_stream=stream,
+            ddrr_exchange=exchange and exchange.copy(),
+        )
@@ -0,0 +1,200 @@
+"""
+Timing of the work DDRR itself does, aggregated in histograms.
+
+Instrumentation is disabled by default, in which case `timed` costs a flag
+check.  Enable it with the `INSTRUMENT` setting or `enable()`, then inspect
+it with `snapshot()` or `manage.py ddrr_stats`.
+
+The stages are:
+
+- record: creating a request or response log record
+- headers: collecting request or response headers
+- decode: decoding a body
+- redact: redacting secrets from a decoded body
+- pretty_print: pretty-printing a body
+- render: rendering a template
+- emit: logging a request or response, including all of the above and the
+  log handler's I/O
+"""
+import threading
+import time
+from contextlib import nullcontext
+
+STAGES = (
+    "record",
+    "headers",
+    "decode",
+    "redact",
+    "pretty_print",
+    "render",
+    "emit",
+)
+
+
+def bucket_for(value):
+    """
+    Return the histogram bucket of a value.
+
+    Buckets are a quarter of a power of two wide, so the relative error of
+    a value derived from its bucket is at most 25%.
+
+    >>> [bucket_for(value) for value in (0, 7, 8, 9, 10, 1000)]
+    [0, 7, 8, 8, 9, 35]
+
+    :param value: Non-negative integer
+    :return: Bucket index
+    """
+    if value < 8:
+        return value
+    shift = value.bit_length() - 3
+    return (shift << 2) + (value >> shift)
+
+
+def bucket_bounds(bucket):
+    """
+    Return the smallest and largest values in a histogram bucket.
+
+    >>> bucket_bounds(7), bucket_bounds(8), bucket_bounds(35)
+    ((7, 7), (8, 9), (896, 1023))
+
+    :param bucket: Bucket index
+    :return: Tuple of lower and upper bound
+    """
+    if bucket < 8:
+        return bucket, bucket
+    shift = (bucket >> 2) - 1
+    mantissa = (bucket & 3) + 4
+    return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+
+class Histogram:
+    def __init__(self):
+        """
+        Histogram of durations in nanoseconds.
+
+        >>> histogram = Histogram()
+        >>> for value in range(1, 101):
+        ...     histogram.add(value * 1000)
+        >>> histogram.count, histogram.percentile(50) // 1000
+        (100, 53)
+        """
+        self.buckets = {}
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        bucket = bucket_for(value)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent):
+        """
+        Return the approximate value below which `percent` percent of the
+        values fall.
+        """
+        if not self.count:
+            return 0
+        rank = self.count * percent / 100
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                lower, upper = bucket_bounds(bucket)
+                return min((lower + upper) // 2, self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Return the count, total and percentiles in microseconds.
+        """
+        return {
+            "count": self.count,
+            "total_us": self.total / 1000,
+            "mean_us": self.total / self.count / 1000 if self.count else 0,
+            "p50_us": self.percentile(50) / 1000,
+            "p90_us": self.percentile(90) / 1000,
+            "p99_us": self.percentile(99) / 1000,
+            "max_us": self.max / 1000,
+        }
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc_info):
+        record(self.stage, time.perf_counter_ns() - self.start)
+
+
+_NULL_TIMER = nullcontext()
+_lock = threading.Lock()
+_histograms = {}
+_enabled = False
+
+
+def enable(enabled=True):
+    """
+    Enable or disable instrumentation.
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+def timed(stage):
+    """
+    Return a context manager which records the time spent in it for `stage`.
+
+    :param stage: Stage name, see `STAGES`
+    :return: Context manager
+    """
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(stage)
+
+
+def record(stage, duration):
+    """
+    Record a duration for a stage.
+
+    :param stage: Stage name, see `STAGES`
+    :param duration: Duration in nanoseconds
+    """
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = Histogram()
+        histogram.add(duration)
+
+
+def snapshot():
+    """
+    Return a summary of the recorded durations of every stage.
+
+    :return: Dictionary of stage name to `Histogram.summary()`
+    """
+    with _lock:
+        return {
+            stage: histogram.summary()
+            for stage, histogram in _histograms.items()
+        }
+
+
+def reset():
+    """
+    Forget all recorded durations.
+    """
+    with _lock:
+        _histograms.clear()
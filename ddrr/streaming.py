@@ -0,0 +1,84 @@
+class StreamCapture:
+    def __init__(self, iterable, limit=None, on_close=None):
+        """
+        Pass-through iterator over the chunks of a streaming response, which
+        keeps a copy of the first `limit` bytes and counts bytes and chunks.
+
+        `on_close` is called with the capture once, when the iterator is
+        exhausted or closed, whichever happens first.
+
+        >>> capture = StreamCapture([b"foo", b"bar", b"baz"], limit=4)
+        >>> b"".join(capture)
+        b'foobarbaz'
+        >>> capture.content, capture.size, capture.chunks, capture.truncated
+        (b'foob', 9, 3, True)
+
+        :param iterable: Iterable of bytestrings
+        :param limit: Maximum number of bytes to keep, or None for all
+        :param on_close: Callable taking the capture
+        """
+        self._iterator = iter(iterable)
+        self._buffer = bytearray()
+        self._on_close = on_close
+        self.limit = limit
+        self.size = 0
+        self.chunks = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._iterator)
+        except StopIteration:
+            self.close()
+            raise
+        self.size += len(chunk)
+        self.chunks += 1
+        if self.limit is None:
+            self._buffer += chunk
+        elif len(self._buffer) < self.limit:
+            self._buffer += chunk[: self.limit - len(self._buffer)]
+        return chunk
+
+    @property
+    def content(self):
+        return bytes(self._buffer)
+
+    @property
+    def truncated(self):
+        return len(self._buffer) < self.size
+
+    def __getstate__(self):
+        # only the captured content and counts are pickled, e.g. to send a
+        # snapshot to `ddrr.collector`, not the iterator and callback
+        state = self.__dict__.copy()
+        state.update(_iterator=iter(()), _on_close=None)
+        return state
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._on_close is not None:
+            self._on_close(self)
+
+
+def capture_streaming_content(response, limit, on_close):
+    """
+    Wrap the streaming content of a response in a `StreamCapture`.
+
+    The capture is stored as `response.ddrr_stream`.  For a FileResponse,
+    this means the file is no longer handed to the server's
+    `wsgi.file_wrapper`, as every chunk must pass through the capture.
+
+    :param response: Streaming response object
+    :param limit: Maximum number of bytes to keep
+    :param on_close: Callable taking the capture
+    :return: The capture
+    """
+    capture = StreamCapture(response.streaming_content, limit, on_close)
+    response.streaming_content = capture
+    response.ddrr_stream = capture
+    return capture
@@ -0,0 +1,240 @@
+from email.parser import BytesHeaderParser
+
+import attr
+
+# largest part header block which is parsed, and most parts summarised
+MAX_PART_HEADERS_SIZE = 8192
+MAX_PARTS = 100
+
+_PREAMBLE, _HEADERS, _BODY, _END = range(4)
+
+
+@attr.s(slots=True)
+class Part:
+    """
+    Summary of one part of a multipart body.
+    """
+
+    name = attr.ib(default=None)
+    filename = attr.ib(default=None)
+    content_type = attr.ib(default=None)
+    size = attr.ib(default=0)
+
+    def __str__(self):
+        fields = [f'name="{self.name}"']
+        if self.filename is not None:
+            fields.append(f'filename="{self.filename}"')
+        if self.content_type is not None:
+            fields.append(f"content_type={self.content_type}")
+        fields.append(f"size={self.size}")
+        return " ".join(fields)
+
+
+class MultipartSummary:
+    def __init__(self, boundary):
+        """
+        Incremental scanner which summarises the parts of a multipart body
+        as it is fed, in bounded memory.
+
+        >>> summary = MultipartSummary(b"x")
+        >>> summary.feed(b'--x\\r\\nContent-Disposition: form-data; name="a"')
+        >>> summary.feed(b'\\r\\n\\r\\nfoo\\r\\n--x\\r\\nContent-Disposition: ')
+        >>> summary.feed(b'form-data; name="f"; filename="f.txt"\\r\\n')
+        >>> summary.feed(b'Content-Type: text/plain\\r\\n\\r\\nbarbaz\\r\\n--x--')
+        >>> print(summary)
+        <multipart: 2 parts>
+        name="a" size=3
+        name="f" filename="f.txt" content_type=text/plain size=6
+
+        :param boundary: Multipart boundary as bytes
+        """
+        self._delimiter = b"\r\n--" + boundary
+        # the first delimiter isn't preceded by a line break
+        self._pending = b"\r\n"
+        self._state = _PREAMBLE
+        self._current = None
+        self.parts = []
+        self.omitted = 0
+        self.malformed = False
+
+    @property
+    def count(self):
+        return len(self.parts) + self.omitted
+
+    def feed(self, data):
+        """
+        Scan the next chunk of the body.
+
+        :param data: Bytes
+        """
+        data = self._pending + data
+        self._pending = b""
+        while data and self._state != _END:
+            if self._state == _HEADERS:
+                data = self._feed_headers(data)
+            else:
+                data = self._feed_body(data)
+
+    def _feed_body(self, data):
+        # count the bytes of the current part until the next delimiter,
+        # keeping back any bytes which could be the start of one
+        index = data.find(self._delimiter)
+        if index == -1:
+            keep = min(len(data), len(self._delimiter) - 1)
+            counted = len(data) - keep
+            self._count(counted)
+            self._pending = data[counted:]
+            return b""
+        self._count(index)
+        self._state = _HEADERS
+        end = index + len(self._delimiter)
+        return data[end:]
+
+    def _feed_headers(self, data):
+        if len(data) < 2:
+            self._pending = data
+            return b""
+        if data.startswith(b"--"):
+            # closing delimiter
+            self._state = _END
+            return b""
+        index = data.find(b"\r\n\r\n")
+        if index == -1:
+            if len(data) > MAX_PART_HEADERS_SIZE:
+                self.malformed = True
+                self._state = _END
+            else:
+                self._pending = data
+            return b""
+        self._add_part(data[:index])
+        self._state = _BODY
+        end = index + 4
+        return data[end:]
+
+    def _add_part(self, headers):
+        if len(self.parts) >= MAX_PARTS:
+            self.omitted += 1
+            self._current = None
+            return
+        message = BytesHeaderParser().parsebytes(headers.lstrip(b"\r\n"))
+        self._current = Part(
+            name=message.get_param("name", header="content-disposition"),
+            filename=message.get_filename(),
+            content_type=message.get("content-type"),
+        )
+        self.parts.append(self._current)
+
+    def _count(self, size):
+        if self._state == _BODY and self._current is not None:
+            self._current.size += size
+
+    def __str__(self):
+        lines = [f"<multipart: {self.count} parts>"]
+        lines.extend(str(part) for part in self.parts)
+        if self.omitted:
+            lines.append(f"<{self.omitted} more parts>")
+        if self.malformed:
+            lines.append("<malformed part headers>")
+        return "\n".join(lines)
+
+
+class RequestBodyCapture:
+    def __init__(self, stream, limit=None, boundary=None):
+        """
+        File-like wrapper around the input stream of a request, which keeps
+        a copy of the first `limit` bytes read through it and counts them.
+
+        For multipart bodies, a `MultipartSummary` is kept instead of a copy.
+
+        >>> import io
+        >>> capture = RequestBodyCapture(io.BytesIO(b"foobarbaz"), limit=4)
+        >>> capture.read(6), capture.read()
+        (b'foobar', b'baz')
+        >>> capture.content, capture.size, capture.truncated
+        (b'foob', 9, True)
+
+        :param stream: File-like object
+        :param limit: Maximum number of bytes to keep, or None for all
+        :param boundary: Multipart boundary as bytes, or None
+        """
+        self._stream = stream
+        self._buffer = bytearray()
+        self.limit = 0 if boundary else limit
+        self.size = 0
+        self.parts = MultipartSummary(boundary) if boundary else None
+
+    def read(self, *args, **kwargs):
+        return self._capture(self._stream.read(*args, **kwargs))
+
+    def readline(self, *args, **kwargs):
+        return self._capture(self._stream.readline(*args, **kwargs))
+
+    def read_rest(self, size=65536):
+        """
+        Read what's left of the stream, `size` bytes at a time, capturing it
+        as if it had been read, without keeping more than `limit` bytes.
+
+        :param size: Number of bytes to read at a time
+        """
+        while self.read(size):
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+    def __getstate__(self):
+        # like `ddrr.streaming.StreamCapture`, only the captured content and
+        # counts are pickled, not the input stream
+        state = self.__dict__.copy()
+        state["_stream"] = None
+        return state
+
+    def __setstate__(self, state):
+        # defined so that unpickling doesn't look it up with __getattr__
+        self.__dict__.update(state)
+
+    def _capture(self, data):
+        self.size += len(data)
+        if self.limit is None:
+            self._buffer += data
+        elif len(self._buffer) < self.limit:
+            self._buffer += data[: self.limit - len(self._buffer)]
+        if self.parts is not None:
+            self.parts.feed(data)
+        return data
+
+    @property
+    def content(self):
+        return bytes(self._buffer)
+
+    @property
+    def truncated(self):
+        return len(self._buffer) < self.size
+
+
+def capture_request_body(request, limit):
+    """
+    Capture the request body as it is read, instead of reading it up front.
+
+    The input stream of the request is wrapped in a `RequestBodyCapture`,
+    stored as `request.ddrr_body`, so that only the bytes the view reads are
+    captured, and at most `limit` of them are kept.
+
+    :param request: Request object
+    :param limit: Maximum number of bytes to keep
+    :return: The capture, or None if the request has no input stream
+    """
+    stream = getattr(request, "_stream", None)
+    if stream is None:
+        return None
+    boundary = None
+    if request.content_type == "multipart/form-data":
+        boundary = request.content_params.get("boundary", "").encode()
+    capture = RequestBodyCapture(stream, limit, boundary or None)
+    if hasattr(request, "_body"):
+        # already read, e.g. by an earlier middleware
+        capture._capture(request._body)
+    else:
+        request._stream = capture
+    request.ddrr_body = capture
+    return capture
@@ -0,0 +1,5 @@
+from django.urls import path
+
+from ddrr.views import stats_view
+
+urlpatterns = [path("stats", stats_view, name="ddrr-stats")]
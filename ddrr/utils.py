@@ -1,226 +1,348 @@
+import codecs
 import json
-import re
-from collections import OrderedDict
-from xml.dom import minidom
+import textwrap
 
-import django
+from ddrr import stats
+from ddrr.cache import render_cache
+from ddrr.headers import SPECIAL_HEADERS  # noqa: F401
+from ddrr.headers import collect_request_headers  # noqa: F401
+from ddrr.headers import header_to_meta  # noqa: F401
+from ddrr.headers import meta_to_header  # noqa: F401
+from ddrr.printers import incremental_printer
+from ddrr.printers import pretty_print
+from ddrr.printers import pretty_print_json  # noqa: F401
+from ddrr.printers import pretty_print_xml  # noqa: F401
+from ddrr.redaction import redactor
 
 try:
-    from lxml import etree
-    from lxml.etree import XMLSyntaxError
+    import orjson
 except ImportError:
-    etree = None
-    XMLSyntaxError = None
-
-
-SPECIAL_HEADERS = {
-    header.lower(): header
-    for header in [
-        "A-IM",
-        "ALPN",
-        "AMP-Cache-Transform",
-        "ARC-Authentication-Results",
-        "ARC-Message-Signature",
-        "ARC-Seal",
-        "C-PEP-Info",
-        "C-PEP",
-        "Cal-Managed-ID",
-        "CalDAV-Timezones",
-        "CDN-Loop",
-        "Content-ID",
-        "Content-MD5",
-        "DASL",
-        "DAV",
-        "Differential-ID",
-        "Discarded-X400-IPMS-Extensions",
-        "Discarded-X400-MTS-Extensions",
-        "DKIM-Signature",
-        "DL-Expansion-History",
-        "DNT",
-        "EDIINT-Features",
-        "ETag",
-        "Expect-CT",
-        "HTTP2-Settings",
-        "IM",
-        "Include-Referred-Token-Binding-ID",
-        "Jabber-ID",
-        "List-ID",
-        "Message-ID",
-        "Message-ID",
-        "MIME-Version",
-        "MMHS-Acp127-Message-Identifier",
-        "MMHS-Authorizing-Users",
-        "MMHS-Codress-Message-Indicator",
-        "MMHS-Copy-Precedence",
-        "MMHS-Exempted-Address",
-        "MMHS-Extended-Authorisation-Info",
-        "MMHS-Handling-Instructions",
-        "MMHS-Message-Instructions",
-        "MMHS-Message-Type",
-        "MMHS-Originator-PLAD",
-        "MMHS-Originator-Reference",
-        "MMHS-Other-Recipients-Indicator-CC",
-        "MMHS-Other-Recipients-Indicator-To",
-        "MMHS-Primary-Precedence",
-        "MMHS-Subject-Indicator-Codes",
-        "MT-Priority",
-        "NNTP-Posting-Date",
-        "NNTP-Posting-Host",
-        "Optional-WWW-Authenticate",
-        "Original-Message-ID",
-        "OSCORE",
-        "P3P",
-        "PEP",
-        "PICS-Label",
-        "Received-SPF",
-        "Resent-Message-ID",
-        "SIO-Label-History",
-        "SIO-Label",
-        "SLUG",
-        "Status-URI",
-        "SubOK",
-        "TCN",
-        "TE",
-        "TLS-Report-Domain",
-        "TLS-Report-Submitter",
-        "TLS-Required",
-        "TTL",
-        "UA-Color",
-        "UA-Media",
-        "UA-Pixels",
-        "UA-Resolution",
-        "UA-Windowpixels",
-        "URI",
-        "VBR-Info",
-        "WWW-Authenticate",
-        "X-ATT-DeviceId",
-        "X-Correlation-ID",
-        "X-PGP-Sig",
-        "X-Request-ID" "X-Riferimento-Message-ID",
-        "X-UA-Compatible",
-        "X-UIDH",
-        "X-WebKit-CSP",
-        "X-XSS-Protection",
-        "X400-MTS-Identifier",
-    ]
-}
-
-
-def meta_to_header(header):
-    """
-    Normalize an HTTP header as it appears in META.
-
-    >>> meta_to_header("FOO_BAR")
-    'Foo-Bar'
-    >>> meta_to_header("_")
-    '-'
-
-    :param header: Header name
-    :return: Normalized header name
-    """
-    return "-".join(part.capitalize() for part in header.split("_"))
-
-
-def collect_request_headers(request):
-    """
-    Given an HTTP request, return its headers as a dictionary.
-
-    :param request: Request object
-    :return: Dictionary of headers
-    """
-    # django 2.2 provides headers already formatted
-    if django.VERSION >= (2, 2):
-        headers = dict(request.headers.items())
-    else:
-        # older versions require you to jump through hoops... collect the
-        # META keys that start with HTTP_, strip HTTP_ and normalize the
-        # remainder to the common header format.
-        headers = {
-            (meta_to_header(header[5:])): value
-            for header, value in request.META.items()
-            if header.startswith("HTTP_")
-        }
-        # Content-Type and Content-Length don't appear as HTTP_
-        if "CONTENT_TYPE" in request.META:
-            headers["Content-Type"] = request.META["CONTENT_TYPE"]
-        if "CONTENT_LENGTH" in request.META:
-            headers["Content-Length"] = request.META["CONTENT_LENGTH"]
-
-    out_headers = OrderedDict()
-    # replace e.g. Www-Authenticate with WWW-Authenticate, etc.
-    for header, value in headers.items():
-        header = SPECIAL_HEADERS.get(header.lower(), header)
-        out_headers[header] = value
-
-    # sometimes Content-Length will be the empty string even though it was
-    # not sent by the client, so remove it.
-    if out_headers.get("Content-Length") == "":
-        del out_headers["Content-Length"]
-
-    return out_headers
-
-
-def pretty_print_xml(content):
-    """
-    Pretty-print an XML string and return it.
-
-    >>> pretty_print_xml('')
-    ''
-    >>> pretty_print_xml('<p></u>')
-    '<p></u>'
-    >>> pretty_print_xml('<p><div><b>hel</b>lo!</div></p>')
-    '<p>\\n  <div><b>hel</b>lo!</div>\\n</p>\\n'
-
-    :param content: XML string
-    :return: Pretty-printed XML string
-    """
-    if etree:
+    orjson = None
+
+# default maximum size in bytes of bodies to pretty-print
+PRETTY_PRINT_MAX_SIZE = 1024 * 1024
+
+# extra bytes decoded beyond the (worst case UTF-8) size of the output when
+# shortening bodies, so that words cut at the end don't need another pass
+SHORTEN_MARGIN = 256
+
+
+def status_class(status_code):
+    """
+    Return the class of an HTTP status code.
+
+    >>> status_class(404)
+    '4xx'
+
+    :param status_code: Status code
+    :return: Status class
+    """
+    return f"{status_code // 100}xx"
+
+
+def status_range(status):
+    """
+    Return the range of status codes matching a status code or class.
+
+    >>> status_range("5xx"), status_range(404), status_range("404")
+    ((500, 599), (404, 404), (404, 404))
+
+    :param status: Status code, or status class like "5xx"
+    :return: Tuple of lowest and highest status code
+    """
+    status = str(status).lower()
+    if status.endswith("xx"):
+        low = int(status[0]) * 100
+        return low, low + 99
+    return int(status), int(status)
+
+
+def dump_json(data):
+    """
+    Serialize data as compact JSON, using orjson if it is installed.
+
+    Values which can't be serialized are converted to strings.
+
+    >>> dump_json({"foo": ["bar", 1, None]})
+    '{"foo":["bar",1,null]}'
+
+    :param data: Data to serialize
+    :return: JSON string
+    """
+    if orjson:
+        return orjson.dumps(data, default=str).decode("utf-8")
+    return json.dumps(
+        data, default=str, ensure_ascii=False, separators=(",", ":")
+    )
+
+
+def decode_body(raw, final=True):
+    """
+    Decode a request or response body as UTF-8.
+
+    If the body is not valid UTF-8, its representation is returned instead.
+    Unless `final` is set, an incomplete character at the end of the body is
+    ignored, which allows decoding a body that was cut at an arbitrary byte.
+    Either way, secrets are redacted with `ddrr.redaction.redactor`.
+
+    >>> decode_body(b"foo")
+    'foo'
+    >>> decode_body("åäö".encode()[:-1], final=False)
+    'åä'
+    >>> decode_body(b"\\xff")
+    "b'\\\\xff'"
+
+    :param raw: Body as bytes
+    :param final: Whether `raw` is the complete body
+    :return: Body as string
+    """
+    with stats.timed("decode"):
         try:
-            parser = etree.XMLParser(remove_blank_text=True)
-            tree = etree.fromstring(content, parser)
-            return etree.tostring(tree, encoding=str, pretty_print=True)
-        except XMLSyntaxError:
-            return content
-    # noinspection PyBroadException
-    try:
-        return minidom.parseString(content).toprettyxml(indent="  ")
-    except Exception:
+            content = codecs.getincrementaldecoder("utf-8")().decode(
+                raw, final
+            )
+        except UnicodeDecodeError:
+            content = str(raw)
+    if not redactor.active:
         return content
+    with stats.timed("redact"):
+        return redactor.redact(content)
 
 
-def pretty_print_json(content):
+def shorten(content, width, placeholder="..."):
     """
-    Pretty-print a JSON string and return it.
+    Collapse whitespace in a string and truncate it to `width` characters,
+    like `textwrap.shorten`, but only looking at as much of the string as
+    the result needs.
 
-    >>> pretty_print_json('')
-    ''
-    >>> pretty_print_json('foobar')
-    'foobar'
-    >>> pretty_print_json('{"foo":"bar"}')
-    '{\\n  "foo": "bar"\\n}'
-    >>> pretty_print_json('   {"foo"  : "bar"  }')
-    '{\\n  "foo": "bar"\\n}'
+    >>> shorten("foo  bar   baz", 11)
+    'foo bar baz'
+    >>> shorten("foo  bar   baz", 10)
+    'foo...'
 
-    :param content: JSON string
-    :return: Pretty-printed JSON string
+    :param content: String
+    :param width: Maximum width of the result
+    :param placeholder: Appended to the result if truncated
+    :return: Shortened string
     """
-    try:
-        data = json.loads(content)
-        return json.dumps(data, indent=2)
-    except json.decoder.JSONDecodeError:
-        return content
+    size = width + SHORTEN_MARGIN
+    while size < len(content):
+        words = content[:size].split()
+        result = _shorten_words(words, width, placeholder)
+        if result is not None:
+            return result
+        size *= 2
+    return textwrap.shorten(content, width, placeholder=placeholder)
+
+
+def shorten_body(raw, width, placeholder="..."):
+    """
+    Decode a body and shorten it like `shorten`, decoding only as many bytes
+    as the result needs.
+
+    >>> shorten_body("åäö åäö".encode(), 6)
+    '...'
+    >>> shorten_body(b"foo bar " * 1000, 10)
+    'foo bar...'
 
+    :param raw: Body as bytes
+    :param width: Maximum width of the result
+    :param placeholder: Appended to the result if truncated
+    :return: Shortened string
+    """
+    # a character is at most four bytes in UTF-8
+    size = width * 4 + SHORTEN_MARGIN
+    while size < len(raw):
+        words = decode_body(raw[:size], final=False).split()
+        result = _shorten_words(words, width, placeholder)
+        if result is not None:
+            return result
+        size *= 2
+    return shorten(decode_body(raw), width, placeholder=placeholder)
+
+
+def shorten_chunks(chunks, width, placeholder="..."):
+    """
+    Join chunks of a string and shorten it like `shorten`, consuming only as
+    many chunks as the result needs.
+
+    >>> shorten_chunks(iter(["foo ", "bar ", "baz"]), 11)
+    'foo bar baz'
+    >>> import itertools
+    >>> shorten_chunks(itertools.repeat("foo bar "), 10)
+    'foo bar...'
+
+    :param chunks: Iterator of strings
+    :param width: Maximum width of the result
+    :param placeholder: Appended to the result if truncated
+    :return: Shortened string
+    """
+    parts = []
+    length = 0
+    size = width + SHORTEN_MARGIN
+    for chunk in chunks:
+        parts.append(chunk)
+        length += len(chunk)
+        if length < size:
+            continue
+        parts = ["".join(parts)]
+        while size <= length:
+            words = parts[0][:size].split()
+            result = _shorten_words(words, width, placeholder)
+            if result is not None:
+                return result
+            size *= 2
+    return textwrap.shorten("".join(parts), width, placeholder=placeholder)
+
+
+def shorten_pretty(content, iter_chunks, width, placeholder="..."):
+    """
+    Pretty-print a string incrementally and shorten it like `shorten`,
+    pretty-printing only as much of it as the result needs.
+
+    If the printer reaches invalid input, the string is shortened as is.
+
+    >>> from ddrr.printers import iter_pretty_json
+    >>> shorten_pretty('[' + '"foo", ' * 100000 + ']', iter_pretty_json, 16)
+    '[ "foo",...'
+    >>> shorten_pretty('[1, 2 3]', iter_pretty_json, 20)
+    '[1, 2 3]'
+
+    :param content: String
+    :param iter_chunks: Incremental printer, see
+        `ddrr.printers.incremental_printer`
+    :param width: Maximum width of the result
+    :param placeholder: Appended to the result if truncated
+    :return: Shortened string
+    """
+    with stats.timed("pretty_print"):
+        try:
+            return shorten_chunks(iter_chunks(content), width, placeholder)
+        except ValueError:
+            pass
+    return shorten(content, width, placeholder=placeholder)
+
+
+def shorten_pretty_body(raw, iter_chunks, width, placeholder="..."):
+    """
+    Decode a body, pretty-print it incrementally and shorten it like
+    `shorten_pretty`, decoding and pretty-printing only as many bytes of it as
+    the result needs.
 
-PRETTY_PRINTERS = OrderedDict(
-    (
-        (r"/json", pretty_print_json),
-        (r"/xml", pretty_print_xml),
-    ),
-)
+    If the printer reaches invalid input, the body is shortened as is, like
+    `shorten_body`.
 
+    >>> from ddrr.printers import iter_pretty_json
+    >>> shorten_pretty_body(b'[' + b'"foo", ' * 100000 + b']',
+    ...                     iter_pretty_json, 16)
+    '[ "foo",...'
+    >>> shorten_pretty_body(b'<p>foo bar</p> ' * 100000, iter_pretty_json, 16)
+    '<p>foo...'
 
-def pretty_print(content, content_type):
-    for regex, handler in PRETTY_PRINTERS.items():
-        if re.search(regex, content_type):
-            return handler(content)
-    return content
+    :param raw: Body as bytes
+    :param iter_chunks: Incremental printer, see
+        `ddrr.printers.incremental_printer`
+    :param width: Maximum width of the result
+    :param placeholder: Appended to the result if truncated
+    :return: Shortened string
+    """
+    # a character is at most four bytes in UTF-8
+    size = width * 4 + SHORTEN_MARGIN
+    printed = ""
+    while size < len(raw):
+        previous = printed
+        printed = _print_prefix(
+            decode_body(raw[:size], final=False), iter_chunks
+        )
+        result = _shorten_words(printed.split(), width, placeholder)
+        if result is not None:
+            return result
+        if len(printed) == len(previous):
+            # nothing printed at all, like for HTML labelled as JSON, or
+            # twice the input didn't print any further, so the printer
+            # stopped at invalid input rather than at the end of the prefix
+            return shorten_body(raw, width, placeholder)
+        size *= 2
+    return shorten_pretty(decode_body(raw), iter_chunks, width, placeholder)
+
+
+def _print_prefix(content, iter_chunks):
+    # the document is cut at the end of the prefix, so the printer fails
+    # there, after printing everything before it
+    chunks = []
+    with stats.timed("pretty_print"):
+        try:
+            for chunk in iter_chunks(content):
+                chunks.append(chunk)
+        except ValueError:
+            pass
+    return "".join(chunks)
+
+
+def _shorten_words(words, width, placeholder):
+    # the words are taken from a prefix of the content, so the last one may
+    # have been cut.  if the ones before it are already too wide, the result
+    # is the same as for the entire content, otherwise more is needed.
+    text = " ".join(words[:-1])
+    if len(text) <= width:
+        return None
+    return textwrap.shorten(text, width, placeholder=placeholder)
+
+
+def render_body(
+    raw,
+    content_type,
+    *,
+    pretty=False,
+    limit=None,
+    pretty_max_size=PRETTY_PRINT_MAX_SIZE,
+):
+    """
+    Decode, optionally pretty-print and optionally shorten a body.
+
+    Bodies larger than `pretty_max_size` bytes are not pretty-printed, unless
+    they are shortened and their printer is incremental, in which case only
+    as much of the body as the result needs is decoded and pretty-printed.
+    When shortening without pretty-printing, only as much of the body as the
+    result needs is decoded.  Either way, the cost depends on `limit` rather
+    than the size of the body.
+
+    When `ddrr.cache.render_cache` is enabled, the result is cached.
+
+    >>> render_body(b'{"foo":"bar"}', "application/json", pretty=True)
+    '{\\n  "foo": "bar"\\n}'
+    >>> render_body(b'{"foo":"bar"}', "application/json", pretty=True,
+    ...             pretty_max_size=10)
+    '{"foo":"bar"}'
+
+    :param raw: Body as bytes
+    :param content_type: Content type of the body
+    :param pretty: Whether to pretty-print the body
+    :param limit: Maximum width of the result, or None
+    :param pretty_max_size: Maximum size of bodies to pretty-print, or None
+    :return: Body as string
+    """
+    if not render_cache.enabled:
+        return _render_body(raw, content_type, pretty, limit, pretty_max_size)
+    return render_cache.get_or_render(
+        raw,
+        (content_type, pretty, limit, pretty_max_size),
+        lambda: _render_body(
+            raw, content_type, pretty, limit, pretty_max_size
+        ),
+    )
+
+
+def _render_body(raw, content_type, pretty, limit, pretty_max_size):
+    if pretty and content_type:
+        iter_chunks = limit and incremental_printer(content_type)
+        if iter_chunks:
+            return shorten_pretty_body(raw, iter_chunks, limit)
+        if pretty_max_size is None or len(raw) <= pretty_max_size:
+            content = pretty_print(decode_body(raw), content_type)
+            if limit:
+                content = shorten(content, limit)
+            return content
+    if limit:
+        return shorten_body(raw, limit)
+    return decode_body(raw)
@@ -0,0 +1,41 @@
+"""
+Views exposing the instrumentation of the running server, see `ddrr.stats`.
+"""
+import os
+
+from django.conf import settings
+from django.http import Http404
+from django.http import JsonResponse
+
+from ddrr import stats
+from ddrr.cache import render_cache
+
+
+def stats_snapshot():
+    """
+    Return `ddrr.stats.snapshot()`, with the render cache's counters if it
+    is enabled and the process ID.
+
+    :return: Dictionary
+    """
+    snapshot = stats.snapshot()
+    if render_cache.enabled:
+        snapshot["render_cache"] = render_cache.info()
+    snapshot["pid"] = os.getpid()
+    return snapshot
+
+
+def stats_view(request):
+    """
+    Return the stats of the process serving the request as JSON.
+
+    Like other debugging tools, the view is only served to staff users and
+    to the addresses in `INTERNAL_IPS`, and raises Http404 for others.
+    """
+    user = getattr(request, "user", None)
+    if not (
+        (user is not None and user.is_staff)
+        or request.META.get("REMOTE_ADDR") in settings.INTERNAL_IPS
+    ):
+        raise Http404
+    return JsonResponse(stats_snapshot())
@@ -0,0 +1,66 @@
+"""
+Benchmark ASGI throughput through Django's in-process ASGI handler, with DDRR
+disabled, with DDRR forced to run as sync-only middleware (as before native
+async support) and with DDRR running natively async.
+"""
+import argparse
+import asyncio
+import time
+
+from ddrr.middleware import DebugRequestsResponses
+from tests.benchmarks.utils import setup
+from tests.benchmarks.utils import silence_handlers
+
+
+class SyncOnlyDebugRequestsResponses(DebugRequestsResponses):
+    async_capable = False
+
+
+MODES = {
+    "ddrr off": [],
+    "ddrr sync-only": [
+        "tests.benchmarks.bench_asgi.SyncOnlyDebugRequestsResponses"
+    ],
+    "ddrr async": ["ddrr.middleware.DebugRequestsResponses"],
+}
+
+
+async def run(client, path, requests, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await client.get(path)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    setup()
+    silence_handlers()
+    from django.test import AsyncClient
+    from django.test import override_settings
+
+    for path in ("/async", "/"):
+        for label, middleware in MODES.items():
+            with override_settings(MIDDLEWARE=middleware):
+                client = AsyncClient()
+                asyncio.run(run(client, path, 50, args.concurrency))
+                elapsed = asyncio.run(
+                    run(client, path, args.requests, args.concurrency)
+                )
+            print(
+                f"{path:<8} {label:<20} "
+                f"{args.requests / elapsed:>10,.0f} req/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
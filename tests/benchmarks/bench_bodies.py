@@ -0,0 +1,72 @@
+"""
+Benchmark rendering of JSON and XML bodies of various sizes, comparing the
+previous approach (decode and pretty-print everything, then shorten) with
+`ddrr.utils.render_body`.
+"""
+import argparse
+import json
+import textwrap
+
+from ddrr.utils import pretty_print
+from ddrr.utils import render_body
+from tests.benchmarks.utils import bench
+
+SIZES = {"1KB": 1024, "1MB": 1024 * 1024, "50MB": 50 * 1024 * 1024}
+
+
+def make_json(size):
+    item = {"id": 12345, "name": "Jane Doe", "tags": ["foo", "bar", "baz"]}
+    count = max(1, size // len(json.dumps(item)))
+    return json.dumps({"items": [item] * count}).encode()
+
+
+def make_xml(size):
+    item = "<item><id>12345</id><name>Jane Doe</name><tag>foo</tag></item>"
+    count = max(1, size // len(item))
+    return f"<items>{item * count}</items>".encode()
+
+
+def legacy_render(raw, content_type, *, pretty=False, limit=None):
+    try:
+        content = raw.decode("utf-8")
+    except UnicodeDecodeError:
+        content = str(raw)
+    if pretty:
+        content = pretty_print(content, content_type)
+    if limit:
+        content = textwrap.shorten(content, limit, placeholder="...")
+    return content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES))
+    parser.add_argument("--limit", type=int, default=1000)
+    args = parser.parse_args()
+
+    for size_label in args.sizes:
+        size = SIZES[size_label]
+        number = 1 if size > 1024 * 1024 else None
+        repeat = 1 if size > 1024 * 1024 else 5
+        for kind, make, content_type in (
+            ("json", make_json, "application/json"),
+            ("xml", make_xml, "application/xml"),
+        ):
+            raw = make(size)
+            for pretty in (False, True):
+                for label, render in (
+                    ("before", legacy_render),
+                    ("after", render_body),
+                ):
+                    bench(
+                        f"{size_label} {kind} pretty={pretty} {label}",
+                        lambda r=render, p=pretty: r(
+                            raw, content_type, pretty=p, limit=args.limit
+                        ),
+                        number=number,
+                        repeat=repeat,
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark deciding whether to log a request with 1, 10 and 50 path rules,
+comparing a chain of `ddrr.filters.PathFilter` logging filters, evaluated
+one regular expression at a time, with a compiled `ddrr.filters.FilterSet`,
+for literal and regular expression rules.
+"""
+import argparse
+
+from tests.benchmarks.utils import bench
+from tests.benchmarks.utils import setup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rules", nargs="+", type=int, default=[1, 10, 50])
+    args = parser.parse_args()
+
+    setup()
+    from django.test import RequestFactory
+
+    from ddrr.filters import FilterSet
+    from ddrr.filters import PathFilter
+    from ddrr.filters import passes
+
+    request = RequestFactory().get("/api/v1/users/12345")
+    for count in args.rules:
+        literal = [f"/excluded/{i}/" for i in range(count)]
+        regexes = [rf"/excluded/{i}/\d+" for i in range(count)]
+        for label, rules in [("literal", literal), ("regex", regexes)]:
+            # PathFilter keeps matching paths, so negative lookaheads make
+            # the chain exclude them like FilterSet does
+            chain = tuple(PathFilter(regex=f"(?!{rule})") for rule in rules)
+            filters = FilterSet(exclude_paths=rules)
+            assert passes(chain, request) and filters.keep_request(request)
+            bench(
+                f"{count} {label} rules PathFilter chain",
+                lambda: passes(chain, request),
+            )
+            bench(
+                f"{count} {label} rules FilterSet",
+                lambda: filters.keep_request(request),
+            )
+
+
+if __name__ == "__main__":
+    main()
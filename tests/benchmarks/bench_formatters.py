@@ -0,0 +1,98 @@
+"""
+Benchmark DDRR's formatters, comparing records per second with a cached
+(compiled once) template against compiling it on every record, and against
+the JSON lines formatters.
+"""
+from django.template import Template
+from django.test import RequestFactory
+
+from ddrr.formatters import DjangoTemplateRequestFormatter
+from ddrr.formatters import DjangoTemplateResponseFormatter
+from ddrr.formatters import JsonLinesRequestFormatter
+from ddrr.formatters import JsonLinesResponseFormatter
+from tests.benchmarks.utils import bench
+from tests.benchmarks.utils import make_record
+from tests.benchmarks.utils import setup
+
+
+class UncachedRequestFormatter(DjangoTemplateRequestFormatter):
+    @property
+    def template(self):
+        return Template(self.template_source)
+
+
+class UncachedResponseFormatter(DjangoTemplateResponseFormatter):
+    @property
+    def template(self):
+        return Template(self.template_source)
+
+
+def main():
+    setup()
+    from django.http import HttpResponse
+
+    request = RequestFactory().post(
+        "/foo/bar?baz=1",
+        data='{"foo": "bar"}',
+        content_type="application/json",
+        HTTP_X_REQUEST_ID="abc",
+    )
+    response = HttpResponse('{"foo": "bar"}', content_type="application/json")
+    request_record = make_record(request)
+    response_record = make_record(response)
+    kwargs = {"colors": False}
+
+    for label, formatter, record in (
+        (
+            "request, compiled per record",
+            UncachedRequestFormatter(
+                template_name="ddrr/default-request.html", **kwargs
+            ),
+            request_record,
+        ),
+        (
+            "request, cached",
+            DjangoTemplateRequestFormatter(
+                template_name="ddrr/default-request.html", **kwargs
+            ),
+            request_record,
+        ),
+        (
+            "request, cached with autoreload",
+            DjangoTemplateRequestFormatter(
+                template_name="ddrr/default-request.html",
+                autoreload=True,
+                **kwargs,
+            ),
+            request_record,
+        ),
+        (
+            "request, json lines",
+            JsonLinesRequestFormatter(),
+            request_record,
+        ),
+        (
+            "response, compiled per record",
+            UncachedResponseFormatter(
+                template_name="ddrr/default-response.html", **kwargs
+            ),
+            response_record,
+        ),
+        (
+            "response, cached",
+            DjangoTemplateResponseFormatter(
+                template_name="ddrr/default-response.html", **kwargs
+            ),
+            response_record,
+        ),
+        (
+            "response, json lines",
+            JsonLinesResponseFormatter(),
+            response_record,
+        ),
+    ):
+        bench(label, lambda f=formatter, r=record: f.format(r))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark collecting request and response headers with 10, 50 and 200
+headers, comparing the previous approach (Django's request.headers, then an
+OrderedDict with a SPECIAL_HEADERS lookup per header) with `ddrr.headers`.
+"""
+import argparse
+from collections import OrderedDict
+
+from tests.benchmarks.utils import bench
+from tests.benchmarks.utils import setup
+
+
+def legacy_collect_request_headers(request):
+    from ddrr.headers import SPECIAL_HEADERS
+
+    headers = dict(request.headers.items())
+    out_headers = OrderedDict()
+    for header, value in headers.items():
+        header = SPECIAL_HEADERS.get(header.lower(), header)
+        out_headers[header] = value
+    if out_headers.get("Content-Length") == "":
+        del out_headers["Content-Length"]
+    return out_headers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--headers", nargs="+", type=int, default=[10, 50, 200]
+    )
+    args = parser.parse_args()
+
+    setup()
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+
+    from ddrr.headers import collect_request_headers
+    from ddrr.headers import collect_response_headers
+
+    for count in args.headers:
+        extra = {f"HTTP_X_BENCHMARK_{i}": f"value-{i}" for i in range(count)}
+        request = RequestFactory().get("/", **extra)
+        response = HttpResponse()
+        for i in range(count):
+            response[f"X-Benchmark-{i}"] = f"value-{i}"
+        bench(
+            f"request, {count} headers, before",
+            lambda: legacy_collect_request_headers(request),
+        )
+        bench(
+            f"request, {count} headers, after",
+            lambda: collect_request_headers(request),
+        )
+        bench(
+            f"response, {count} headers",
+            lambda: collect_response_headers(response),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Benchmark the per-request overhead of the DDRR middleware, driven through
+Django's RequestFactory with request and response bodies of various sizes,
+header counts and content types, and streaming and non-streaming responses.
+
+Each case is timed with DDRR off (the view is called directly), with the
+default templates, with pretty-printing, and with tail-based logging of 5xx
+responses only, so that nothing is logged, and the overhead relative to DDRR
+off is reported.  Results can be saved with `--save` and compared to a
+previous run with `--compare`, which exits with status 1 if any case got
+slower by more than `--tolerance`.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import random
+import sys
+
+from tests.benchmarks.utils import measure
+from tests.benchmarks.utils import setup
+from tests.benchmarks.utils import silence_handlers
+
+SIZES = {"1KB": 1024, "64KB": 64 * 1024, "1MB": 1024 * 1024}
+KINDS = ("json", "xml", "binary")
+MODES = ("off", "default", "pretty", "tail")
+CONTENT_TYPES = {
+    "json": "application/json",
+    "xml": "application/xml",
+    "binary": "application/pdf",
+}
+CHUNK_SIZE = 8192
+
+
+def make_json(size):
+    item = {"id": 12345, "name": "Jane Doe", "tags": ["foo", "bar", "baz"]}
+    count = max(1, size // len(json.dumps(item)))
+    return json.dumps({"items": [item] * count}).encode()
+
+
+def make_xml(size):
+    item = "<item><id>12345</id><name>Jane Doe</name><tag>foo</tag></item>"
+    count = max(1, size // len(item))
+    return f"<items>{item * count}</items>".encode()
+
+
+def make_binary(size):
+    # like the example project's pdf_file view: a PDF header, then bytes
+    # which aren't valid UTF-8, the same on every run (randbytes() would
+    # need Python 3.9)
+    bits = random.Random(size).getrandbits(size * 8)
+    return b"%PDF-1.4\n" + bits.to_bytes(size, "little")
+
+
+MAKERS = {"json": make_json, "xml": make_xml, "binary": make_binary}
+
+
+def make_headers(count):
+    return {f"HTTP_X_BENCHMARK_{i}": f"value-{i}" for i in range(count)}
+
+
+def make_view(body, content_type, streaming):
+    from django.http import HttpResponse
+    from django.http import StreamingHttpResponse
+
+    if streaming:
+        starts = range(0, len(body), CHUNK_SIZE)
+        ends = range(CHUNK_SIZE, len(body) + CHUNK_SIZE, CHUNK_SIZE)
+        chunks = [body[start:end] for start, end in zip(starts, ends)]
+        return lambda request: StreamingHttpResponse(
+            iter(chunks), content_type=content_type
+        )
+    return lambda request: HttpResponse(body, content_type=content_type)
+
+
+def make_case(mode, kind, size, headers, streaming):
+    from django.test import RequestFactory
+
+    from ddrr.middleware import DebugRequestsResponses
+
+    body = MAKERS[kind](size)
+    content_type = CONTENT_TYPES[kind]
+    view = make_view(body, content_type, streaming)
+    handler = view if mode == "off" else DebugRequestsResponses(view)
+    factory = RequestFactory()
+    extra = make_headers(headers)
+
+    def run():
+        request = factory.post(
+            "/benchmark", data=body, content_type=content_type, **extra
+        )
+        response = handler(request)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        response.close()
+
+    return run
+
+
+@contextlib.contextmanager
+def pretty_printing(enabled):
+    """
+    Enable pretty-printing on the formatters of the DDRR log handlers.
+    """
+    from ddrr.loggers import request_logger
+    from ddrr.loggers import response_logger
+
+    formatters = [
+        handler.formatter
+        for logger in (request_logger, response_logger)
+        for handler in logger.handlers
+    ]
+    previous = [formatter.pretty for formatter in formatters]
+    for formatter in formatters:
+        formatter.pretty = enabled
+    try:
+        yield
+    finally:
+        for formatter, pretty in zip(formatters, previous):
+            formatter.pretty = pretty
+
+
+@contextlib.contextmanager
+def tail_based(enabled):
+    """
+    Only log exchanges with 5xx responses, which the benchmark views never
+    return.
+    """
+    from ddrr.middleware import options
+    from ddrr.sampling import Triggers
+
+    previous = options.triggers
+    if enabled:
+        options.triggers = Triggers(status_codes=["5xx"])
+    try:
+        yield
+    finally:
+        options.triggers = previous
+
+
+def run_benchmarks(args):
+    results = {}
+    cases = itertools.product(
+        args.kinds, args.sizes, args.headers, args.streaming
+    )
+    for kind, size_label, headers, streaming in cases:
+        size = SIZES[size_label]
+        number = 5 if size >= 1024 * 1024 else None
+        name = (
+            f"{kind} {size_label} {headers} headers"
+            f"{' streaming' if streaming else ''}"
+        )
+        baseline = None
+        for mode in args.modes:
+            run = make_case(mode, kind, size, headers, streaming)
+            with pretty_printing(mode == "pretty"), tail_based(mode == "tail"):
+                best = measure(run, number=number, repeat=args.repeat)
+            if mode == "off":
+                baseline = best
+            overhead = ""
+            if baseline is not None and mode != "off":
+                overhead = f"{(best - baseline) * 1e6:>+12.1f} us overhead"
+            print(
+                f"{name:<36} {mode:<8} {best * 1e6:>12.1f} us/req {overhead}"
+            )
+            results[f"{name} {mode}"] = best
+    return results
+
+
+def compare(results, path, tolerance):
+    with open(path) as f:
+        previous = json.load(f)
+    regressions = 0
+    for name, best in results.items():
+        before = previous.get(name)
+        if before is None:
+            continue
+        change = best / before - 1
+        if change > tolerance:
+            regressions += 1
+            print(f"REGRESSION {name}: {change:+.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--kinds", nargs="+", default=list(KINDS))
+    parser.add_argument("--sizes", nargs="+", default=["1KB", "64KB"])
+    parser.add_argument("--headers", nargs="+", type=int, default=[10, 50])
+    parser.add_argument(
+        "--streaming",
+        nargs="+",
+        type=lambda value: value == "yes",
+        default=[False, True],
+        help="'yes' and/or 'no'",
+    )
+    parser.add_argument("--modes", nargs="+", default=list(MODES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="save results to this JSON file")
+    parser.add_argument("--compare", help="compare with saved results")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    setup()
+    silence_handlers()
+    results = run_benchmarks(args)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
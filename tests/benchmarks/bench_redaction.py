@@ -0,0 +1,79 @@
+"""
+Benchmark decoding JSON bodies of various sizes with and without redaction
+of a few keys, fields and patterns, to show that its cost stays linear in
+the size of the body, and rendering them pretty-printed and shortened, to
+show that it then only depends on the limit.
+"""
+import argparse
+import json
+
+from ddrr.redaction import REPLACEMENT
+from ddrr.redaction import redactor
+from ddrr.utils import decode_body
+from ddrr.utils import render_body
+from tests.benchmarks.utils import measure
+
+SIZES = {
+    "1KB": 1024,
+    "100KB": 100 * 1024,
+    "1MB": 1024 * 1024,
+    "10MB": 10 * 1024 * 1024,
+}
+
+
+def make_json(size):
+    item = {
+        "id": 12345,
+        "name": "Jane Doe",
+        "password": "hunter2",
+        "access_token": "abcdef0123456789",
+        "card": "1234-5678-1234-5678",
+        "tags": ["foo", "bar"],
+    }
+    count = max(1, size // len(json.dumps(item)))
+    return json.dumps({"items": [item] * count}).encode()
+
+
+def configure(active):
+    redactor.configure(
+        headers=(),
+        json_keys=["password", "secret", "*_token"] if active else (),
+        form_fields=["password"] if active else (),
+        patterns=[r"\b\d{4}(?:-\d{4}){3}\b"] if active else (),
+        replacement=REPLACEMENT,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES))
+    parser.add_argument(
+        "--limit", type=int, default=200, help="LIMIT_BODY to render with"
+    )
+    args = parser.parse_args()
+
+    def render():
+        return render_body(
+            raw, "application/json", pretty=True, limit=args.limit
+        )
+
+    for size_label in args.sizes:
+        raw = make_json(SIZES[size_label])
+        times = {}
+        for active in (False, True):
+            configure(active)
+            times[active] = measure(lambda: decode_body(raw), repeat=3)
+        rendered = measure(render, repeat=3)
+        configure(False)
+        mb = len(raw) / (1024 * 1024)
+        print(
+            f"{size_label:<8}"
+            f" plain {times[False] * 1e6:>12.1f} us"
+            f" redacted {times[True] * 1e6:>12.1f} us"
+            f" redaction {(times[True] - times[False]) / mb * 1e3:>8.1f} ms/MB"
+            f" limited {rendered * 1e6:>8.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
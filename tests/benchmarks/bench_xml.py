@@ -0,0 +1,100 @@
+"""
+Benchmark pretty-printing of XML documents of various sizes with lxml,
+minidom and `ddrr.printers.iter_pretty_xml`, both in full and shortened to
+`--limit` characters like `LIMIT_BODY` does.
+"""
+import argparse
+from xml.dom import minidom
+
+from ddrr.printers import iter_pretty_xml
+from ddrr.utils import shorten
+from ddrr.utils import shorten_pretty
+from tests.benchmarks.utils import bench
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+SIZES = {
+    "100KB": 100 * 1024,
+    "10MB": 10 * 1024 * 1024,
+    "100MB": 100 * 1024 * 1024,
+}
+
+
+def make_soap(size):
+    item = (
+        '<m:Item id="12345"><m:Name>Jane Doe</m:Name>'
+        "<m:Tag>foo</m:Tag><m:Tag>bar</m:Tag></m:Item>"
+    )
+    count = max(1, size // len(item))
+    return (
+        '<?xml version="1.0"?>'
+        '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">'
+        '<soap:Body><m:Items xmlns:m="urn:example">'
+        f"{item * count}"
+        "</m:Items></soap:Body></soap:Envelope>"
+    )
+
+
+def pretty_print_lxml(content):
+    parser = etree.XMLParser(remove_blank_text=True)
+    tree = etree.fromstring(content.encode(), parser)
+    return etree.tostring(tree, encoding=str, pretty_print=True)
+
+
+def pretty_print_minidom(content):
+    return minidom.parseString(content).toprettyxml(indent="  ")
+
+
+def pretty_print_incremental(content):
+    return "".join(iter_pretty_xml(content))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES))
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument(
+        "--skip-minidom",
+        action="store_true",
+        help="skip minidom, which needs several GB of memory for 100MB",
+    )
+    args = parser.parse_args()
+
+    printers = {}
+    if etree:
+        printers["lxml"] = pretty_print_lxml
+    if not args.skip_minidom:
+        printers["minidom"] = pretty_print_minidom
+    printers["incremental"] = pretty_print_incremental
+
+    for size_label in args.sizes:
+        size = SIZES[size_label]
+        number = 1 if size > 1024 * 1024 else None
+        repeat = 1 if size > 1024 * 1024 else 5
+        content = make_soap(size)
+        for label, printer in printers.items():
+            bench(
+                f"{size_label} {label}",
+                lambda p=printer: p(content),
+                number=number,
+                repeat=repeat,
+            )
+            bench(
+                f"{size_label} {label} limit={args.limit}",
+                lambda p=printer: shorten(p(content), args.limit),
+                number=number,
+                repeat=repeat,
+            )
+        bench(
+            f"{size_label} incremental shortened limit={args.limit}",
+            lambda: shorten_pretty(content, iter_pretty_xml, args.limit),
+            number=number,
+            repeat=repeat,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Helpers shared by the standalone benchmark scripts in this directory.
+
+Run a benchmark from the repository root, e.g.:
+
+    python -m tests.benchmarks.bench_formatters
+"""
+import logging
+import os
+import timeit
+
+
+def setup():
+    """
+    Configure Django using the test settings, unless already configured.
+    """
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+    import django
+
+    django.setup()
+
+
+def silence_handlers():
+    """
+    Point the stream handlers of the DDRR loggers at os.devnull, so that
+    benchmarks measure formatting without flooding the terminal.
+    """
+    from ddrr.loggers import request_logger
+    from ddrr.loggers import response_logger
+
+    devnull = open(os.devnull, "w")
+    for logger in (request_logger, response_logger):
+        for handler in logger.handlers:
+            if isinstance(handler, logging.StreamHandler):
+                handler.setStream(devnull)
+
+
+def make_record(msg):
+    """
+    Create a log record with `msg` as its message, like the DDRR loggers do.
+    """
+    return logging.makeLogRecord({"msg": msg, "levelno": logging.DEBUG})
+
+
+def measure(func, *, number=None, repeat=5):
+    """
+    Time `func` and return the best time per call in seconds.
+
+    :param func: Callable taking no arguments
+    :param number: Calls per repetition, determined automatically if None
+    :param repeat: Number of repetitions
+    :return: Best time per call in seconds
+    """
+    timer = timeit.Timer(func)
+    if number is None:
+        number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def bench(label, func, *, number=None, repeat=5):
+    """
+    Time `func` and print the best result as operations per second.
+
+    :param label: Label to print
+    :param func: Callable taking no arguments
+    :param number: Calls per repetition, determined automatically if None
+    :param repeat: Number of repetitions
+    :return: Best time per call in seconds
+    """
+    best = measure(func, number=number, repeat=repeat)
+    print(f"{label:<56} {1 / best:>12,.0f} ops/s {best * 1e6:>12.1f} us/op")
+    return best
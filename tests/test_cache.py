@@ -0,0 +1,98 @@
+import sys
+
+import pytest
+from django.core.management import call_command
+
+from ddrr import cache as cache_module
+from ddrr.cache import RenderCache
+from ddrr.cache import render_cache
+from ddrr.utils import render_body
+
+
+@pytest.fixture
+def cached():
+    render_cache.configure(1024 * 1024)
+    yield render_cache
+    render_cache.configure(0)
+
+
+def test_disabled_cache_always_renders(mocker):
+    """
+    A cache of size 0 renders every body.
+    """
+    render = mocker.Mock(return_value="foo")
+    cache = RenderCache()
+    cache.get_or_render(b"foo", (), render)
+    cache.get_or_render(b"foo", (), render)
+    assert render.call_count == 2
+    assert cache.info()["entries"] == 0
+
+
+def test_cache_is_keyed_on_body_and_options(mocker):
+    """
+    Bodies are rendered once per distinct body and options.
+    """
+    render = mocker.Mock(return_value="foo")
+    cache = RenderCache(max_size=1024)
+    for raw, options in [
+        (b"foo", ("text/plain", True)),
+        (b"foo", ("text/plain", True)),
+        (b"bar", ("text/plain", True)),
+        (b"foo", ("text/plain", False)),
+    ]:
+        cache.get_or_render(raw, options, render)
+    assert render.call_count == 3
+    assert cache.info()["hits"] == 1
+    assert cache.info()["misses"] == 3
+
+
+def test_cache_evicts_least_recently_used():
+    """
+    The least recently used bodies are evicted when the cache is full.
+    """
+    content_size = sys.getsizeof("x" * 100)
+    cache = RenderCache(max_size=content_size * 2)
+    cache.get_or_render(b"a", (), lambda: "a" * 100)
+    cache.get_or_render(b"b", (), lambda: "b" * 100)
+    cache.get_or_render(b"a", (), lambda: "")
+    cache.get_or_render(b"c", (), lambda: "c" * 100)
+    assert cache.get_or_render(b"a", (), lambda: "") == "a" * 100
+    assert cache.get_or_render(b"b", (), lambda: "") == ""
+    assert cache.info()["size"] <= content_size * 2
+
+
+def test_cache_skips_large_bodies(mocker):
+    """
+    Bodies larger than MAX_BODY_SIZE, and renderings larger than the cache,
+    are not cached.
+    """
+    mocker.patch.object(cache_module, "MAX_BODY_SIZE", 10)
+    cache = RenderCache(max_size=100)
+    cache.get_or_render(b"x" * 11, (), lambda: "x")
+    cache.get_or_render(b"y", (), lambda: "y" * 1000)
+    assert cache.info()["entries"] == 0
+
+
+def test_render_body_uses_cache(cached, mocker):
+    """
+    render_body renders repeated bodies once.
+    """
+    pretty_print = mocker.patch(
+        "ddrr.utils.pretty_print", return_value="pretty"
+    )
+    for _ in range(3):
+        assert (
+            render_body(b'{"foo": 1}', "application/json", pretty=True)
+            == "pretty"
+        )
+    assert render_body(b'{"foo": 1}', "application/json") == '{"foo": 1}'
+    assert pretty_print.call_count == 1
+    assert cached.info()["hits"] == 2
+
+
+def test_ddrr_stats_command_reports_cache(cached, capsys):
+    """
+    The ddrr_stats command reports the hits and misses of the cache.
+    """
+    call_command("ddrr_stats", "/", requests=2, benchmark=True)
+    assert "render cache:" in capsys.readouterr().out
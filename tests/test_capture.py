@@ -0,0 +1,196 @@
+import json
+import multiprocessing
+import os
+import threading
+
+import pytest
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.urls import reverse
+
+from ddrr.capture import CaptureHandler
+from ddrr.capture import CaptureStore
+from ddrr.exchange import Exchange
+from ddrr.loggers import response_logger
+from ddrr.middleware import options
+from ddrr.pipeline import LoggingPipeline
+from ddrr.snapshots import RequestSnapshot
+from ddrr.snapshots import ResponseSnapshot
+
+
+def append(store, rf, path, status=200, body=b"", content=b"", duration=1):
+    request = rf.post(path, data=body, content_type="application/json")
+    exchange = Exchange.begin(request, ())
+    response = HttpResponse(content, status=status)
+    exchange.finish(response)
+    exchange.duration = duration / 1000
+    return store.append(
+        RequestSnapshot.capture(request), ResponseSnapshot.capture(response)
+    )
+
+
+def test_store_appends_and_loads_exchanges(tmp_path, rf):
+    """
+    Exchanges are loaded as they were appended, with their bodies.
+    """
+    store = CaptureStore(tmp_path)
+    append(store, rf, "/foo?bar=1", body=b'{"foo": 1}', content=b"bar")
+    (entry,) = store.query()
+    assert entry["method"] == "POST"
+    assert entry["path"] == "/foo"
+    exchange = store.load(entry)
+    assert exchange["request"]["query_string"] == "bar=1"
+    assert exchange["request"]["body"] == b'{"foo": 1}'
+    assert exchange["response"]["body"] == b"bar"
+    assert exchange["response"]["status_code"] == 200
+
+
+def test_store_deduplicates_bodies(tmp_path, rf):
+    """
+    Identical bodies are stored once.
+    """
+    store = CaptureStore(tmp_path)
+    for _ in range(3):
+        append(store, rf, "/", content=b"same" * 100)
+    db = store._connect()
+    assert db.execute("SELECT COUNT(*) FROM bodies").fetchone()[0] == 1
+    assert all(
+        store.load(entry)["response"]["body"] == b"same" * 100
+        for entry in store.query()
+    )
+
+
+def test_store_starts_new_segments(tmp_path, rf):
+    """
+    A new segment is started once a segment reaches `segment_size`.
+    """
+    store = CaptureStore(tmp_path, segment_size=1000)
+    for i in range(10):
+        append(store, rf, f"/{i}")
+    segments = sorted(
+        name for name in os.listdir(tmp_path) if name.startswith("segment-")
+    )
+    assert len(segments) > 1
+    assert [store.load(e)["request"]["path"] for e in store.query()] == [
+        f"/{i}" for i in reversed(range(10))
+    ]
+
+
+def append_from_worker(directory, worker, rf):
+    store = CaptureStore(directory, segment_size=5000)
+    for i in range(50):
+        append(store, rf, f"/{worker}/{i}", content=f"{worker}/{i}".encode())
+    store.close()
+
+
+def test_store_is_shared_by_worker_processes(tmp_path, rf):
+    """
+    Worker processes forked after the store was opened append to it
+    concurrently without their exchanges overlapping.
+    """
+    store = CaptureStore(tmp_path, segment_size=5000)
+    append(store, rf, "/parent")
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=append_from_worker, args=(tmp_path, i, rf))
+        for i in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+    entries = store.query()
+    assert len(entries) == 201
+    for entry in entries:
+        exchange = store.load(entry)
+        path = exchange["request"]["path"]
+        assert path == entry["path"]
+        if path != "/parent":
+            assert exchange["response"]["body"] == path[1:].encode()
+
+
+def test_store_queries(tmp_path, rf):
+    """
+    Exchanges can be queried by path prefix, method, status and duration.
+    """
+    store = CaptureStore(tmp_path)
+    append(store, rf, "/api/a", status=200, duration=10)
+    append(store, rf, "/api/b", status=502, duration=30)
+    append(store, rf, "/api/c", status=500, duration=20)
+    append(store, rf, "/other", status=500, duration=40)
+
+    def paths(**kwargs):
+        return [entry["path"] for entry in store.query(**kwargs)]
+
+    assert paths(path="/api/", status="5xx") == ["/api/c", "/api/b"]
+    assert paths(path="/api/", slowest=2) == ["/api/b", "/api/c"]
+    assert paths(status=500, min_duration=30) == ["/other"]
+    assert paths(method="get") == []
+    assert paths(limit=1) == ["/other"]
+
+
+@pytest.fixture
+def capture(tmp_path):
+    store = CaptureStore(tmp_path)
+    handler = CaptureHandler(store)
+    response_logger.addHandler(handler)
+    options.capture_exchanges = True
+    options.refresh()
+    yield store
+    options.capture_exchanges = False
+    response_logger.removeHandler(handler)
+    handler.close()
+    options.refresh()
+
+
+def test_middleware_captures_exchanges(client, capture):
+    """
+    With a capture handler, the middleware captures each exchange.
+    """
+    client.post(reverse("echo"), data="foo", content_type="text/plain")
+    (entry,) = capture.query()
+    exchange = capture.load(entry)
+    assert exchange["request"]["body"] == b"foo"
+    assert exchange["response"]["body"] == b"foo"
+    assert exchange["request_id"]
+
+
+def test_exchanges_are_captured_on_the_pipeline_thread(
+    client, capture, mocker
+):
+    """
+    When the pipeline is running, exchanges are appended to the store on its
+    background thread.
+    """
+    threads = []
+    store_append = capture.append
+
+    def append(request, response):
+        threads.append(threading.current_thread().name)
+        return store_append(request, response)
+
+    mocker.patch.object(capture, "append", append)
+    pipeline = LoggingPipeline()
+    mocker.patch("ddrr.middleware.pipeline", pipeline)
+    pipeline.start()
+    client.get(reverse("index"))
+    pipeline.flush(timeout=5)
+    pipeline.stop()
+    assert threads == ["ddrr-pipeline"]
+    assert len(capture.query()) == 1
+
+
+def test_ddrr_query_command(client, capture, capsys):
+    """
+    The ddrr_query command lists the matching exchanges.
+    """
+    client.get(reverse("index"))
+    client.post(reverse("echo"), data="foo", content_type="text/plain")
+    call_command("ddrr_query", dir=capture.directory, path="/ec")
+    output = capsys.readouterr().out
+    assert "/echo" in output
+    assert " GET " not in output
+    call_command("ddrr_query", dir=capture.directory, method="GET", full=True)
+    (line,) = capsys.readouterr().out.splitlines()
+    assert json.loads(line)["response"]["body"] == "Welcome!"
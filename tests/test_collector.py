@@ -0,0 +1,168 @@
+import json
+import logging
+import multiprocessing
+import sys
+import time
+
+import pytest
+from django.http import HttpResponse
+
+from ddrr.collector import Collector
+from ddrr.collector import CollectorHandler
+from ddrr.collector import forward_to_collector
+from ddrr.collector import restore_local_handlers
+from ddrr.formatters import JsonLinesRequestFormatter
+from ddrr.formatters import JsonLinesResponseFormatter
+from ddrr.loggers import request_logger
+from ddrr.loggers import response_logger
+from ddrr.snapshots import ResponseSnapshot
+
+WORKERS = 4
+RECORDS = 50
+# larger than PIPE_BUF, so that unsynchronised writes could interleave
+LINES = 100
+
+
+@pytest.fixture
+def collector(tmp_path):
+    collector = Collector(str(tmp_path / "ddrr.sock"))
+    collector.start()
+    yield collector
+    collector.stop()
+
+
+@pytest.fixture
+def collected():
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = logging.getLogger("ddrr-collector-test")
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    yield records
+    logger.removeHandler(handler)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def send(address, record):
+    handler = CollectorHandler(address)
+    handler.handle(record)
+    handler.close()
+
+
+def run_worker(address, worker):
+    # the collector writes to the file, the worker only forwards records
+    logger = logging.getLogger("ddrr-collector-worker")
+    logger.handlers = [CollectorHandler(address)]
+    logger.propagate = False
+    for i in range(RECORDS):
+        lines = [f"worker={worker} record={i} line={n}" for n in range(LINES)]
+        logger.warning("\n".join(lines))
+    logger.handlers[0].close()
+
+
+def test_collector_writes_records_of_workers_whole(collector, tmp_path):
+    """
+    Records forwarded by several worker processes are written one at a
+    time, never interleaved.
+    """
+    path = tmp_path / "ddrr.log"
+    handler = logging.FileHandler(path)
+    logger = logging.getLogger("ddrr-collector-worker")
+    logger.addHandler(handler)
+    context = multiprocessing.get_context("fork")
+    workers = [
+        context.Process(target=run_worker, args=(collector.address, i))
+        for i in range(WORKERS)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+            assert worker.exitcode == 0
+        expected = WORKERS * RECORDS * LINES
+        wait_for(lambda: len(path.read_text().splitlines()) == expected)
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+    lines = path.read_text().splitlines()
+    seen = set()
+    for start in range(0, len(lines), LINES):
+        record = lines[start : start + LINES]  # noqa: E203
+        prefix = record[0].rpartition(" ")[0]
+        assert record == [f"{prefix} line={n}" for n in range(LINES)]
+        seen.add(prefix)
+    assert len(seen) == WORKERS * RECORDS
+
+
+def test_requests_and_responses_are_forwarded_as_snapshots(
+    collector, collected, rf
+):
+    """
+    Requests and responses are formatted in the collector from snapshots.
+    """
+    request = rf.post("/foo?bar=1", data=b"baz", content_type="text/plain")
+    response = HttpResponse(b"qux", status=201)
+    for msg, extra in [(request, {}), (response, {"ddrr_request": request})]:
+        record = logging.makeLogRecord(
+            {
+                "name": "ddrr-collector-test",
+                "levelno": logging.DEBUG,
+                "msg": msg,
+                **extra,
+            }
+        )
+        send(collector.address, record)
+    wait_for(lambda: len(collected) == 2)
+
+    request_data = json.loads(JsonLinesRequestFormatter().format(collected[0]))
+    assert request_data["path"] == "/foo"
+    assert request_data["query_string"] == "?bar=1"
+    assert request_data["body"] == "baz"
+    assert isinstance(collected[1].msg, ResponseSnapshot)
+    response_data = json.loads(
+        JsonLinesResponseFormatter().format(collected[1])
+    )
+    assert response_data["status_code"] == 201
+    assert response_data["content"] == "qux"
+    assert collected[1].ddrr_request.path == "/foo"
+
+
+def test_exceptions_are_forwarded_as_text(collector, collected):
+    try:
+        raise ValueError("foo")
+    except ValueError:
+        record = logging.getLogger("ddrr-collector-test").makeRecord(
+            "ddrr-collector-test",
+            logging.ERROR,
+            __file__,
+            0,
+            "bar",
+            None,
+            sys.exc_info(),
+        )
+    send(collector.address, record)
+    wait_for(lambda: collected)
+    assert collected[0].exc_info is None
+    assert "ValueError: foo" in collected[0].exc_text
+
+
+def test_forwarding_replaces_and_restores_handlers():
+    request_handlers = request_logger.handlers[:]
+    response_handlers = response_logger.handlers[:]
+    handler = forward_to_collector("/nonexistent.sock")
+    try:
+        assert request_logger.handlers == [handler]
+        assert response_logger.handlers == [handler]
+    finally:
+        restore_local_handlers()
+    assert request_logger.handlers == request_handlers
+    assert response_logger.handlers == response_handlers
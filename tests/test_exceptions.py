@@ -0,0 +1,121 @@
+import json
+import pickle
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+
+import ddrr.exceptions
+from ddrr.exceptions import ExceptionCapture
+from ddrr.formatters import DjangoTemplateResponseFormatter
+from ddrr.formatters import JsonLinesResponseFormatter
+from ddrr.loggers import response_logger
+from ddrr.middleware import options
+
+
+@pytest.fixture
+def error_client():
+    return Client(raise_request_exception=False)
+
+
+@pytest.fixture
+def capture_locals():
+    options.exception_locals_size = 20
+    yield
+    options.exception_locals_size = None
+
+
+def ddrr_records(caplog):
+    return [r for r in caplog.records if r.name.startswith("ddrr")]
+
+
+def make_capture(locals_size=None):
+    try:
+        items = list(range(1000))  # noqa: F841
+        raise ValueError("foo")
+    except ValueError as e:
+        return ExceptionCapture(e, locals_size=locals_size)
+
+
+def test_exception_is_logged_with_response(error_client, caplog):
+    """
+    The exception raised by the view is logged with its error response,
+    which is correlated with the request by its request ID.
+    """
+    error_client.get(reverse("error"))
+    request_record, response_record = ddrr_records(caplog)
+    formatter = DjangoTemplateResponseFormatter(
+        template_name="ddrr/default-response.html", colors=False
+    )
+    output = formatter.format(response_record)
+    assert "500 Internal Server Error" in output
+    assert "Traceback (most recent call last):" in output
+    assert "ValueError: Oops, 1000 items" in output
+    assert (
+        response_record.msg.ddrr_exchange.request_id
+        == request_record.msg.ddrr_exchange.request_id
+    )
+
+
+def test_exception_in_json_lines(error_client, caplog):
+    error_client.get(reverse("error"))
+    data = json.loads(
+        JsonLinesResponseFormatter().format(ddrr_records(caplog)[1])
+    )
+    assert data["exception"]["type"] == "ValueError"
+    assert data["exception"]["message"] == "Oops, 1000 items"
+    assert data["exception"]["traceback"].endswith(
+        "ValueError: Oops, 1000 items"
+    )
+    assert data["exception"]["locals"] is None
+
+
+def test_no_exception_in_json_lines(client, caplog):
+    client.get(reverse("index"))
+    data = json.loads(JsonLinesResponseFormatter().format(caplog.records[1]))
+    assert data["exception"] is None
+
+
+def test_locals_are_captured(error_client, caplog, capture_locals):
+    error_client.get(reverse("error"))
+    frame = ddrr_records(caplog)[1].msg.ddrr_exchange.exception.locals[-1]
+    assert frame["function"] == "error"
+    assert frame["locals"]["items"] == "[0, 1, 2, 3, 4, 5..."
+    assert all(len(value) <= 20 for value in frame["locals"].values())
+
+
+def test_nothing_is_formatted_unless_responses_are_logged(
+    error_client, capture_locals, mocker
+):
+    """
+    Neither the traceback nor the locals are formatted when the response
+    record would be dropped.
+    """
+    format_exception = mocker.spy(
+        ddrr.exceptions.traceback, "format_exception"
+    )
+    response_logger.disabled = True
+    options.refresh()
+    try:
+        response = error_client.get(reverse("error"))
+    finally:
+        response_logger.disabled = False
+        options.refresh()
+    capture = response.ddrr_exchange.exception
+    assert isinstance(capture.exception, ValueError)
+    assert capture.locals is None
+    assert "traceback" not in capture.__dict__
+    format_exception.assert_not_called()
+
+
+def test_capture_pickles_formatted_traceback():
+    """
+    Pickled captures keep the formatted traceback instead of the exception.
+    """
+    capture = make_capture(locals_size=10)
+    unpickled = pickle.loads(pickle.dumps(capture))
+    assert unpickled.exception is None
+    assert unpickled.type == "ValueError"
+    assert unpickled.message == "foo"
+    assert unpickled.traceback == capture.traceback
+    assert unpickled.locals == capture.locals
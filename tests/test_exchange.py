@@ -0,0 +1,141 @@
+import json
+import logging
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.urls import reverse
+
+from ddrr.exchange import Exchange
+from ddrr.exchange import request_id_keys
+from ddrr.formatters import CombinedFormatter
+from ddrr.formatters import DjangoTemplateRequestFormatter
+from ddrr.formatters import DjangoTemplateResponseFormatter
+from ddrr.formatters import JsonLinesCombinedFormatter
+from ddrr.formatters import JsonLinesRequestFormatter
+from ddrr.formatters import JsonLinesResponseFormatter
+from ddrr.records import RequestLogRecord
+from ddrr.records import ResponseLogRecord
+from ddrr.snapshots import RequestSnapshot
+
+
+def test_exchange_propagates_request_id(rf):
+    """
+    Exchange uses the request ID from the first request ID header present.
+    """
+    request = rf.get("/", HTTP_X_CORRELATION_ID="foo")
+    exchange = Exchange.begin(request, request_id_keys())
+    assert exchange.request_id == "foo"
+    assert request.ddrr_exchange is exchange
+
+
+def test_exchange_generates_request_id(rf):
+    """
+    Exchange generates a request ID if the request has none.
+    """
+    first = Exchange.begin(rf.get("/"), request_id_keys())
+    second = Exchange.begin(rf.get("/"), request_id_keys())
+    assert first.request_id
+    assert first.request_id != second.request_id
+
+
+def test_exchange_measures_time(rf):
+    """
+    Exchange measures wall and CPU time until it is finished.
+    """
+    exchange = Exchange.begin(rf.get("/"), request_id_keys())
+    assert exchange.duration_ms is None
+    response = HttpResponse()
+    exchange.finish(response)
+    assert exchange.duration_ms >= 0
+    assert exchange.cpu_time_ms >= 0
+    assert response.ddrr_exchange is exchange
+
+
+def test_records_are_correlated(client, caplog):
+    """
+    Request and response records share the request ID of their exchange.
+    """
+    client.get(reverse("index"), HTTP_X_REQUEST_ID="foo")
+    request_record, response_record = caplog.records
+    request = RequestLogRecord.make(request_record, None)
+    response = ResponseLogRecord.make(response_record, None)
+    assert request.request_id == response.request_id == "foo"
+    assert response.duration_ms >= 0
+
+
+def test_combined_mode_logs_one_record(client, caplog, mocker):
+    """
+    In combined mode, a single record is logged per exchange.
+    """
+    mocker.patch("ddrr.middleware.options.combined", True)
+    client.get(reverse("index"))
+    (record,) = caplog.records
+    assert isinstance(record.msg, HttpResponse)
+    assert isinstance(record.ddrr_request, RequestSnapshot)
+
+
+def test_combined_mode_logs_body_consumed_by_view(client, caplog, mocker):
+    """
+    In combined mode, the request is logged with its body even when the
+    view has consumed it, like by reading an upload.
+    """
+    mocker.patch("ddrr.middleware.options.combined", True)
+    response = client.post(
+        reverse("upload"),
+        {"file": SimpleUploadedFile("foo.txt", b"foobar", "text/plain")},
+    )
+    assert response.content == b"{'file': 6}"
+    (record,) = caplog.records
+    output = CombinedFormatter(
+        DjangoTemplateRequestFormatter(
+            template_name="ddrr/default-request.html", colors=False
+        ),
+        DjangoTemplateResponseFormatter(
+            template_name="ddrr/default-response.html", colors=False
+        ),
+    ).format(record)
+    assert "<template failed to render>" not in output
+    assert 'filename="foo.txt"' in output
+    data = json.loads(
+        JsonLinesCombinedFormatter(
+            JsonLinesRequestFormatter(), JsonLinesResponseFormatter()
+        ).format(record)
+    )
+    assert 'filename="foo.txt"' in data["request"]["body"]
+    assert data["response"]["status_code"] == 200
+
+
+def test_combined_formatter(rf):
+    """
+    CombinedFormatter formats both the request and the response.
+    """
+    record = logging.makeLogRecord(
+        {"msg": HttpResponse("bar"), "ddrr_request": rf.get("/foo")}
+    )
+    formatter = CombinedFormatter(
+        DjangoTemplateRequestFormatter(
+            template="{{ ddrr.path }}", colors=False
+        ),
+        DjangoTemplateResponseFormatter(
+            template="{{ ddrr.content }}", colors=False
+        ),
+    )
+    assert formatter.format(record) == "/foo\nbar"
+
+
+def test_json_lines_combined_formatter(rf):
+    """
+    JsonLinesCombinedFormatter formats the request and the response as one
+    JSON object.
+    """
+    record = logging.makeLogRecord(
+        {"msg": HttpResponse("bar"), "ddrr_request": rf.get("/foo")}
+    )
+    formatter = JsonLinesCombinedFormatter(
+        JsonLinesRequestFormatter(fields=["path"]),
+        JsonLinesResponseFormatter(fields=["content"]),
+    )
+    assert json.loads(formatter.format(record)) == {
+        "request": {"path": "/foo"},
+        "response": {"content": "bar"},
+    }
@@ -1,5 +1,9 @@
+from django.http import HttpRequest
 from django.http import HttpResponse
+from django.urls import reverse
 
+from ddrr.filters import FilterSet
+from ddrr.filters import PathMatcher
 from ddrr.filters import StatusCodeFilter
 
 
@@ -32,3 +36,96 @@ def test_response_status_code_does_not_filter_unknown(mocker):
     response = mocker.Mock()
     record = mocker.Mock(msg=response)
     assert status_code_filter.filter(record)
+
+
+def test_status_code_filter_matches_status_code_filter_set():
+    """
+    StatusCodeFilter keeps the codes it was given, for backwards
+    compatibility, but looks them up in a set.
+    """
+    status_code_filter = StatusCodeFilter(status_codes="401,404")
+    assert status_code_filter.status_codes == [401, 404]
+    assert status_code_filter._status_codes == {401, 404}
+
+
+def test_path_matcher_merges_regexes_and_prefixes():
+    """
+    Literal patterns are matched as prefixes, and the others with a single
+    regular expression.
+    """
+    matcher = PathMatcher(
+        [f"/static/{i}/" for i in range(50)] + [r"/api/v\d+/", r"/admin$"]
+    )
+    assert len(matcher.prefixes) == 50
+    assert matcher.regex.pattern == r"(?:/api/v\d+/)|(?:/admin$)"
+    assert matcher.match("/static/49/foo.css")
+    assert matcher.match("/api/v1/users")
+    assert matcher.match("/admin")
+    assert not matcher.match("/admin/")
+    assert not matcher.match("/static/50/foo.css")
+    assert not PathMatcher([])
+
+
+def test_path_matcher_keeps_whole_expression_patterns_separate():
+    """
+    Patterns with inline global flags or backreferences mean the same as
+    they would on their own, and aren't merged with the others.
+    """
+    matcher = PathMatcher(
+        [r"(/v\d+)/", "(?i)/admin/", r"/(\w+)/\1/", r"/(?P<a>\d+)/(?P=a)$"]
+    )
+    assert matcher.regex.pattern == r"(?:(/v\d+)/)"
+    assert len(matcher.regexes) == 3
+    assert matcher.match("/ADMIN/")
+    assert matcher.match("/foo/foo/")
+    assert matcher.match("/1/1")
+    assert not matcher.match("/1/2")
+    assert not PathMatcher(["/foo/", "(?i)/bar/"]).match("/BAZ/")
+    assert PathMatcher(["(?i)/bar/"])
+
+
+def test_filter_set_include_and_exclude_rules(rf):
+    """
+    Requests must match the include rules, if any, and no exclude rule.
+    """
+    filters = FilterSet(
+        include_paths=["/api/"],
+        exclude_paths=[r"/api/health$"],
+        include_methods=["get", "post"],
+    )
+    assert filters.keep_request(rf.get("/api/users"))
+    assert filters.keep_request(rf.post("/api/users"))
+    assert not filters.keep_request(rf.get("/api/health"))
+    assert not filters.keep_request(rf.get("/"))
+    assert not filters.keep_request(rf.delete("/api/users"))
+    # without status code rules, every response is kept
+    assert filters.keep_response(HttpResponse(status=500))
+
+
+def test_filter_set_status_codes():
+    filters = FilterSet(exclude_status_codes=["3xx", 404])
+    assert not filters.keep_response(HttpResponse(status=302))
+    assert not filters.keep_response(HttpResponse(status=404))
+    assert filters.keep_response(HttpResponse(status=200))
+    assert filters.keep_response(HttpResponse(status=500))
+
+
+def test_middleware_skips_excluded_requests(client, caplog, mocker):
+    """
+    Neither excluded requests nor their responses are logged.
+    """
+    mocker.patch(
+        "ddrr.middleware.options.filters", FilterSet(exclude_paths=["/"])
+    )
+    client.get(reverse("index"))
+    assert not caplog.records
+
+
+def test_middleware_skips_excluded_responses(client, caplog, mocker):
+    mocker.patch(
+        "ddrr.middleware.options.filters",
+        FilterSet(exclude_status_codes=["2xx"]),
+    )
+    client.get(reverse("index"))
+    assert len(caplog.records) == 1
+    assert isinstance(caplog.records[0].msg, HttpRequest)
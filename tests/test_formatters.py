@@ -1,7 +1,13 @@
+import json
+import logging
+
 import pytest
+from django.http import HttpResponse
 from django.template import TemplateDoesNotExist
 
 from ddrr.formatters import DjangoTemplateRequestFormatter
+from ddrr.formatters import JsonLinesRequestFormatter
+from ddrr.formatters import JsonLinesResponseFormatter
 
 
 def test_django_template_formatter_no_template():
@@ -38,3 +44,75 @@ def test_django_template_lazy_loading():
     with pytest.raises(TemplateDoesNotExist):
         # noinspection PyStatementEffect
         formatter.template
+
+
+def test_django_template_is_compiled_once():
+    """
+    The template in DjangoTemplateRequestFormatter is compiled on first access
+    and reused afterwards.
+    """
+    formatter = DjangoTemplateRequestFormatter(template="{{ foo }}")
+    assert formatter.template is formatter.template
+
+
+def test_django_template_autoreload(mocker):
+    """
+    With autoreload enabled, DjangoTemplateRequestFormatter recompiles its
+    template only when the template source changes.
+    """
+    get_template = mocker.patch("ddrr.formatters.get_template")
+    get_template.return_value.template.source = "{{ foo }}"
+    formatter = DjangoTemplateRequestFormatter(
+        template_name="template_name.html", autoreload=True
+    )
+    first = formatter.template
+    assert formatter.template is first
+    get_template.return_value.template.source = "{{ bar }}"
+    assert formatter.template is not first
+    assert get_template.call_count == 3
+
+
+def test_django_template_no_autoreload(mocker):
+    """
+    Without autoreload, DjangoTemplateRequestFormatter looks up its template
+    only once.
+    """
+    get_template = mocker.patch("ddrr.formatters.get_template")
+    get_template.return_value.template.source = "{{ foo }}"
+    formatter = DjangoTemplateRequestFormatter(
+        template_name="template_name.html"
+    )
+    first = formatter.template
+    get_template.return_value.template.source = "{{ bar }}"
+    assert formatter.template is first
+    assert get_template.call_count == 1
+
+
+def test_json_lines_request_formatter(rf):
+    """
+    JsonLinesRequestFormatter formats requests as single-line JSON objects.
+    """
+    request = rf.post("/foo?bar=1", data="baz", content_type="text/plain")
+    record = logging.makeLogRecord({"msg": request})
+    output = JsonLinesRequestFormatter().format(record)
+    assert "\n" not in output
+    data = json.loads(output)
+    assert data["method"] == "POST"
+    assert data["path"] == "/foo"
+    assert data["query_string"] == "?bar=1"
+    assert data["headers"]["Content-Type"] == "text/plain"
+    assert data["body"] == "baz"
+    assert data["timestamp"] == record.created
+
+
+def test_json_lines_response_formatter_fields():
+    """
+    JsonLinesResponseFormatter only includes the configured fields.
+    """
+    response = HttpResponse('{"foo": "bar"}', status=201)
+    record = logging.makeLogRecord({"msg": response})
+    formatter = JsonLinesResponseFormatter(fields=["status_code", "content"])
+    assert json.loads(formatter.format(record)) == {
+        "status_code": 201,
+        "content": '{"foo": "bar"}',
+    }
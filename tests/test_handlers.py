@@ -0,0 +1,152 @@
+import gzip
+import logging
+import os
+import threading
+import time
+
+import pytest
+
+from ddrr import handlers as handlers_module
+from ddrr.handlers import BufferedFileHandler
+
+
+def make_record(msg):
+    return logging.makeLogRecord({"msg": msg, "levelno": logging.DEBUG})
+
+
+@pytest.fixture
+def handlers():
+    created = []
+
+    def make(*args, **kwargs):
+        handler = BufferedFileHandler(*args, **kwargs)
+        created.append(handler)
+        return handler
+
+    yield make
+    for handler in created:
+        handler.close()
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_records_are_buffered_until_full(tmp_path, handlers, mocker):
+    """
+    Records are written in a single writev call once the buffer is full.
+    """
+    writev = mocker.spy(os, "writev")
+    path = tmp_path / "ddrr.log"
+    handler = handlers(path, buffer_size=20, flush_interval=None)
+    handler.handle(make_record("foo"))
+    handler.handle(make_record("bar"))
+    assert not path.exists()
+    for msg in ("baz", "qux", "quux"):
+        handler.handle(make_record(msg))
+    assert read(path) == "foo\nbar\nbaz\nqux\nquux\n"
+    assert writev.call_count == 1
+
+
+def test_records_are_written_on_close(tmp_path, handlers):
+    """
+    Buffered records are written when the handler is closed.
+    """
+    path = tmp_path / "ddrr.log"
+    handler = handlers(path, flush_interval=None)
+    handler.handle(make_record("foo"))
+    handler.close()
+    assert read(path) == "foo\n"
+
+
+def test_records_are_written_periodically(tmp_path, handlers):
+    """
+    Buffered records are written every `flush_interval` seconds.
+    """
+    path = tmp_path / "ddrr.log"
+    handler = handlers(path, flush_interval=0.01)
+    handler.handle(make_record("foo"))
+    deadline = time.monotonic() + 5
+    while not (path.exists() and read(path)):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert read(path) == "foo\n"
+
+
+def test_size_based_rotation(tmp_path, handlers):
+    """
+    The file is rotated before it would grow beyond `max_bytes`, keeping
+    `backup_count` rotated files.
+    """
+    path = tmp_path / "ddrr.log"
+    handler = handlers(
+        path, buffer_size=1, flush_interval=None, max_bytes=8, backup_count=2
+    )
+    for msg in ("foo", "bar", "baz", "qux", "quux"):
+        handler.handle(make_record(msg))
+    assert read(path) == "quux\n"
+    assert read(f"{path}.1") == "baz\nqux\n"
+    assert read(f"{path}.2") == "foo\nbar\n"
+    handler.handle(make_record("corge"))
+    assert read(f"{path}.1") == "quux\n"
+    assert read(f"{path}.2") == "baz\nqux\n"
+    assert not os.path.exists(f"{path}.3")
+
+
+def test_time_based_rotation_with_compression(tmp_path, handlers, mocker):
+    """
+    The file is rotated after `rotate_interval` seconds, and rotated files
+    are gzipped with `compress`, on a background thread.
+    """
+    compress_threads = []
+    original_compress_file = handlers_module.compress_file
+
+    def compress_file(source, target):
+        compress_threads.append(threading.current_thread())
+        original_compress_file(source, target)
+
+    mocker.patch.object(handlers_module, "compress_file", compress_file)
+    clock = mocker.Mock(return_value=1000)
+    path = tmp_path / "ddrr.log"
+    handler = handlers(
+        path,
+        buffer_size=1,
+        flush_interval=None,
+        rotate_interval=60,
+        compress=True,
+        clock=clock,
+    )
+    handler.handle(make_record("foo"))
+    clock.return_value = 1030
+    handler.handle(make_record("bar"))
+    clock.return_value = 1061
+    handler.handle(make_record("baz"))
+    assert read(path) == "baz\n"
+    handler.close()
+    assert compress_threads
+    assert threading.current_thread() not in compress_threads
+    with gzip.open(f"{path}.1.gz", "rt") as f:
+        assert f.read() == "foo\nbar\n"
+    assert not os.path.exists(f"{path}.1")
+
+
+def test_handlers_of_the_same_file_share_it(tmp_path, handlers):
+    """
+    Handlers writing to the same file, like the request and response
+    handlers, buffer and rotate it together.
+    """
+    path = tmp_path / "ddrr.log"
+    options = {"buffer_size": 1, "flush_interval": None, "max_bytes": 12}
+    request_handler = handlers(path, **options)
+    response_handler = handlers(path, **options)
+    for msg in ("foo", "bar", "baz", "qux"):
+        request_handler.handle(make_record(f"> {msg}"))
+        response_handler.handle(make_record(f"< {msg}"))
+    request_handler.close()
+    response_handler.handle(make_record("< quux"))
+    assert read(f"{path}.2") == "> baz\n< baz\n"
+    assert read(f"{path}.1") == "> qux\n< qux\n"
+    assert read(path) == "< quux\n"
+    with pytest.raises(ValueError):
+        handlers(path, max_bytes=24)
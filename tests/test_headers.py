@@ -0,0 +1,64 @@
+from django.http import HttpResponse
+
+from ddrr.headers import SPECIAL_HEADERS
+from ddrr.headers import collect_request_headers
+from ddrr.headers import collect_response_headers
+from ddrr.snapshots import RequestSnapshot
+
+
+def test_special_headers_are_separate():
+    """
+    X-Request-ID and X-Riferimento-Message-ID are two separate headers.
+    """
+    assert SPECIAL_HEADERS["x-request-id"] == "X-Request-ID"
+    assert (
+        SPECIAL_HEADERS["x-riferimento-message-id"]
+        == "X-Riferimento-Message-ID"
+    )
+
+
+def test_collect_request_headers_matches_django(rf):
+    """
+    collect_request_headers returns the same headers in the same order as
+    request.headers, with canonical names for special headers.
+    """
+    request = rf.post(
+        "/",
+        data="{}",
+        content_type="application/json",
+        HTTP_X_REQUEST_ID="abc",
+        HTTP_ACCEPT="*/*",
+        HTTP_WWW_AUTHENTICATE="Basic",
+    )
+    headers = collect_request_headers(request)
+    assert list(headers.values()) == list(request.headers.values())
+    assert list(headers) == [
+        {
+            "X-Request-Id": "X-Request-ID",
+            "Www-Authenticate": "WWW-Authenticate",
+        }.get(header, header)
+        for header in request.headers
+    ]
+
+
+def test_collect_request_headers_from_snapshot(rf):
+    """
+    The headers of a request snapshot are the same as the request's.
+    """
+    request = rf.get("/", HTTP_X_REQUEST_ID="abc")
+    snapshot = RequestSnapshot.capture(request)
+    assert collect_request_headers(snapshot) == collect_request_headers(
+        request
+    )
+
+
+def test_collect_response_headers_keeps_names():
+    """
+    collect_response_headers keeps header names as they were set.
+    """
+    response = HttpResponse()
+    response["x-custom"] = "foo"
+    assert collect_response_headers(response) == {
+        "Content-Type": "text/html; charset=utf-8",
+        "x-custom": "foo",
+    }
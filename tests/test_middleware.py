@@ -1,7 +1,19 @@
+import asyncio
+import logging
+import time
+
+import pytest
 from django.http import HttpRequest
 from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.urls import reverse
 
+from ddrr.filters import StatusCodeFilter
+from ddrr.loggers import request_logger
+from ddrr.loggers import response_logger
+from ddrr.middleware import DebugRequestsResponses
+from ddrr.middleware import options
+
 
 def test_request_and_response_are_logged(client, caplog):
     """
@@ -11,3 +23,145 @@ def test_request_and_response_are_logged(client, caplog):
     assert isinstance(caplog.records[0].msg, HttpRequest)
     assert isinstance(caplog.records[1].msg, HttpResponse)
     assert len(caplog.records) == 2
+
+
+def test_middleware_is_sync_with_sync_get_response():
+    """
+    The middleware is a plain callable when wrapping a sync get_response.
+    """
+    middleware = DebugRequestsResponses(lambda request: HttpResponse())
+    assert not asyncio.iscoroutinefunction(middleware)
+
+
+def test_middleware_is_async_with_async_get_response(rf, caplog):
+    """
+    The middleware is a coroutine function when wrapping an async
+    get_response, and logs requests and responses.
+    """
+
+    async def get_response(request):
+        return HttpResponse("foo")
+
+    middleware = DebugRequestsResponses(get_response)
+    assert asyncio.iscoroutinefunction(middleware)
+    response = asyncio.run(middleware(rf.get("/")))
+    assert response.content == b"foo"
+    assert isinstance(caplog.records[0].msg, HttpRequest)
+    assert caplog.records[1].msg is response
+
+
+def test_only_get_response_is_timed(rf, mocker):
+    """
+    The duration of an exchange doesn't include logging its request, under
+    WSGI or ASGI.
+    """
+
+    async def slow_aemit(logger, msg, extra=None):
+        await asyncio.sleep(0.2)
+
+    async def get_response(request):
+        return HttpResponse()
+
+    mocker.patch("ddrr.middleware._emit", lambda *args: time.sleep(0.2))
+    mocker.patch("ddrr.middleware._aemit", slow_aemit)
+    sync_response = DebugRequestsResponses(lambda request: HttpResponse())(
+        rf.get("/")
+    )
+    async_response = asyncio.run(
+        DebugRequestsResponses(get_response)(rf.get("/"))
+    )
+    assert sync_response.ddrr_exchange.duration_ms < 100
+    assert sync_response.ddrr_exchange.cpu_time_ms < 100
+    assert async_response.ddrr_exchange.duration_ms < 100
+
+
+def test_request_and_response_are_logged_under_asgi(async_client, caplog):
+    """
+    Requests and responses are logged when served by the ASGI handler.
+    """
+    asyncio.run(async_client.get(reverse("async_index")))
+    assert isinstance(caplog.records[0].msg, HttpRequest)
+    assert isinstance(caplog.records[1].msg, HttpResponse)
+    assert len(caplog.records) == 2
+
+
+@pytest.fixture
+def reconfigure():
+    """
+    Restore the DDRR loggers and middleware options after a test.
+    """
+    yield
+    request_logger.disabled = False
+    response_logger.disabled = False
+    response_logger.filters.clear()
+    options.refresh()
+
+
+def test_nothing_is_done_when_loggers_are_disabled(rf, caplog, reconfigure):
+    """
+    The middleware is a pass-through when neither requests nor responses
+    can be logged.
+    """
+    request_logger.disabled = True
+    response_logger.disabled = True
+    options.refresh()
+    request = rf.post("/", data="{}", content_type="application/json")
+    response = DebugRequestsResponses(lambda request: HttpResponse())(request)
+    assert not hasattr(request, "ddrr_exchange")
+    assert not hasattr(response, "ddrr_exchange")
+    assert not caplog.records
+
+
+def test_failure_to_log_streamed_response_is_logged(
+    rf, caplog, mocker, reconfigure
+):
+    """
+    Under ASGI, an error logging a response after its content has been
+    streamed isn't lost.
+    """
+
+    async def get_response(request):
+        return StreamingHttpResponse(iter([b"foo"]))
+
+    async def stream():
+        response = await DebugRequestsResponses(get_response)(rf.get("/"))
+        assert b"".join(response.streaming_content) == b"foo"
+        await asyncio.sleep(0.1)
+
+    request_logger.disabled = True
+    options.refresh()
+    mocker.patch("ddrr.middleware.options.capture_streaming", True)
+    mocker.patch("ddrr.middleware._emit", side_effect=ValueError("Oops"))
+    asyncio.run(stream())
+    (record,) = caplog.records
+    assert record.name == "ddrr.middleware"
+    assert record.getMessage() == "Failed to log streamed response"
+    assert record.exc_info[1].args == ("Oops",)
+
+
+def test_only_enabled_side_is_logged(client, caplog, reconfigure):
+    """
+    Responses are still logged when the request logger is disabled.
+    """
+    request_logger.disabled = True
+    options.refresh()
+    client.get(reverse("index"))
+    assert len(caplog.records) == 1
+    assert isinstance(caplog.records[0].msg, HttpResponse)
+
+
+def test_filtered_responses_are_skipped(client, caplog, mocker, reconfigure):
+    """
+    Responses rejected by the status code filter of the response logger are
+    not logged, and no record is created for them.
+    """
+    response_logger.addFilter(StatusCodeFilter(status_codes="200"))
+    options.refresh()
+    make_record = mocker.spy(logging.Logger, "makeRecord")
+    client.get(reverse("index"))
+    assert all(
+        call.args[0] is not response_logger
+        for call in make_record.call_args_list
+    )
+    assert len(caplog.records) == 1
+    assert isinstance(caplog.records[0].msg, HttpRequest)
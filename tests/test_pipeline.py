@@ -0,0 +1,269 @@
+import logging
+import multiprocessing
+import sys
+import threading
+from unittest.mock import call
+
+from django.http import HttpResponse
+from django.urls import reverse
+
+from ddrr.formatters import DjangoTemplateRequestFormatter
+from ddrr.pipeline import BLOCK
+from ddrr.pipeline import DROP_NEW
+from ddrr.pipeline import DROP_OLDEST
+from ddrr.pipeline import LoggingPipeline
+from ddrr.snapshots import RequestSnapshot
+from ddrr.snapshots import ResponseSnapshot
+
+
+def test_pipeline_logs_queued_messages(mocker):
+    """
+    LoggingPipeline logs queued messages on its background thread.
+    """
+    logger = mocker.Mock()
+    pipeline = LoggingPipeline()
+    pipeline.start()
+    pipeline.put(logger, "foo")
+    pipeline.put(logger, "bar")
+    assert pipeline.flush(timeout=5)
+    pipeline.stop()
+    assert logger.debug.call_args_list == [
+        call("foo", extra=None),
+        call("bar", extra=None),
+    ]
+    assert pipeline.stats()["emitted"] == 2
+
+
+def test_pipeline_drop_new(mocker):
+    """
+    With the drop-new policy, messages are dropped while the queue is full.
+    """
+    logger = mocker.Mock()
+    pipeline = LoggingPipeline(maxsize=2, overflow=DROP_NEW)
+    assert pipeline.put(logger, 1)
+    assert pipeline.put(logger, 2)
+    assert not pipeline.put(logger, 3)
+    pipeline.start()
+    pipeline.flush(timeout=5)
+    pipeline.stop()
+    assert logger.debug.call_args_list == [
+        call(1, extra=None),
+        call(2, extra=None),
+    ]
+    assert pipeline.stats()["dropped_new"] == 1
+
+
+def test_pipeline_drop_oldest(mocker):
+    """
+    With the drop-oldest policy, the oldest messages make way for new ones.
+    """
+    logger = mocker.Mock()
+    pipeline = LoggingPipeline(maxsize=2, overflow=DROP_OLDEST)
+    for i in range(4):
+        assert pipeline.put(logger, i)
+    pipeline.start()
+    pipeline.flush(timeout=5)
+    pipeline.stop()
+    assert logger.debug.call_args_list == [
+        call(2, extra=None),
+        call(3, extra=None),
+    ]
+    assert pipeline.stats()["dropped_oldest"] == 2
+
+
+def test_pipeline_block(mocker):
+    """
+    With the block policy, putting a message waits for space in the queue.
+    """
+    logger = mocker.Mock()
+    pipeline = LoggingPipeline(maxsize=1, overflow=BLOCK)
+    pipeline.put(logger, 1)
+    thread = threading.Thread(target=pipeline.put, args=(logger, 2))
+    thread.start()
+    while not pipeline.stats()["blocked"]:
+        thread.join(0.001)
+    pipeline.start()
+    thread.join(5)
+    pipeline.flush(timeout=5)
+    pipeline.stop()
+    assert logger.debug.call_args_list == [
+        call(1, extra=None),
+        call(2, extra=None),
+    ]
+
+
+def test_pipeline_stop_drains_queue(mocker):
+    """
+    Stopping the pipeline logs everything still in the queue.
+    """
+    logger = mocker.Mock()
+    pipeline = LoggingPipeline()
+    for i in range(10):
+        pipeline.put(logger, i)
+    pipeline.start()
+    pipeline.stop()
+    assert logger.debug.call_count == 10
+    assert not pipeline.running
+
+
+def test_pipeline_stop_drains_full_queue_itself(mocker):
+    """
+    When the queue stays full, stopping the pipeline logs what's left in it
+    on the calling thread.
+    """
+    started = threading.Event()
+    release = threading.Event()
+    threads = []
+
+    def debug(msg, extra):
+        threads.append(threading.current_thread())
+        if msg == "slow":
+            started.set()
+            release.wait(5)
+
+    logger = mocker.Mock()
+    logger.debug.side_effect = debug
+    pipeline = LoggingPipeline(maxsize=3)
+    pipeline.start()
+    pipeline.put(logger, "slow")
+    started.wait(5)
+    for i in range(3):
+        pipeline.put(logger, i)
+    pipeline.stop(timeout=0.1)
+    release.set()
+    assert [c.args[0] for c in logger.debug.call_args_list[1:]] == [0, 1, 2]
+    assert threads[1:] == [threading.current_thread()] * 3
+    assert pipeline.stats()["dropped_at_stop"] == 0
+
+
+def test_pipeline_stop_counts_messages_left_behind(mocker):
+    """
+    Messages still queued when the background thread doesn't stop in time
+    are counted as dropped.
+    """
+    started = threading.Event()
+    release = threading.Event()
+
+    def debug(msg, extra):
+        started.set()
+        release.wait(5)
+
+    logger = mocker.Mock()
+    logger.debug.side_effect = debug
+    pipeline = LoggingPipeline(maxsize=10)
+    pipeline.start()
+    for i in range(3):
+        pipeline.put(logger, i)
+    started.wait(5)
+    pipeline.stop(timeout=0.1)
+    release.set()
+    assert pipeline.stats()["dropped_at_stop"] == 2
+
+
+class FileLogger:
+    def __init__(self, path):
+        self.path = path
+
+    def debug(self, msg, extra):
+        with open(self.path, "a") as f:
+            f.write(f"{msg} {threading.current_thread().name}\n")
+
+
+def log_in_child(pipeline, path):
+    pipeline.put(FileLogger(path), "child")
+    sys.exit(0 if pipeline.flush(timeout=5) else 1)
+
+
+def test_pipeline_restarts_in_forked_processes(tmp_path):
+    """
+    A pipeline started before a fork starts its own thread in the forked
+    process when it logs.
+    """
+    path = tmp_path / "ddrr.log"
+    pipeline = LoggingPipeline()
+    pipeline.start()
+    try:
+        context = multiprocessing.get_context("fork")
+        child = context.Process(target=log_in_child, args=(pipeline, path))
+        child.start()
+        child.join(30)
+        assert child.exitcode == 0
+        pipeline.put(FileLogger(path), "parent")
+        assert pipeline.flush(timeout=5)
+    finally:
+        pipeline.stop()
+    assert sorted(path.read_text().splitlines()) == [
+        "child ddrr-pipeline",
+        "parent ddrr-pipeline",
+    ]
+
+
+def test_request_snapshot_limits_body(rf):
+    """
+    RequestSnapshot keeps at most `max_body` bytes of the request body.
+    """
+    request = rf.post("/foo", data="x" * 100, content_type="text/plain")
+    snapshot = RequestSnapshot.capture(request, max_body=10)
+    assert snapshot.body == b"x" * 10
+    assert snapshot.body_size == 100
+    assert snapshot.path == "/foo"
+
+
+def test_request_snapshot_is_formatted_like_request(rf):
+    """
+    Request snapshots are formatted exactly like the requests they copy.
+    """
+    request = rf.post("/foo?bar=1", data="baz", content_type="text/plain")
+    formatter = DjangoTemplateRequestFormatter(
+        template_name="ddrr/default-request.html", colors=False
+    )
+    expected = formatter.format(logging.makeLogRecord({"msg": request}))
+    snapshot = RequestSnapshot.capture(request)
+    assert formatter.format(logging.makeLogRecord({"msg": snapshot})) == (
+        expected
+    )
+
+
+def test_response_snapshot():
+    """
+    ResponseSnapshot copies status, headers and content of a response.
+    """
+    response = HttpResponse("foobar", status=404)
+    snapshot = ResponseSnapshot.capture(response, max_body=3)
+    assert snapshot.status_code == 404
+    assert snapshot.content == b"foo"
+    assert snapshot.content_size == 6
+    assert dict(snapshot.items()) == dict(response.items())
+
+
+def test_middleware_uses_running_pipeline(client, caplog, mocker):
+    """
+    When the pipeline is running, the middleware logs snapshots through it.
+    """
+    pipeline = LoggingPipeline()
+    mocker.patch("ddrr.middleware.pipeline", pipeline)
+    pipeline.start()
+    client.get(reverse("index"))
+    pipeline.flush(timeout=5)
+    pipeline.stop()
+    assert isinstance(caplog.records[0].msg, RequestSnapshot)
+    assert isinstance(caplog.records[1].msg, ResponseSnapshot)
+    assert len(caplog.records) == 2
+
+
+def test_records_are_timestamped_when_snapshots_are_taken(
+    client, caplog, mocker
+):
+    """
+    Records logged by the background thread have the time their snapshot
+    was taken, not the time the queue got to them.
+    """
+    pipeline = LoggingPipeline()
+    mocker.patch("ddrr.middleware.pipeline", pipeline)
+    mocker.patch("ddrr.snapshots.time").time.return_value = 1234.5
+    pipeline.start()
+    client.get(reverse("index"))
+    pipeline.flush(timeout=5)
+    pipeline.stop()
+    assert [r.created for r in caplog.records] == [1234.5, 1234.5]
+    assert [r.msecs for r in caplog.records] == [500.0, 500.0]
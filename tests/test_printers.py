@@ -0,0 +1,192 @@
+import itertools
+import json
+
+import pytest
+from lxml import etree
+
+from ddrr import printers as printers_module
+from ddrr.printers import DEFAULT_PRINTERS
+from ddrr.printers import PrettyPrinterRegistry
+from ddrr.printers import iter_pretty_json
+from ddrr.printers import iter_pretty_xml
+from ddrr.printers import pretty_print_form
+from ddrr.printers import pretty_print_json
+from ddrr.printers import pretty_print_xml
+
+
+def upper(content):
+    return content.upper()
+
+
+@pytest.mark.parametrize(
+    "content_type,printer",
+    [
+        ("application/json", "json"),
+        ("application/json; charset=utf-8", "json"),
+        ("APPLICATION/JSON", "json"),
+        ("application/vnd.api+json", "json"),
+        ("application/soap+xml", "xml"),
+        ("text/xml", "xml"),
+        ("text/plain", None),
+        ("image/png", None),
+        ("", None),
+    ],
+)
+def test_default_printers(content_type, printer):
+    """
+    The default printers handle JSON and XML, including structured syntax
+    suffixes.
+    """
+    registry = PrettyPrinterRegistry(DEFAULT_PRINTERS)
+    resolved = registry.resolve(content_type)
+    if printer is None:
+        assert resolved is None
+    else:
+        assert resolved.__name__ == f"pretty_print_{printer}"
+
+
+def test_resolution_order():
+    """
+    Exact media types win over suffixes, which win over wildcards.
+    """
+    registry = PrettyPrinterRegistry(
+        {
+            "*/*": "tests.test_printers.upper",
+            "application/*": str.lower,
+            "+json": pretty_print_json,
+            "application/special+json": str.strip,
+        }
+    )
+    assert registry.resolve("application/special+json") is str.strip
+    assert registry.resolve("application/other+json") is pretty_print_json
+    assert registry.resolve("application/octet-stream") is str.lower
+    assert registry.resolve("text/plain").__name__ == "upper"
+
+
+def test_resolution_is_memoised_and_invalidated(mocker):
+    """
+    Resolutions are memoised until printers are registered or unregistered.
+    """
+    registry = PrettyPrinterRegistry(DEFAULT_PRINTERS)
+    resolve = mocker.spy(registry, "_resolve")
+    registry.resolve("application/x-www-form-urlencoded")
+    registry.resolve("application/x-www-form-urlencoded")
+    assert resolve.call_count == 1
+    registry.register("application/x-www-form-urlencoded", pretty_print_form)
+    assert (
+        registry.resolve("application/x-www-form-urlencoded")
+        is pretty_print_form
+    )
+    registry.unregister("application/x-www-form-urlencoded")
+    assert registry.resolve("application/x-www-form-urlencoded") is None
+
+
+def test_resolution_cache_is_bounded(mocker):
+    """
+    The memoised resolutions are bounded in number.
+    """
+    mocker.patch.object(printers_module, "RESOLVE_CACHE_SIZE", 10)
+    registry = PrettyPrinterRegistry(DEFAULT_PRINTERS)
+    for i in range(100):
+        registry.resolve(f"multipart/form-data; boundary={i}")
+    assert len(registry._cache) <= 10
+
+
+def test_configure_resets_to_defaults():
+    """
+    configure applies the printers from settings on top of the defaults,
+    where None removes a default printer.
+    """
+    registry = PrettyPrinterRegistry()
+    registry.configure({"text/plain": upper, "text/xml": None})
+    assert registry.resolve("text/plain") is upper
+    assert registry.resolve("text/xml") is None
+    assert registry.resolve("application/json") is pretty_print_json
+    registry.configure()
+    assert registry.resolve("text/plain") is None
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"foo": [1, 2.5, {"bar": None}], "baz": {}, "qux": []},
+        [[], [[]], {"foo": {"bar": {"baz": True}}}],
+        "foo",
+        -1.5,
+        {},
+    ],
+)
+def test_iter_pretty_json_matches_json_dumps(data):
+    """
+    iter_pretty_json indents like json.dumps.
+    """
+    content = json.dumps(data, separators=(",", ":"))
+    assert "".join(iter_pretty_json(content)) == json.dumps(data, indent=2)
+
+
+@pytest.mark.parametrize(
+    "content",
+    ["", "foo", "{", "[1,]", '{"foo" 1}', "{1: 2}", "[}", "{}}", "1 2"],
+)
+def test_iter_pretty_json_rejects_invalid_json(content):
+    """
+    iter_pretty_json raises ValueError when it reaches invalid JSON.
+    """
+    with pytest.raises(ValueError):
+        list(iter_pretty_json(content))
+
+
+def test_iter_pretty_json_is_lazy():
+    """
+    iter_pretty_json only reads as much of the input as is consumed, so
+    invalid JSON after that isn't noticed.
+    """
+    chunks = iter_pretty_json('[1, 2, 3 "invalid"')
+    assert "".join(itertools.islice(chunks, 4)) == "[\n  1,\n  2"
+
+
+def test_iter_pretty_xml_matches_lxml():
+    """
+    iter_pretty_xml indents like lxml when no element has mixed content.
+    """
+    content = (
+        '<?xml version="1.0"?>\n'
+        '<soap:Envelope xmlns:soap="http://www.w3.org/2003/05/soap-envelope">'
+        "  <soap:Body>\n<m:Price xmlns:m=\"urn:x\" a='&lt;&amp;&quot;'>"
+        "<m:Item>Fo&amp;o</m:Item><m:Empty/><m:Empty></m:Empty>"
+        "</m:Price>\n</soap:Body>\n</soap:Envelope>"
+    )
+    assert "".join(iter_pretty_xml(content)) == etree.tostring(
+        etree.fromstring(
+            content.encode(), etree.XMLParser(remove_blank_text=True)
+        ),
+        encoding=str,
+        pretty_print=True,
+    )
+
+
+@pytest.mark.parametrize("content", ["", "foo", "<p></u>", "<p>", "<a/><b/>"])
+def test_iter_pretty_xml_rejects_invalid_xml(content):
+    """
+    iter_pretty_xml raises ValueError when it reaches invalid XML.
+    """
+    with pytest.raises(ValueError):
+        list(iter_pretty_xml(content))
+
+
+def test_iter_pretty_xml_is_lazy(mocker):
+    """
+    iter_pretty_xml only parses as much of the input as is consumed.
+    """
+    mocker.patch.object(printers_module, "XML_FEED_SIZE", 100)
+    chunks = iter_pretty_xml("<a>" + "<b>foo</b>" * 1000 + "<invalid>")
+    assert next(chunks).startswith("<a>\n  <b>foo</b>\n  <b>foo</b>")
+
+
+def test_pretty_print_xml_without_lxml(mocker):
+    """
+    Without lxml, pretty_print_xml re-indents XML with iter_pretty_xml.
+    """
+    mocker.patch.object(printers_module, "etree", None)
+    assert pretty_print_xml("<a><b>foo</b></a>") == "<a>\n  <b>foo</b>\n</a>\n"
+    assert pretty_print_xml("<a></b>") == "<a></b>"
@@ -0,0 +1,238 @@
+import json
+import logging
+
+import pytest
+from django.http import HttpResponse
+
+from ddrr.capture import CaptureStore
+from ddrr.formatters import JsonLinesRequestFormatter
+from ddrr.formatters import JsonLinesResponseFormatter
+from ddrr.redaction import DEFAULT_HEADERS
+from ddrr.redaction import REPLACEMENT
+from ddrr.redaction import Redactor
+from ddrr.redaction import redactor
+from ddrr.snapshots import RequestSnapshot
+from ddrr.snapshots import ResponseSnapshot
+from ddrr.utils import render_body
+
+
+@pytest.fixture
+def redacting():
+    redactor.configure(
+        headers=DEFAULT_HEADERS + ("X-Api-Key",),
+        json_keys=["password", "*token"],
+        form_fields=["secret"],
+        patterns=[r"\b\d{4}(?:-\d{4}){3}\b"],
+        replacement=REPLACEMENT,
+    )
+    yield redactor
+    redactor.configure(
+        headers=DEFAULT_HEADERS,
+        json_keys=(),
+        form_fields=(),
+        patterns=(),
+        replacement=REPLACEMENT,
+    )
+
+
+def test_json_values_are_redacted_at_any_depth():
+    """
+    Scalar values of matching keys are redacted wherever they are, and the
+    result is still valid JSON.
+    """
+    body = json.dumps(
+        {
+            "user": {"name": "foo", "password": 'bar\\"baz'},
+            "tokens": [{"refresh_token": 123, "Access_Token": None}],
+            "password_hint": "qux",
+        }
+    )
+    redacted = json.loads(
+        Redactor(json_keys=["password", "*token"]).redact(body)
+    )
+    assert redacted == {
+        "user": {"name": "foo", "password": REPLACEMENT},
+        "tokens": [
+            {"refresh_token": REPLACEMENT, "Access_Token": REPLACEMENT}
+        ],
+        "password_hint": "qux",
+    }
+
+
+def test_json_strings_cut_by_shortening_are_redacted():
+    """
+    A string value cut at the end of a shortened body is still redacted.
+    """
+    redacted = Redactor(json_keys=["password"]).redact('{"password": "ba')
+    assert redacted == '{"password": "[REDACTED]"'
+
+
+def test_form_fields_are_redacted():
+    """
+    Only whole form field names are matched.
+    """
+    redacted = Redactor(form_fields=["secret"]).redact(
+        "secret=foo&not_secret=bar&SECRET=baz"
+    )
+    assert redacted == "secret=[REDACTED]&not_secret=bar&SECRET=[REDACTED]"
+
+
+def test_multipart_fields_are_redacted(rf):
+    """
+    Only the values of matching fields of multipart bodies are redacted,
+    even when they span several lines or the body was shortened.
+    """
+    request = rf.post(
+        "/",
+        {"password": "foo\r\n--bar", "not_password": "baz", "Secret": "qux"},
+    )
+    body = request.body.decode()
+    redacted = Redactor(form_fields=["password", "secret"]).redact(body)
+    assert "foo" not in redacted
+    assert "qux" not in redacted
+    assert "baz" in redacted
+    assert redacted.count(REPLACEMENT) == 2
+    assert redacted.endswith("--\r\n")
+    shortened = body[: body.index("foo") + 2]
+    assert (
+        Redactor(form_fields=["password"])
+        .redact(shortened)
+        .endswith("\r\n\r\n" + REPLACEMENT)
+    )
+
+
+def test_patterns_are_redacted_entirely():
+    redacted = Redactor(patterns=[r"sk_live_\w+", r"\d{16}"]).redact(
+        "key sk_live_abc123 card 1234567812345678"
+    )
+    assert redacted == "key [REDACTED] card [REDACTED]"
+
+
+def test_patterns_with_backreferences_are_redacted():
+    """
+    Backreferences refer to the groups of their own pattern.
+    """
+    redactor = Redactor(
+        json_keys=["password"],
+        form_fields=["secret"],
+        patterns=[r"""(['"])sk_\w+\1"""],
+    )
+    assert redactor.redact('key="sk_abc"&secret=foo') == (
+        "key=[REDACTED]&secret=[REDACTED]"
+    )
+
+
+def test_patterns_with_inline_flags_are_redacted():
+    """
+    Inline global flags apply to their own pattern only.
+    """
+    redactor = Redactor(patterns=[r"(?i)bearer \S+", "sk_live_\\w+"])
+    assert redactor.redact("Bearer abc SK_LIVE_foo sk_live_bar") == (
+        "[REDACTED] SK_LIVE_foo [REDACTED]"
+    )
+
+
+def test_patterns_with_named_groups_are_redacted():
+    """
+    Named groups don't clash with those used to redact names.
+    """
+    redactor = Redactor(
+        json_keys=["password"], patterns=[r"(?P<json>tok)_(?P<json_value>\w+)"]
+    )
+    assert redactor.redact('{"password": "foo"} tok_bar') == (
+        '{"password": "[REDACTED]"} [REDACTED]'
+    )
+
+
+def test_nothing_is_redacted_from_bodies_by_default():
+    body = '{"password": "foo"}'
+    assert not Redactor().active
+    assert Redactor().redact(body) is body
+
+
+def test_redact_bytes_keeps_invalid_utf8():
+    raw = b'\xff{"password": "foo"}'
+    redacted = Redactor(json_keys=["password"]).redact_bytes(raw)
+    assert redacted == b'\xff{"password": "[REDACTED]"}'
+
+
+def test_empty_headers_are_kept():
+    headers = {"Authorization": "", "Accept": "*/*"}
+    assert Redactor().redact_headers(headers) is headers
+
+
+def test_rendered_bodies_are_redacted(redacting):
+    """
+    Bodies are redacted whether they are pretty-printed, shortened or both.
+    """
+    raw = json.dumps({"password": "foo" * 100, "card": "1234-5678-1234-5678"})
+    for kwargs in [{}, {"pretty": True}, {"limit": 50}]:
+        for rendered in [
+            render_body(raw.encode(), "application/json", **kwargs),
+            render_body(
+                raw.encode(), "application/json", pretty=True, limit=50
+            ),
+        ]:
+            assert "foo" not in rendered
+            assert "1234" not in rendered
+            assert REPLACEMENT in rendered
+
+
+def test_only_logged_prefix_is_redacted(redacting, mocker):
+    """
+    Only the prefix of shortened bodies which is logged is redacted, whether
+    they are pretty-printed or not.
+    """
+    redact = mocker.spy(redacting, "redact")
+    raw = json.dumps([{"password": "foo"}] * 100000).encode()
+    for pretty in (False, True):
+        rendered = render_body(
+            raw, "application/json", pretty=pretty, limit=100
+        )
+        assert "foo" not in rendered
+        assert REPLACEMENT in rendered
+    assert all(len(call.args[0]) < 10000 for call in redact.mock_calls)
+
+
+def test_logged_requests_are_redacted(rf, redacting):
+    request = rf.post(
+        "/foo?secret=bar&baz=1",
+        data=b'{"password": "qux"}',
+        content_type="application/json",
+        HTTP_AUTHORIZATION="Bearer foo",
+        HTTP_X_API_KEY="bar",
+    )
+    record = logging.makeLogRecord({"msg": request})
+    data = json.loads(JsonLinesRequestFormatter().format(record))
+    assert data["query_string"] == "?secret=[REDACTED]&baz=1"
+    assert data["headers"]["Authorization"] == REPLACEMENT
+    assert data["headers"]["X-Api-Key"] == REPLACEMENT
+    assert json.loads(data["body"]) == {"password": REPLACEMENT}
+
+
+def test_logged_responses_are_redacted(redacting):
+    response = HttpResponse(b'{"access_token": "foo"}')
+    response["Set-Cookie"] = "session=bar"
+    record = logging.makeLogRecord({"msg": response})
+    data = json.loads(JsonLinesResponseFormatter().format(record))
+    assert data["headers"]["Set-Cookie"] == REPLACEMENT
+    assert json.loads(data["content"]) == {"access_token": REPLACEMENT}
+
+
+def test_captured_exchanges_are_redacted(tmp_path, rf, redacting):
+    store = CaptureStore(tmp_path)
+    request = rf.post(
+        "/foo?secret=bar",
+        data=b'{"password": "qux"}',
+        content_type="application/json",
+        HTTP_COOKIE="session=foo",
+    )
+    response = HttpResponse(b"card 1234-5678-1234-5678")
+    store.append(
+        RequestSnapshot.capture(request), ResponseSnapshot.capture(response)
+    )
+    exchange = store.load(store.query()[0])
+    assert exchange["request"]["query_string"] == "secret=[REDACTED]"
+    assert dict(exchange["request"]["headers"])["Cookie"] == REPLACEMENT
+    assert exchange["request"]["body"] == b'{"password": "[REDACTED]"}'
+    assert exchange["response"]["body"] == b"card [REDACTED]"
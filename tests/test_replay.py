@@ -0,0 +1,174 @@
+import json
+
+import pytest
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.urls import reverse
+
+from ddrr.capture import CaptureStore
+from ddrr.management.commands.ddrr_replay import Command
+from ddrr.replay import InProcessClient
+from ddrr.replay import ReplayRequest
+from ddrr.replay import load_capture
+from ddrr.replay import load_jsonl
+from ddrr.replay import replay
+from ddrr.replay import summarize
+from ddrr.snapshots import RequestSnapshot
+from ddrr.snapshots import ResponseSnapshot
+
+
+@pytest.fixture
+def jsonl(tmp_path):
+    path = tmp_path / "exchanges.jsonl"
+    lines = [
+        {
+            "request": {
+                "method": "POST",
+                "path": reverse("echo"),
+                "query_string": "?foo=bar",
+                "headers": {"Content-Type": "text/plain", "X-Foo": "foo"},
+                "body": "hello",
+            },
+            "response": {"status_code": 200, "content": "hello"},
+        },
+        {
+            "request": {"method": "GET", "path": reverse("index")},
+            "response": {"status_code": 200, "content": "Goodbye!"},
+        },
+        {"method": "GET", "path": reverse("stream")},
+    ]
+    path.write_text("\n".join(json.dumps(line) for line in lines))
+    return path
+
+
+def test_load_jsonl(jsonl):
+    """
+    JSON lines files of combined exchanges or bare requests are loaded.
+    """
+    echo, index, stream = load_jsonl(jsonl)
+    assert echo.url_path == "/echo?foo=bar"
+    assert echo.content_type == "text/plain"
+    assert echo.replayed_headers == [("X-Foo", "foo")]
+    assert echo.body == b"hello"
+    assert echo.expected_body == b"hello"
+    assert index.expected_status == 200
+    assert stream.expected_status is None
+
+
+def test_load_capture(tmp_path, rf):
+    """
+    Exchanges in a capture store are loaded oldest first, and truncated
+    bodies aren't compared.
+    """
+    store = CaptureStore(tmp_path)
+    for path, content, max_body in (("/a", b"foo", None), ("/b", b"bar", 1)):
+        request = rf.post(path, data=b"x", content_type="text/plain")
+        response = HttpResponse(content)
+        store.append(
+            RequestSnapshot.capture(request),
+            ResponseSnapshot.capture(response, max_body),
+        )
+    store.close()
+    a, b = load_capture(tmp_path)
+    assert (a.method, a.path, a.body, a.content_type) == (
+        "POST",
+        "/a",
+        b"x",
+        "text/plain",
+    )
+    assert a.expected_body == b"foo"
+    assert b.expected_body is None
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_replay_in_process(jsonl, concurrency):
+    """
+    Requests are replayed in-process and their responses compared with the
+    captured ones.
+    """
+    requests = load_jsonl(jsonl)
+    results, elapsed = replay(
+        requests * 3, InProcessClient(), concurrency=concurrency
+    )
+    assert [result.request for result in results] == requests * 3
+    echo, index, stream = results[:3]
+    assert echo.body == b"hello"
+    assert not echo.mismatch
+    assert index.mismatch
+    assert stream.body == b"Hello, World"
+    summary = summarize(results, elapsed)
+    assert summary["*"]["requests"] == 9
+    assert summary["*"]["mismatches"] == 3
+    assert summary["/echo"]["requests"] == 3
+    assert summary["/echo"]["errors"] == 0
+    assert summary["*"]["client_errors"] == summary["*"]["server_errors"] == 0
+    assert summary["/echo"]["max_ms"] >= summary["/echo"]["p50_ms"] > 0
+
+
+def test_replay_sends_captured_host(settings):
+    """
+    Requests are replayed in-process with their captured Host header, or
+    the one given to the client, and error responses are counted apart from
+    failed requests.
+    """
+    # CommonMiddleware validates the Host header
+    settings.MIDDLEWARE = [
+        *settings.MIDDLEWARE,
+        "django.middleware.common.CommonMiddleware",
+    ]
+    settings.ALLOWED_HOSTS = ["example.com"]
+    request = ReplayRequest("GET", "/", headers=(("Host", "example.com"),))
+    results, elapsed = replay([request], InProcessClient())
+    assert results[0].status_code == 200
+    results, elapsed = replay([request], InProcessClient(host="example.org"))
+    assert results[0].status_code == 400
+    summary = summarize(results, elapsed)["*"]
+    assert (summary["errors"], summary["client_errors"]) == (0, 1)
+
+
+def test_replay_records_errors():
+    """
+    Requests which fail are recorded as errors.
+    """
+
+    class FailingClient:
+        def send(self, request):
+            raise OSError("refused")
+
+    (result,), _ = replay([ReplayRequest("GET", "/")], FailingClient())
+    assert result.error == "OSError('refused')"
+    assert not result.mismatch
+
+
+@pytest.mark.parametrize(
+    "options, paths",
+    [
+        ({"status": "2xx"}, ["/echo", "/"]),
+        ({"limit": 2}, ["/", "/stream"]),
+        ({"status": 200, "limit": 1}, ["/"]),
+        ({"limit": 10}, ["/echo", "/", "/stream"]),
+        ({"method": "post", "limit": 0}, []),
+    ],
+)
+def test_ddrr_replay_command_filters_jsonl(jsonl, options, paths):
+    """
+    The --path, --method, --status and --limit options apply to JSON lines
+    files like they do to capture stores.
+    """
+    defaults = {"source": str(jsonl), "path": None, "method": None}
+    defaults.update({"status": None, "limit": None})
+    requests = Command().load({**defaults, **options})
+    assert [request.path for request in requests] == paths
+
+
+def test_ddrr_replay_command(jsonl, capsys):
+    """
+    The ddrr_replay command reports each path and shows differences.
+    """
+    call_command("ddrr_replay", str(jsonl), repeat=2, diff=True)
+    output = capsys.readouterr().out
+    assert "/echo" in output
+    assert "/stream" in output
+    assert "GET /: 200 -> 200" in output
+    assert "-Goodbye!" in output
+    assert "+Welcome!" in output
@@ -0,0 +1,194 @@
+import pytest
+from django.http import HttpRequest
+from django.http import HttpResponse
+from django.test import Client
+from django.urls import reverse
+
+from ddrr.exchange import Exchange
+from ddrr.sampling import Sampler
+from ddrr.sampling import TokenBucket
+from ddrr.sampling import Triggers
+from ddrr.snapshots import RequestSnapshot
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_limits_rate():
+    """
+    TokenBucket allows bursts up to its capacity, then refills over time.
+    """
+    clock = FakeClock()
+    bucket = TokenBucket(2, clock=clock)
+    assert bucket.consume()
+    assert bucket.consume()
+    assert not bucket.consume()
+    clock.now += 0.5
+    assert bucket.consume()
+    assert not bucket.consume()
+
+
+def test_sampler_rate_zero_drops_everything(rf):
+    """
+    Sampler with a rate of 0 drops every request.
+    """
+    sampler = Sampler(rate=0)
+    assert not any(sampler.sample_request(rf.get("/")) for _ in range(10))
+    assert sampler.stats()["dropped_rate"] == 10
+
+
+def test_sampler_by_request_id_is_deterministic(rf):
+    """
+    Sampler makes the same decision for every request with the same ID.
+    """
+    sampler = Sampler(rate=0.5, by_request_id=True)
+    for request_id in ("foo", "bar", "baz", "qux"):
+        decisions = {
+            sampler.sample_request(rf.get("/", HTTP_X_REQUEST_ID=request_id))
+            for _ in range(10)
+        }
+        assert len(decisions) == 1
+
+
+def test_sampler_path_rate_limits(rf):
+    """
+    Sampler rate limits requests by their longest matching path prefix.
+    """
+    sampler = Sampler(path_rate_limits={"/api/": 1000, "/api/health": 1})
+    assert sampler.sample_request(rf.get("/api/health"))
+    assert not sampler.sample_request(rf.get("/api/health"))
+    assert sampler.sample_request(rf.get("/api/users"))
+    assert sampler.sample_request(rf.get("/other"))
+    assert sampler.stats() == {
+        "sampled": 3,
+        "dropped_rate": 0,
+        "dropped_path_limit": 1,
+        "dropped_status_limit": 0,
+    }
+
+
+def test_sampler_status_rate_limits():
+    """
+    Sampler rate limits responses by status class and status code.
+    """
+    sampler = Sampler(status_rate_limits={"2xx": 1, 404: 1, "5xx": None})
+    assert sampler.sample_response(HttpResponse(status=200))
+    assert not sampler.sample_response(HttpResponse(status=201))
+    assert sampler.sample_response(HttpResponse(status=404))
+    assert not sampler.sample_response(HttpResponse(status=404))
+    assert sampler.sample_response(HttpResponse(status=400))
+    assert sampler.sample_response(HttpResponse(status=500))
+    assert sampler.sample_response(HttpResponse(status=500))
+
+
+def test_sampler_status_rate_limits_ignore_case():
+    """
+    Status classes are matched case-insensitively.
+    """
+    sampler = Sampler(status_rate_limits={"5XX": 1})
+    assert sampler.sample_response(HttpResponse(status=503))
+    assert not sampler.sample_response(HttpResponse(status=500))
+
+
+def test_middleware_skips_unsampled_requests(client, caplog, mocker):
+    """
+    Neither unsampled requests nor their responses are logged.
+    """
+    mocker.patch("ddrr.middleware.sampler", Sampler(rate=0))
+    client.get(reverse("index"))
+    assert not caplog.records
+
+
+def test_middleware_skips_rate_limited_responses(client, caplog, mocker):
+    """
+    Requests are logged even if their responses are rate limited.
+    """
+    sampler = Sampler(status_rate_limits={"2xx": 1})
+    mocker.patch("ddrr.middleware.sampler", sampler)
+    client.get(reverse("index"))
+    client.get(reverse("index"))
+    assert len(caplog.records) == 3
+
+
+@pytest.mark.parametrize(
+    "triggers, duration, status, exception, expected",
+    [
+        (Triggers(duration_ms=100), 0.1, 200, None, True),
+        (Triggers(duration_ms=100), 0.099, 200, None, False),
+        (Triggers(status_codes=["5xx", 404]), 0, 503, None, True),
+        (Triggers(status_codes=["5xx", 404]), 0, 404, None, True),
+        (Triggers(status_codes=["5xx", 404]), 0, 400, None, False),
+        (Triggers(exceptions=True), 0, 200, ValueError(), True),
+        (Triggers(exceptions=True), 0, 200, None, False),
+    ],
+)
+def test_triggers(triggers, duration, status, exception, expected):
+    exchange = Exchange(request_id="foo", duration=duration)
+    exchange.exception = exception
+    response = HttpResponse(status=status)
+    assert triggers.fire(exchange, response) is expected
+
+
+def test_middleware_holds_untriggered_exchanges(client, caplog, mocker):
+    """
+    With triggers, exchanges which don't trigger aren't logged at all.
+    """
+    mocker.patch(
+        "ddrr.middleware.options.triggers", Triggers(status_codes=["5xx"])
+    )
+    response = client.post(
+        reverse("index"), data=b"x" * 100000, content_type="text/plain"
+    )
+    assert not caplog.records
+    assert response.ddrr_exchange.triggered is False
+    # the body the view didn't read wasn't read either
+    assert response.wsgi_request.ddrr_body.size == 0
+
+
+def test_middleware_logs_triggered_exchanges(caplog, mocker):
+    """
+    Exchanges which trigger are logged in full, the request from the
+    snapshot held while the view ran.
+    """
+    mocker.patch(
+        "ddrr.middleware.options.triggers",
+        Triggers(duration_ms=0, exceptions=True),
+    )
+    client = Client(raise_request_exception=False)
+    client.post(reverse("error"), data=b"foo", content_type="text/plain")
+    request_record, response_record = [
+        record for record in caplog.records if record.name.startswith("ddrr")
+    ]
+    assert isinstance(request_record.msg, RequestSnapshot)
+    assert request_record.msg.body == b"foo"
+    assert response_record.msg.status_code == 500
+    exchange = response_record.msg.ddrr_exchange
+    assert exchange.triggered is True
+    assert isinstance(exchange.exception.exception, ValueError)
+
+
+def test_middleware_logs_unread_body_of_triggered_exchanges(caplog, mocker):
+    """
+    The body of a triggered exchange is logged even if the view didn't read
+    it, but no more of it is kept than is logged.
+    """
+    mocker.patch("ddrr.middleware.options.triggers", Triggers(duration_ms=0))
+    mocker.patch("ddrr.middleware.options.capture_body_bytes", 8)
+    client = Client(raise_request_exception=False)
+    client.post(
+        reverse("index"), data=b"x" * 100000, content_type="text/plain"
+    )
+    request = caplog.records[0].msg
+    assert request.body == b"x" * 8
+    assert request.body_size == 100000
+    assert request.ddrr_body.content == b"x" * 8
+
+
+def test_middleware_logs_requests_up_front_without_triggers(client, caplog):
+    client.get(reverse("index"))
+    assert isinstance(caplog.records[0].msg, HttpRequest)
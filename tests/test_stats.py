@@ -0,0 +1,93 @@
+import io
+import json
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from ddrr import stats
+
+
+@pytest.fixture
+def instrumented():
+    stats.reset()
+    stats.enable()
+    yield
+    stats.enable(False)
+    stats.reset()
+
+
+def test_timed_is_noop_when_disabled():
+    """
+    Nothing is recorded while instrumentation is disabled.
+    """
+    stats.reset()
+    with stats.timed("emit"):
+        pass
+    assert stats.snapshot() == {}
+
+
+def test_timed_records_durations(instrumented):
+    """
+    Durations are recorded per stage while instrumentation is enabled.
+    """
+    for _ in range(3):
+        with stats.timed("emit"):
+            pass
+    snapshot = stats.snapshot()
+    assert snapshot["emit"]["count"] == 3
+    assert snapshot["emit"]["max_us"] >= snapshot["emit"]["p50_us"] >= 0
+
+
+def test_middleware_is_instrumented(client, instrumented):
+    """
+    Logging a request and response records every stage involved.
+    """
+    client.post(reverse("index"), data="{}", content_type="application/json")
+    snapshot = stats.snapshot()
+    assert snapshot["emit"]["count"] == 2
+    for stage in ("record", "headers", "decode", "render"):
+        assert snapshot[stage]["count"] >= 1
+
+
+def test_ddrr_stats_command(capsys):
+    """
+    The ddrr_stats command reports every stage.
+    """
+    call_command("ddrr_stats", "/", requests=2, benchmark=True)
+    output = capsys.readouterr().out
+    for stage in ("record", "headers", "decode", "render", "emit"):
+        assert stage in output
+    assert not stats.is_enabled()
+
+
+def test_stats_view(client, settings, instrumented):
+    """
+    The stats view reports the stats of the running process, only to
+    internal IPs and staff users.
+    """
+    client.get(reverse("index"))
+    assert client.get(reverse("ddrr-stats")).status_code == 404
+    settings.INTERNAL_IPS = ["127.0.0.1"]
+    snapshot = client.get(reverse("ddrr-stats")).json()
+    assert snapshot["emit"]["count"] >= 2
+
+
+def test_ddrr_stats_command_fetches_stats_view(
+    client, settings, instrumented, capsys, mocker
+):
+    """
+    The ddrr_stats command reports the stats of a running server, without
+    sending it any other request.
+    """
+    settings.INTERNAL_IPS = ["127.0.0.1"]
+    client.get(reverse("index"))
+    content = client.get(reverse("ddrr-stats")).content
+    urlopen = mocker.patch(
+        "urllib.request.urlopen", return_value=io.BytesIO(content)
+    )
+    call_command("ddrr_stats", url="http://localhost:8000/ddrr/stats")
+    urlopen.assert_called_once()
+    output = capsys.readouterr().out
+    assert "emit" in output
+    assert json.loads(content)["emit"]["count"] >= 2
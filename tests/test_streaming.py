@@ -0,0 +1,92 @@
+import io
+import logging
+
+from django.http import FileResponse
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+
+from ddrr.formatters import DjangoTemplateResponseFormatter
+from ddrr.streaming import StreamCapture
+from ddrr.streaming import capture_streaming_content
+
+
+def test_stream_capture_closes_once(mocker):
+    """
+    StreamCapture calls `on_close` once, whether it is exhausted, closed or
+    both.
+    """
+    on_close = mocker.Mock()
+    capture = StreamCapture([b"foo"], on_close=on_close)
+    assert list(capture) == [b"foo"]
+    capture.close()
+    on_close.assert_called_once_with(capture)
+
+
+def test_stream_capture_closed_early(mocker):
+    """
+    StreamCapture calls `on_close` when closed before being exhausted.
+    """
+    on_close = mocker.Mock()
+    capture = StreamCapture([b"foo", b"bar"], on_close=on_close)
+    next(capture)
+    capture.close()
+    on_close.assert_called_once_with(capture)
+    assert capture.content == b"foo"
+    assert capture.chunks == 1
+
+
+def test_capture_streaming_content_passes_content_through():
+    """
+    The content of a captured response is streamed unchanged.
+    """
+    response = StreamingHttpResponse(iter([b"foo", b"bar"]))
+    capture = capture_streaming_content(response, 4, None)
+    assert b"".join(response.streaming_content) == b"foobar"
+    assert capture.content == b"foob"
+    assert capture.size == 6
+
+
+def test_capture_streaming_content_of_file_response(mocker):
+    """
+    FileResponse content is captured, and `on_close` is called when the
+    response is closed.
+    """
+    on_close = mocker.Mock()
+    response = FileResponse(io.BytesIO(b"x" * 10))
+    response.block_size = 4
+    capture = capture_streaming_content(response, 100, on_close)
+    assert response.file_to_stream is None
+    assert b"".join(response.streaming_content) == b"x" * 10
+    assert capture.chunks == 3
+    response.close()
+    on_close.assert_called_once_with(capture)
+
+
+def test_streamed_response_is_formatted():
+    """
+    The captured content of a streaming response is formatted.
+    """
+    response = StreamingHttpResponse(iter([b"foo", b"bar"]))
+    capture_streaming_content(response, 4, None)
+    b"".join(response.streaming_content)
+    formatter = DjangoTemplateResponseFormatter(
+        template_name="ddrr/default-response.html", colors=False
+    )
+    output = formatter.format(logging.makeLogRecord({"msg": response}))
+    assert "\nfoob\n<streamed 6 bytes in 2 chunks>" in output
+
+
+def test_middleware_logs_streaming_response_when_consumed(
+    client, caplog, mocker
+):
+    """
+    With CAPTURE_STREAMING, streaming responses are logged after their
+    content has been streamed.
+    """
+    mocker.patch("ddrr.middleware.options.capture_streaming", True)
+    response = client.get(reverse("stream"))
+    assert len(caplog.records) == 1
+    assert b"".join(response.streaming_content) == b"Hello, World"
+    assert len(caplog.records) == 2
+    assert caplog.records[1].msg is response
+    assert response.ddrr_stream.content == b"Hello, World"
@@ -0,0 +1,141 @@
+import asyncio
+import io
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.urls import reverse
+
+from ddrr.formatters import DjangoTemplateRequestFormatter
+from ddrr.middleware import DebugRequestsResponses
+from ddrr.snapshots import RequestSnapshot
+from ddrr.uploads import MultipartSummary
+from ddrr.uploads import RequestBodyCapture
+
+
+@pytest.fixture
+def capture_request_stream(mocker):
+    mocker.patch("ddrr.middleware.options.capture_request_stream", True)
+    mocker.patch("ddrr.middleware.options.capture_body_bytes", 8)
+
+
+def test_multipart_summary_is_independent_of_chunking():
+    """
+    MultipartSummary gives the same summary however the body is split.
+    """
+    body = (
+        b"preamble\r\n--xyz\r\n"
+        b'Content-Disposition: form-data; name="title"\r\n\r\n'
+        b"hello\r\n--xyz\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="a.bin"\r\n'
+        b"Content-Type: application/octet-stream\r\n\r\n"
+        + b"\r\n--xy" * 100
+        + b"\r\n--xyz--\r\n"
+    )
+    whole = MultipartSummary(b"xyz")
+    whole.feed(body)
+    bytewise = MultipartSummary(b"xyz")
+    for byte in body:
+        bytewise.feed(bytes([byte]))
+    assert str(whole) == str(bytewise)
+    assert [(p.name, p.filename, p.size) for p in whole.parts] == [
+        ("title", None, 5),
+        ("file", "a.bin", 600),
+    ]
+
+
+def test_request_body_capture_passes_lines_through():
+    """
+    RequestBodyCapture captures bytes read with readline.
+    """
+    capture = RequestBodyCapture(io.BytesIO(b"foo\nbar\n"), limit=100)
+    assert list(iter(capture.readline, b"")) == [b"foo\n", b"bar\n"]
+    assert capture.content == b"foo\nbar\n"
+
+
+def test_uploads_are_summarised(client, caplog, capture_request_stream):
+    """
+    Multipart uploads are logged as a summary of their parts, after the view
+    has read them.
+    """
+    content = b"x" * 100000
+    response = client.post(
+        reverse("upload"),
+        {
+            "title": "foo",
+            "file": SimpleUploadedFile("big.bin", content, "image/png"),
+        },
+    )
+    assert response.content == b"{'file': 100000}"
+    request = caplog.records[0].msg
+    assert request.ddrr_body.size > len(content)
+    assert request.ddrr_body.content == b""
+    output = DjangoTemplateRequestFormatter(
+        template_name="ddrr/default-request.html", colors=False
+    ).format(caplog.records[0])
+    assert "<multipart: 2 parts>" in output
+    assert 'name="title" size=3' in output
+    assert (
+        'name="file" filename="big.bin" content_type=image/png size=100000'
+        in output
+    )
+
+
+def test_request_body_is_captured_as_read(
+    client, caplog, capture_request_stream
+):
+    """
+    Only the first bytes of the body read by the view are kept.
+    """
+    response = client.post(
+        reverse("echo"), "0123456789abcdef", content_type="text/plain"
+    )
+    assert response.content == b"0123456789abcdef"
+    output = DjangoTemplateRequestFormatter(
+        template_name="ddrr/default-request.html", colors=False
+    ).format(caplog.records[0])
+    assert "01234567\n<read 16 bytes>" in output
+
+
+def test_unread_request_body_is_not_read(rf, caplog, capture_request_stream):
+    """
+    The body of a request isn't read when the view doesn't read it.
+    """
+    request = rf.post("/", "foo", content_type="text/plain")
+    DebugRequestsResponses(lambda request: HttpResponse())(request)
+    assert not hasattr(request, "_body")
+    assert request.ddrr_body.size == 0
+    assert caplog.records[0].msg is request
+
+
+def test_snapshot_uses_captured_body(rf, capture_request_stream):
+    """
+    Snapshots of requests take the captured body instead of reading it.
+    """
+
+    def view(request):
+        request.read(4)
+        return HttpResponse()
+
+    request = rf.post("/", "foobar", content_type="text/plain")
+    DebugRequestsResponses(view)(request)
+    snapshot = RequestSnapshot.capture(request)
+    assert snapshot.body == b"foob"
+    assert snapshot.body_size == 4
+    assert not hasattr(request, "_body")
+
+
+def test_request_body_is_captured_under_asgi(
+    async_client, caplog, capture_request_stream
+):
+    """
+    The body is captured as it is read from the ASGI request body file.
+    """
+    asyncio.run(
+        async_client.post(
+            reverse("echo"), "0123456789abcdef", content_type="text/plain"
+        )
+    )
+    capture = caplog.records[0].msg.ddrr_body
+    assert capture.content == b"01234567"
+    assert capture.size == 16
@@ -1,4 +1,14 @@
+import json
+import textwrap
+
+import pytest
+
+from ddrr import printers as printers_module
+from ddrr import utils
 from ddrr.utils import collect_request_headers
+from ddrr.utils import render_body
+from ddrr.utils import shorten
+from ddrr.utils import shorten_body
 from tests.utils import fake
 
 
@@ -32,3 +42,128 @@ def test_collect_request_headers_drops_empty_content_length(rf):
     request = rf.get("/", CONTENT_LENGTH="")
     headers = collect_request_headers(request)
     assert dict(headers) == {"Cookie": ""}
+
+
+@pytest.mark.parametrize("width", [5, 20, 100, 1000])
+def test_shorten_body_matches_textwrap(width):
+    """
+    shorten_body gives the same result as decoding the entire body and
+    shortening it with textwrap.shorten.
+    """
+    text = fake.text(max_nb_chars=5000) + "  \n\t åäö-ü " * 50
+    raw = text.encode()
+    expected = textwrap.shorten(text, width, placeholder="...")
+    assert shorten_body(raw, width) == expected
+    assert shorten(text, width) == expected
+
+
+def test_shorten_body_decodes_prefix_only(mocker):
+    """
+    shorten_body only decodes a prefix of large bodies.
+    """
+    decode_body = mocker.patch(
+        "ddrr.utils.decode_body", wraps=utils.decode_body
+    )
+    shorten_body(b"foo bar " * 1000000, 100)
+    assert all(len(call.args[0]) < 10000 for call in decode_body.mock_calls)
+
+
+def test_render_body_skips_pretty_printing_large_bodies():
+    """
+    render_body doesn't pretty-print bodies larger than `pretty_max_size`.
+    """
+    raw = b'{"foo": "bar"}'
+    assert render_body(raw, "application/json", pretty=True) != raw.decode()
+    assert (
+        render_body(raw, "application/json", pretty=True, pretty_max_size=5)
+        == raw.decode()
+    )
+
+
+@pytest.mark.parametrize("width", [5, 20, 100, 1000])
+def test_render_body_shortens_pretty_json_incrementally(width, mocker):
+    """
+    render_body gives the same result for pretty-printed and shortened JSON
+    as pretty-printing all of it and shortening that, but only pretty-prints
+    as much as the result needs, regardless of `pretty_max_size`.
+    """
+    data = {"items": [{"id": i, "name": f"Name {i}"} for i in range(1000)]}
+    raw = json.dumps(data).encode()
+    expected = shorten(json.dumps(data, indent=2), width)
+    dumps = mocker.spy(printers_module.json, "dumps")
+    assert (
+        render_body(
+            raw,
+            "application/json",
+            pretty=True,
+            limit=width,
+            pretty_max_size=10,
+        )
+        == expected
+    )
+    assert dumps.call_count == 0
+
+
+@pytest.mark.parametrize("content_type", ["application/json", "text/xml"])
+def test_render_body_decodes_prefix_only_for_pretty_bodies(
+    content_type, mocker
+):
+    """
+    render_body only decodes a prefix of large bodies when pretty-printing
+    and shortening them, even when they are invalid.
+    """
+    decode_body = mocker.patch(
+        "ddrr.utils.decode_body", wraps=utils.decode_body
+    )
+    if content_type == "application/json":
+        bodies = [
+            b"[" + b'"foo", ' * 1000000 + b"]",
+            b"[1 2" + b" 3" * 1000000,
+        ]
+    else:
+        bodies = [
+            b"<a>" + b"<b>foo</b>" * 1000000 + b"</a>",
+            b"<a></b>" * 1000,
+        ]
+    for raw in bodies:
+        assert render_body(raw, content_type, pretty=True, limit=100)
+    assert all(len(call.args[0]) < 10000 for call in decode_body.mock_calls)
+
+
+def test_render_body_decodes_prefix_only_for_mislabelled_bodies(mocker):
+    """
+    render_body only decodes a prefix of a large body which isn't valid
+    from its first byte, like HTML served as JSON.
+    """
+    decode_body = mocker.patch(
+        "ddrr.utils.decode_body", wraps=utils.decode_body
+    )
+    raw = b"<html>" + b"<p>foo bar</p>" * 1000000 + b"</html>"
+    assert render_body(
+        raw, "application/json", pretty=True, limit=100
+    ) == utils.shorten_body(raw, 100)
+    assert all(len(call.args[0]) < 10000 for call in decode_body.mock_calls)
+
+
+def test_render_body_shortens_invalid_pretty_json():
+    """
+    render_body shortens invalid JSON as it is.
+    """
+    raw = b'{"foo": "bar" "baz"}'
+    assert (
+        render_body(raw, "application/json", pretty=True, limit=100)
+        == raw.decode()
+    )
+
+
+def test_render_body_shortens_pretty_xml_incrementally(mocker):
+    """
+    render_body only parses as much XML as the result needs when shortening
+    it.
+    """
+    mocker.patch.object(printers_module, "XML_FEED_SIZE", 100)
+    raw = ("<a>" + "<b>foo</b>" * 10000 + "<invalid>").encode()
+    assert (
+        render_body(raw, "application/xml", pretty=True, limit=30)
+        == "<a> <b>foo</b> <b>foo</b>..."
+    )
@@ -1,5 +1,19 @@
+from django.urls import include
 from django.urls import path
 
+from tests.views import async_index
+from tests.views import echo
+from tests.views import error
 from tests.views import index
+from tests.views import stream
+from tests.views import upload
 
-urlpatterns = [path("", index, name="index")]
+urlpatterns = [
+    path("", index, name="index"),
+    path("async", async_index, name="async_index"),
+    path("stream", stream, name="stream"),
+    path("upload", upload, name="upload"),
+    path("echo", echo, name="echo"),
+    path("error", error, name="error"),
+    path("ddrr/", include("ddrr.urls")),
+]
@@ -1,5 +1,28 @@
 from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 
 
 def index(request):
     return HttpResponse("Welcome!")
+
+
+async def async_index(request):
+    return HttpResponse("Welcome!")
+
+
+def stream(request):
+    return StreamingHttpResponse(iter([b"Hello, ", b"World"]))
+
+
+def upload(request):
+    sizes = {name: f.size for name, f in request.FILES.items()}
+    return HttpResponse(str(sizes))
+
+
+def echo(request):
+    return HttpResponse(request.body)
+
+
+def error(request):
+    items = list(range(1000))
+    raise ValueError(f"Oops, {len(items)} items")